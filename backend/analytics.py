@@ -0,0 +1,190 @@
+"""
+Incremental course analytics: query volume, topics and cited materials.
+
+Analytics are maintained as chat queries are logged, never recomputed from the
+raw query tables. QueryLogWriter hands every batch it writes to
+update_rollups(), which runs in the same transaction:
+
+- each query is assigned to a per-course topic by online k-means over the query
+  embedding chat already computed. The nearest centroid takes the query and
+  moves towards it (MacQueen's update). A query less similar than
+  ANALYTICS_TOPIC_SIMILARITY to every centroid starts a new topic, labelled with
+  its text, until the course has ANALYTICS_MAX_TOPICS topics.
+- daily, per-topic and per-material counters are bumped with one upsert per table.
+
+The analytics endpoint only reads these small tables.
+"""
+
+import os
+from collections import Counter
+
+from psycopg2.extras import execute_values
+
+ANALYTICS_TOPIC_SIMILARITY = float(os.environ.get("ANALYTICS_TOPIC_SIMILARITY", "0.65"))
+ANALYTICS_MAX_TOPICS = int(os.environ.get("ANALYTICS_MAX_TOPICS", "30"))
+
+CREATE_TABLES_SQL = '''
+    CREATE TABLE IF NOT EXISTS course_query_topics (
+        course_id TEXT NOT NULL,
+        topic_id INTEGER NOT NULL,
+        label TEXT NOT NULL,
+        centroid FLOAT8[] NOT NULL,
+        query_count BIGINT NOT NULL DEFAULT 0,
+        last_asked_at TIMESTAMP,
+        PRIMARY KEY (course_id, topic_id)
+    );
+    CREATE TABLE IF NOT EXISTS course_query_daily (
+        course_id TEXT NOT NULL,
+        day DATE NOT NULL,
+        query_count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (course_id, day)
+    );
+    CREATE TABLE IF NOT EXISTS course_material_citations (
+        course_id TEXT NOT NULL,
+        material_id TEXT NOT NULL,
+        citation_count BIGINT NOT NULL DEFAULT 0,
+        last_cited_at TIMESTAMP,
+        PRIMARY KEY (course_id, material_id)
+    );
+'''
+
+def update_rollups(cursor, records):
+    """
+    Fold a batch of logged queries into the analytics tables, on the caller's
+    transaction.
+    """
+    by_course = {}
+    for record in records:
+        if record.get('course_id'):
+            by_course.setdefault(record['course_id'], []).append(record)
+    for course_id, course_records in sorted(by_course.items()):
+        _update_course(cursor, course_id, course_records)
+
+def _update_course(cursor, course_id, records):
+    # Serialise topic assignment per course across workers until this transaction ends
+    cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', ('course_query_topics:' + course_id,))
+
+    daily = Counter(record['created_at'][:10] for record in records)
+    execute_values(cursor, '''
+        INSERT INTO course_query_daily (course_id, day, query_count) VALUES %s
+        ON CONFLICT (course_id, day) DO UPDATE SET query_count = course_query_daily.query_count + EXCLUDED.query_count
+    ''', [(course_id, day, count) for day, count in daily.items()])
+
+    citations = Counter()
+    last_cited = {}
+    for record in records:
+        for material_id in set(record.get('material_ids') or ()):
+            citations[material_id] += 1
+            last_cited[material_id] = max(last_cited.get(material_id, ''), record['created_at'])
+    if citations:
+        execute_values(cursor, '''
+            INSERT INTO course_material_citations (course_id, material_id, citation_count, last_cited_at) VALUES %s
+            ON CONFLICT (course_id, material_id) DO UPDATE SET
+                citation_count = course_material_citations.citation_count + EXCLUDED.citation_count,
+                last_cited_at = GREATEST(course_material_citations.last_cited_at, EXCLUDED.last_cited_at)
+        ''', [(course_id, material_id, count, last_cited[material_id]) for material_id, count in citations.items()])
+
+    embedded = [record for record in records if record.get('query_embedding')]
+    if embedded:
+        _assign_topics(cursor, course_id, embedded)
+
+def _assign_topics(cursor, course_id, records):
+    import numpy as np
+
+    cursor.execute(
+        'SELECT topic_id, label, centroid, query_count, last_asked_at FROM course_query_topics WHERE course_id = %s ORDER BY topic_id',
+        (course_id,)
+    )
+    topics = [
+        {'topic_id': row[0], 'label': row[1], 'centroid': np.asarray(row[2], dtype=np.float64),
+         'query_count': row[3], 'last_asked_at': row[4] and str(row[4]), 'changed': False}
+        for row in cursor.fetchall()
+    ]
+
+    for record in records:
+        vector = np.asarray(record['query_embedding'], dtype=np.float64)
+        vector /= max(np.linalg.norm(vector), 1e-12)
+        best, best_similarity = None, -1.0
+        for topic in topics:
+            if len(topic['centroid']) != len(vector):
+                continue
+            similarity = float(topic['centroid'] @ vector) / max(np.linalg.norm(topic['centroid']), 1e-12)
+            if similarity > best_similarity:
+                best, best_similarity = topic, similarity
+
+        if best is None or (best_similarity < ANALYTICS_TOPIC_SIMILARITY and len(topics) < ANALYTICS_MAX_TOPICS):
+            best = {
+                'topic_id': max((topic['topic_id'] for topic in topics), default=0) + 1,
+                'label': record['query'][:200],
+                'centroid': vector.copy(),
+                'query_count': 0,
+                'last_asked_at': None,
+            }
+            topics.append(best)
+        else:
+            # Move the centroid towards the query by 1 / n of the difference
+            best['centroid'] += (vector - best['centroid']) / (best['query_count'] + 1)
+        best['query_count'] += 1
+        best['last_asked_at'] = max(best['last_asked_at'] or '', record['created_at'])
+        best['changed'] = True
+
+    execute_values(cursor, '''
+        INSERT INTO course_query_topics (course_id, topic_id, label, centroid, query_count, last_asked_at) VALUES %s
+        ON CONFLICT (course_id, topic_id) DO UPDATE SET
+            centroid = EXCLUDED.centroid,
+            query_count = EXCLUDED.query_count,
+            last_asked_at = EXCLUDED.last_asked_at
+    ''', [
+        (course_id, topic['topic_id'], topic['label'], topic['centroid'].tolist(), topic['query_count'], topic['last_asked_at'])
+        for topic in topics if topic['changed']
+    ])
+
+def course_analytics(cursor, course_id, days=30, top=10):
+    """
+    Read the rollups for one course. Expects a RealDictCursor.
+    """
+    cursor.execute(
+        """
+        SELECT day, query_count FROM course_query_daily
+        WHERE course_id = %s AND day > CURRENT_DATE - %s
+        ORDER BY day
+        """,
+        (course_id, days)
+    )
+    daily = cursor.fetchall()
+
+    cursor.execute(
+        """
+        SELECT topic_id, label, query_count, last_asked_at FROM course_query_topics
+        WHERE course_id = %s
+        ORDER BY query_count DESC, topic_id
+        LIMIT %s
+        """,
+        (course_id, top)
+    )
+    topics = cursor.fetchall()
+
+    cursor.execute(
+        """
+        SELECT c.material_id, m.file_name, c.citation_count, c.last_cited_at
+        FROM course_material_citations c
+        LEFT JOIN materials m ON m.id::text = c.material_id
+        WHERE c.course_id = %s
+        ORDER BY c.citation_count DESC, c.material_id
+        LIMIT %s
+        """,
+        (course_id, top)
+    )
+    materials = cursor.fetchall()
+
+    cursor.execute('SELECT COALESCE(SUM(query_count), 0) AS total FROM course_query_daily WHERE course_id = %s', (course_id,))
+    total = cursor.fetchone()['total']
+
+    return {
+        'course_id': course_id,
+        'total_queries': int(total),
+        'days': days,
+        'daily': daily,
+        'topics': topics,
+        'materials': materials,
+    }
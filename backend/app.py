@@ -2,36 +2,72 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 import json
-import numpy as np
-from openai import OpenAI
 import time
 from werkzeug.utils import secure_filename
+# Not deferred like openai and numpy: on top of flask and requests it costs ~5 ms, and every route needs it
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import uuid
+import base64
+import hashlib
+from datetime import datetime
 import requests
-import httpx
 
-# Load environment variables from .env file
-try:
-    from load_env import load_env
-    load_env()
-except ImportError:
-    print("Warning: load_env module not found. Using existing environment variables.")
+# Load environment variables from .env once, before the modules below read their settings
+import config
+settings = config.get_config()
+
+import serialization
+import metrics
+import tracing
+import openai_gateway
+import embedding_providers
+import reranking
+import course_stats
+import singleflight
+import querylog
+import analytics
+import reembed
+import chat_sessions
+import storage
+import deletion
+import db
+import vectors
+import ingestion
+import material_summaries
+import faq
+import dedup
 
 app = Flask(__name__)
+# Uploaded files are hashed as they are received, for content dedup
+app.request_class = dedup.HashingRequest
 CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}})
+tracing.init_app(app)
+metrics.init_app(app)
+serialization.init_app(app)
+
+# OpenAI client without proxies parameter, created (and openai imported) on first use.
+# Retries are handled by the gateway, which shares the rate limit between chat and ingestion.
+def create_openai_client():
+    import httpx
+    from openai import OpenAI
+    return OpenAI(
+        api_key=settings.openai_api_key,
+        http_client=httpx.Client(event_hooks=tracing.HTTPX_EVENT_HOOKS),
+        max_retries=0
+    )
+
+gateway = openai_gateway.OpenAIGateway(client_factory=create_openai_client)
+embedding_provider = embedding_providers.create_embedding_provider(gateway)
 
-# Initialize OpenAI client without proxies parameter
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-    http_client=httpx.Client()
-)
+# Shared HTTP session for Supabase calls; reuses connections and records trace spans
+http_session = requests.Session()
+http_session.hooks['response'].append(tracing.record_requests_response)
 
 # Supabase connection
-SUPABASE_URL = os.environ.get("NEXT_PUBLIC_SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_ROLE")  # Service role for admin ops
-SUPABASE_ANON_KEY = os.environ.get("SUPABASE_ANON_PUBLIC")  # Anon key for client-side ops
+SUPABASE_URL = settings.supabase_url
+SUPABASE_SERVICE_KEY = settings.supabase_service_key  # Service role for admin ops
+SUPABASE_ANON_KEY = settings.supabase_anon_key  # Anon key for client-side ops
 
 # Supabase API headers
 def get_admin_headers():
@@ -49,166 +85,307 @@ def get_anon_headers():
     }
 
 # Database connection
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=os.environ.get("SUPABASE_HOST"),
-        database=os.environ.get("SUPABASE_DATABASE"),
-        user=os.environ.get("SUPABASE_USER"),
-        password=os.environ.get("SUPABASE_PASSWORD")
-    )
+def connect_database(host, port=None):
+    with metrics.DB_CONNECT_DURATION.time(), tracing.span('db.connect'):
+        conn = psycopg2.connect(
+            host=host,
+            port=port,
+            database=settings.db_name,
+            user=settings.db_user,
+            password=settings.db_password
+        )
     conn.autocommit = True
     return conn
 
-# Create embeddings for text
-def create_embedding(text):
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
+# Routes reads to replicas and course vectors to shards when configured
+db_router = db.DatabaseRouter.from_env(connect_database, {'host': settings.db_host})
+
+def get_db_connection():
+    return db_router.primary()
+
+# Listing pagination
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Explicit column projections for listing endpoints
+MATERIAL_LIST_COLUMNS = "id, file_name, file_path, file_type, file_size, material_type, course_id, processed, chunks_count, created_at"
+COURSE_LIST_COLUMNS = "id, title, code, description, term, department, professor_id, created_at"
+QUERY_LIST_COLUMNS = "id, course_id, query, response, created_at"
+
+def qualify_columns(columns, alias):
+    return ', '.join(f"{alias}.{col}" for col in columns.split(', '))
 
-# Function to process and chunk text documents
-def chunk_text(text, chunk_size=1000, overlap=200):
+def get_page_size(default=DEFAULT_PAGE_SIZE):
     """
-    Split text into overlapping chunks for better semantic search.
+    Read the requested page size from the query string, clamped to MAX_PAGE_SIZE.
     """
-    if len(text) <= chunk_size:
-        return [text]
-    
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        # Try to find a natural break point like a newline or period
-        if end < len(text):
-            # Look for the last period or newline within the chunk
-            for break_char in ['\n', '.', '!', '?']:
-                last_break = text[start:end].rfind(break_char)
-                if last_break != -1:
-                    end = start + last_break + 1
-                    break
-        
-        chunks.append(text[start:end])
-        start = end - overlap if end - overlap > start else end
-    
-    return chunks
-
-# Extract text content from various file types
-def extract_text_from_file(file_path, file_type):
+    try:
+        limit = int(request.args.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(row):
     """
-    Extract text from different file types.
-    This is a simplified implementation. In production, use specific libraries for each file type.
+    Encode the (created_at, id) keyset of the last row on a page as an opaque cursor.
     """
-    if file_type == 'text/plain':
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    # In a real application, you would add support for more file types:
-    # - PDF: using PyPDF2 or pdfminer
-    # - DOCX: using python-docx
-    # - PPTX: using python-pptx
-    # - etc.
-    else:
-        # For simplicity, just read the file as text
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except:
-            return "Could not extract text from this file type."
+    created_at = row['created_at']
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    payload = json.dumps([created_at, str(row['id'])]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
 
-# Semantic search function
-def semantic_search(query, course_id, limit=5):
-    # Create embedding for the query
-    query_embedding = create_embedding(query)
-    
-    # Connect to the database
-    conn = get_db_connection()
+def decode_cursor(cursor_value):
+    """
+    Decode a cursor produced by encode_cursor. Raises ValueError on malformed input.
+    """
+    try:
+        padded = cursor_value + '=' * (-len(cursor_value) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), row_id
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def fetch_page(cursor, sql, params, order_alias='', limit=DEFAULT_PAGE_SIZE):
+    """
+    Run a keyset-paginated listing query ordered by (created_at, id) descending.
+
+    `sql` must contain a `{keyset}` placeholder inside its WHERE clause. Returns the
+    rows for this page and the cursor for the next one (None on the last page).
+    """
+    after = request.args.get('cursor')
+    keyset = ''
+    params = list(params)
+    if after:
+        created_at, row_id = decode_cursor(after)
+        keyset = f"AND ({order_alias}created_at, {order_alias}id) < (%s, %s)"
+        params.extend([created_at, row_id])
+
+    with tracing.span('db.listing', limit=limit) as db_span:
+        cursor.execute(
+            sql.format(keyset=keyset)
+            + f" ORDER BY {order_alias}created_at DESC, {order_alias}id DESC LIMIT %s",
+            params + [limit + 1]
+        )
+        rows = cursor.fetchall()
+        db_span.set(rows=len(rows))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return rows, next_cursor
+
+def get_course_version(cursor, course_id):
+    """
+    Return the change version of a course, bumped by a trigger whenever its materials change.
+    """
+    with tracing.span('db.course_version'):
+        cursor.execute(
+            "SELECT version FROM course_versions WHERE course_id = %s",
+            (course_id,)
+        )
+        row = cursor.fetchone()
+    if not row:
+        return 0
+    return row['version'] if isinstance(row, dict) else row[0]
+
+def make_listing_etag(*parts):
+    """
+    Build a compact ETag from the values that fully determine a listing response.
+    """
+    digest = hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return digest[:32]
+
+def list_course_materials(course_id):
+    """
+    Shared implementation for the two course materials listing endpoints.
+
+    The ETag is derived from the course change version, so a client revalidating an
+    unchanged listing gets a 304 without the materials query being run at all.
+    """
+    limit = get_page_size()
+    conn = db_router.read(course_id)
     cursor = conn.cursor(cursor_factory=RealDictCursor)
-    
-    # Call the match_documents function
-    cursor.execute(
-        """
-        SELECT * FROM match_documents(%s, 0.5, %s, %s)
-        """,
-        (query_embedding, limit, course_id)
+    try:
+        version = get_course_version(cursor, course_id)
+        etag = make_listing_etag('materials', course_id, version, request.args.get('cursor', ''), limit)
+        if request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            materials, next_cursor = fetch_page(
+                cursor,
+                f"""
+                SELECT {MATERIAL_LIST_COLUMNS} FROM materials
+                WHERE course_id = %s {{keyset}}
+                """,
+                (course_id,),
+                limit=limit
+            )
+            response = jsonify({'materials': materials, 'next_cursor': next_cursor})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    finally:
+        cursor.close()
+        conn.close()
+
+def conditional_listing(payload):
+    """
+    Return a listing response tagged with a body-hash ETag, answering 304 when it matches.
+    """
+    response = jsonify(payload)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# Create embeddings for text
+CHAT_MODEL = "gpt-4-turbo"
+
+def create_embedding(text, lane=openai_gateway.INTERACTIVE):
+    return embedding_provider.embed_one(text, lane=lane)
+
+# Vector search over one embedding model. The query is built per call so the distance
+# expression casts to the model's dimension and can use its partial expression index.
+MATCH_DOCUMENTS_SQL = '''
+    CREATE OR REPLACE FUNCTION match_documents(
+        query_embedding VECTOR,
+        match_threshold FLOAT,
+        match_count INT,
+        course_id TEXT,
+        model TEXT DEFAULT 'text-embedding-3-small'
     )
-    
-    results = cursor.fetchall()
+    RETURNS TABLE(
+        id TEXT,
+        content TEXT,
+        metadata JSONB,
+        similarity FLOAT
+    )
+    LANGUAGE plpgsql
+    AS $$
+    DECLARE
+        dim INT := vector_dims(query_embedding);
+    BEGIN
+        RETURN QUERY EXECUTE format(
+            'SELECT e.id, e.content, e.metadata,
+                    1 - (e.embedding::vector(%1$s) <=> $1::vector(%1$s)) AS similarity
+             FROM embeddings e
+             WHERE e.embedding_model = $4
+               AND e.embedding_dim = %1$s
+               AND ($3 = ''all'' OR e.metadata->>''courseId'' = $3)
+               AND 1 - (e.embedding::vector(%1$s) <=> $1::vector(%1$s)) > $2
+             ORDER BY e.embedding::vector(%1$s) <=> $1::vector(%1$s)
+             LIMIT $5',
+            dim
+        )
+        USING query_embedding, match_threshold, course_id, model, match_count;
+    END;
+    $$;
+'''
+
+# Threshold and count per course, maintained at ingestion time
+course_stats_cache = course_stats.CourseStatsCache()
+
+def match_documents(cursor, query_embedding, threshold, count, course_id):
+    # Call the match_documents function
+    with metrics.DB_QUERY_DURATION.time(query='match_documents'), \
+            tracing.span('db.match_documents', limit=count, threshold=threshold) as db_span:
+        cursor.execute(
+            """
+            SELECT * FROM match_documents(%s::vector, %s, %s, %s, %s)
+            """,
+            (vectors.to_text(query_embedding), threshold, count, course_id, embedding_provider.model_name)
+        )
+        results = cursor.fetchall()
+        db_span.set(rows=len(results))
     cursor.close()
-    conn.close()
-    
     return results
 
+def match_chunks(cursor, query_embedding, threshold, count, course_id, mode):
+    if mode == material_summaries.HIERARCHICAL:
+        with metrics.DB_QUERY_DURATION.time(query='match_hierarchical'), \
+                tracing.span('db.match_hierarchical', limit=count, threshold=threshold) as db_span:
+            results = material_summaries.match_hierarchical(
+                cursor, query_embedding, threshold, count, course_id, embedding_provider.model_name
+            )
+            db_span.set(rows=len(results))
+        if results:
+            cursor.close()
+            return results
+        # Chunks ingested before summaries existed are only found by flat search
+    return match_documents(cursor, query_embedding, threshold, count, course_id)
+
+# Semantic search function
+def semantic_search(query, course_id, limit=None, rerank=None, query_embedding=None, mode=None):
+    """
+    Return the closest chunks to the query, embedding it unless the caller already
+    has `query_embedding`. The similarity threshold, and the
+    number of chunks unless `limit` is given, come from the course's score
+    statistics. With re-ranking on (RERANK_ENABLED, or rerank=True), over-fetch
+    candidates and keep the best by cross-encoder score, falling back to vector
+    order when the re-ranker skips. `mode` is 'flat' (top k over every chunk) or
+    'hierarchical' (top k within the closest materials), SEARCH_MODE by default.
+    """
+    if rerank is None:
+        rerank = reranking.RERANK_ENABLED
+    if mode is None:
+        mode = material_summaries.SEARCH_MODE
+
+    # Create embedding for the query
+    if query_embedding is None:
+        query_embedding = create_embedding(query)
+    
+    if course_id == 'all' and db_router.sharded:
+        # Each shard returns its own best matches; keep the best across all of them
+        threshold, course_limit = course_stats_cache.get(None, course_id, embedding_provider.model_name)
+        if limit is None:
+            limit = course_limit
+        fetch_count = max(limit, reranking.RERANK_CANDIDATES) if rerank else limit
+        shard_results = db_router.scatter(
+            lambda conn: match_chunks(conn.cursor(cursor_factory=RealDictCursor), query_embedding, threshold, fetch_count, course_id, mode)
+        )
+        results = sorted((row for rows in shard_results for row in rows), key=lambda row: row['similarity'], reverse=True)[:fetch_count]
+    else:
+        # Connect to the database holding the course's vectors
+        conn = db_router.vector_read(course_id)
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        
+        threshold, course_limit = course_stats_cache.get(cursor, course_id, embedding_provider.model_name)
+        if limit is None:
+            limit = course_limit
+        fetch_count = max(limit, reranking.RERANK_CANDIDATES) if rerank else limit
+        
+        results = match_chunks(cursor, query_embedding, threshold, fetch_count, course_id, mode)
+        conn.close()
+    
+    if rerank:
+        reranked = reranking.get_reranker().rerank(query, results, limit)
+        if reranked is not None:
+            return reranked
+    return results[:limit]
+
 # Helper function to get current user from token
 def get_current_user(auth_header):
     if not auth_header or not auth_header.startswith('Bearer '):
         return None
     
     token = auth_header.split(' ')[1]
-    response = requests.get(
-        f"{SUPABASE_URL}/auth/v1/user",
-        headers={
-            "apikey": SUPABASE_ANON_KEY,
-            "Authorization": f"Bearer {token}"
-        }
-    )
+    with metrics.STORAGE_REQUEST_DURATION.time(operation='auth_user'):
+        response = http_session.get(
+            f"{SUPABASE_URL}/auth/v1/user",
+            headers={
+                "apikey": SUPABASE_ANON_KEY,
+                "Authorization": f"Bearer {token}"
+            }
+        )
     
     if response.status_code != 200:
         return None
     
     return response.json()
 
-# Process documents into chunks and create embeddings
-def process_documents(file_content, metadata):
-    # Split the content into chunks
-    chunks = chunk_text(file_content)
-    
-    documents = []
-    for i, chunk in enumerate(chunks):
-        documents.append({
-            "id": f"{metadata['fileId']}-chunk-{i}",
-            "content": chunk,
-            "metadata": {
-                **metadata,
-                "chunkIndex": i
-            }
-        })
-    
-    return documents
-
-# Create embeddings for document chunks
-def create_embeddings_for_documents(documents):
-    try:
-        # Connect to the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        for doc in documents:
-            # Generate embedding
-            embedding = create_embedding(doc['content'])
-            
-            # Store in database
-            cursor.execute(
-                """
-                INSERT INTO embeddings (id, content, embedding, metadata, created_at)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (
-                    doc['id'],
-                    doc['content'],
-                    embedding,
-                    json.dumps(doc['metadata']),
-                    time.strftime('%Y-%m-%d %H:%M:%S')
-                )
-            )
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return {"success": True, "count": len(documents)}
-    except Exception as e:
-        print("Error creating embeddings:", str(e))
-        raise e
+# Chunks, embeds and stores materials on the node holding each course's vectors
+ingestor = ingestion.Ingestor(db_router, embedding_provider, course_stats_cache)
 
 # New endpoint for embedding course materials
 @app.route('/api/materials/process', methods=['POST'])
@@ -233,30 +410,48 @@ def process_material():
     if not material_type:
         return jsonify({'error': 'Material type is required'}), 400
     
-    # Save the file temporarily
     filename = secure_filename(file.filename)
     file_path = os.path.join('/tmp', filename)
-    file.save(file_path)
     
     try:
-        # Extract text from the file
-        text = extract_text_from_file(file_path, file.content_type)
-        
-        # Chunk the text
-        chunks = chunk_text(text)
+        ingest_start = time.perf_counter()
         
         # Generate a material ID
         material_id = str(uuid.uuid4())
+        metadata = {
+            "materialId": material_id,
+            "courseId": course_id,
+            "title": title,
+            "type": material_type,
+            "description": description
+        }
         
-        # Connect to the database
+        # The same content already processed elsewhere has its chunks copied instead
+        sha256, file_size = dedup.upload_digest(file)
+        conn = db_router.read(course_id)
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        original = dedup.find_processed_material(cursor, sha256)
+        cursor.close()
+        conn.close()
+        
+        chunks_count = ingestor.clone(original, metadata, source='process_material') if original else 0
+        deduplicated = chunks_count > 0
+        dedup.record('process_material', deduplicated, file_size)
+        if not deduplicated:
+            # Save the file temporarily and extract its text
+            file.save(file_path)
+            text = ingestion.extract_text_from_file(file_path, file.content_type)
+            
+            # Chunk, embed and store on the database holding the course's vectors
+            chunks_count = len(ingestor.ingest_text(text, metadata, source='process_material'))
+        
+        # Insert the material record once its chunks are searchable
         conn = get_db_connection()
         cursor = conn.cursor()
-        
-        # Insert the material record
         cursor.execute(
             """
-            INSERT INTO materials (id, file_name, file_path, file_type, file_size, material_type, course_id, processed, chunks_count)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO materials (id, file_name, file_path, file_type, file_size, material_type, course_id, processed, chunks_count, content_sha256)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
             """,
             (
@@ -264,57 +459,31 @@ def process_material():
                 filename,
                 filename,  # In a real app, this would be a storage path
                 file.content_type,
-                os.path.getsize(file_path),
+                file_size,
                 material_type,
                 course_id,
                 True,
-                len(chunks)
+                chunks_count,
+                sha256
             )
         )
-        
-        # For each chunk, generate embedding and store in database
-        for i, chunk in enumerate(chunks):
-            # Generate embedding using OpenAI
-            embedding = create_embedding(chunk)
-            
-            # Create metadata
-            metadata = {
-                "materialId": material_id,
-                "courseId": course_id,
-                "title": title,
-                "type": material_type,
-                "description": description,
-                "chunkIndex": i,
-                "totalChunks": len(chunks)
-            }
-            
-            # Insert embedding into the database
-            chunk_id = f"{material_id}_chunk_{i}"
-            cursor.execute(
-                """
-                INSERT INTO embeddings (id, content, embedding, metadata, created_at)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (
-                    chunk_id,
-                    chunk,
-                    embedding,
-                    json.dumps(metadata),
-                    time.strftime('%Y-%m-%d %H:%M:%S')
-                )
-            )
-        
         conn.commit()
         cursor.close()
+        db_router.mark_written(course_id, conn)
         conn.close()
+        faq_index.invalidate(course_id)
+        
+        metrics.INGESTION_DURATION.observe(time.perf_counter() - ingest_start, source='process_material')
         
         # Clean up the temporary file
-        os.remove(file_path)
+        if os.path.exists(file_path):
+            os.remove(file_path)
         
         return jsonify({
             'success': True,
             'material_id': material_id,
-            'chunks_processed': len(chunks)
+            'chunks_processed': chunks_count,
+            'deduplicated': deduplicated
         })
     
     except Exception as e:
@@ -324,11 +493,18 @@ def process_material():
         
         return jsonify({'error': str(e)}), 500
 
+# Identical concurrent searches and chat questions share one embedding, retrieval and completion
+singleflight_store = singleflight.create_store()
+search_flight = singleflight.SingleFlight('search', singleflight_store)
+chat_flight = singleflight.SingleFlight('chat', singleflight_store)
+
 @app.route('/api/search', methods=['POST'])
 def search():
     data = request.json
     query = data.get('query', '')
     course_id = data.get('course_id', '')
+    rerank = data.get('rerank')
+    mode = data.get('mode') or material_summaries.SEARCH_MODE
     
     if not query:
         return jsonify({'error': 'Query is required'}), 400
@@ -336,93 +512,344 @@ def search():
     if not course_id:
         return jsonify({'error': 'Course ID is required'}), 400
     
+    if mode not in material_summaries.SEARCH_MODES:
+        return jsonify({'error': f"Search mode must be one of {', '.join(material_summaries.SEARCH_MODES)}"}), 400
+    
+    rerank = None if rerank is None else bool(rerank)
+    
     # Perform semantic search
-    results = semantic_search(query, course_id)
+    results = search_flight.do(
+        f"{course_id}\0{rerank}\0{mode}\0{singleflight.normalize_query(query)}",
+        lambda: semantic_search(query, course_id, rerank=rerank, mode=mode)
+    )
     
     return jsonify({'results': results})
 
+# Fixed instructions go first so every chat prompt shares the same cacheable prefix
+CHAT_INSTRUCTIONS = """You are an AI teaching assistant for a course. Answer the student's question based on the course materials provided below.
+If the context doesn't help answer the question, you can say you don't know and suggest the student ask their professor.
+Be friendly, helpful, and concise in your responses."""
+
+def build_chat_messages(query, context_results, summary=None, history=()):
+    """
+    Assemble the chat prompt: instructions, retrieved context, the summary of
+    earlier turns, the recent turns, then the question.
+    """
+    context = "\n\n".join([result["content"] for result in context_results])
+    messages = [
+        {"role": "system", "content": CHAT_INSTRUCTIONS},
+        {"role": "system", "content": f"Context from the course materials:\n\n{context}"}
+    ]
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the conversation so far:\n{summary}"})
+    messages.extend(history)
+    messages.append({"role": "user", "content": query})
+    return messages
+
+def generate_answer(messages):
+    with tracing.span('generation', model=CHAT_MODEL) as generation_span:
+        chat_response = gateway.create_chat_completion(
+            model=CHAT_MODEL,
+            messages=messages,
+            max_tokens=500
+        )
+        if chat_response.usage is not None:
+            generation_span.set(
+                prompt_tokens=chat_response.usage.prompt_tokens,
+                completion_tokens=chat_response.usage.completion_tokens
+            )
+    return chat_response
+
+def describe_sources(context_results):
+    return [{"title": r["metadata"].get("title", "Unknown"), "type": r["metadata"].get("type", "Unknown")} for r in context_results]
+
+def cited_material_ids(context_results):
+    return [r["metadata"]["materialId"] for r in context_results if r["metadata"].get("materialId")]
+
+def rebuild_faq(course_id):
+    """Rebuild a course's FAQ after its materials changed, if it has one. Returns whether it was rebuilt."""
+    entries = faq.rebuild_course(course_id, db_router, embedding_provider, faq_answer, faq.parse_args([]), stale_only=True)
+    if entries is None:
+        return False
+    faq_index.invalidate(course_id, rebuild=False)
+    return True
+
+# Canonical answers to each course's most frequent questions, built by faq.py and rebuilt when materials change
+faq_answer = faq.answer_with(gateway, semantic_search, build_chat_messages, describe_sources, cited_material_ids, CHAT_MODEL)
+faq_index = faq.FaqIndex(db_router.read, rebuilder=faq.FaqRebuilder(rebuild_faq) if faq.FAQ_ENABLED else None)
+
+def faq_result(entry, query_embedding):
+    return {
+        'answer': entry['answer'],
+        'sources': entry['sources'],
+        'query_embedding': query_embedding if query_embedding is not None else entry['centroid'],
+        'material_ids': entry['material_ids']
+    }
+
+def faq_lookup(lookup, course_id, query):
+    """
+    Run an FAQ index lookup, or return None if it fails: the FAQ is only a fast
+    path, and the question is then answered by retrieval as usual.
+    """
+    try:
+        return lookup(course_id, embedding_provider.model_name, query)
+    except Exception as e:
+        faq.LOOKUPS.inc(outcome='error')
+        print(f"Warning: FAQ lookup for course {course_id} failed: {e}")
+        return None
+
+def answer_question(query, course_id):
+    """
+    Retrieve context for the question and generate an answer with its sources.
+    The query embedding and cited material ids are returned for analytics.
+
+    Questions matching an entry of the course FAQ get its stored answer, with no
+    retrieval or completion: a known phrasing before the question is embedded,
+    a close paraphrase right after.
+    """
+    use_faq = faq.FAQ_ENABLED and course_id != 'all'
+    if use_faq:
+        with tracing.span('faq_lookup', match='exact') as faq_span:
+            entry = faq_lookup(faq_index.exact, course_id, query)
+            faq_span.set(hit=entry is not None)
+        if entry:
+            faq.LOOKUPS.inc(outcome='exact')
+            return faq_result(entry, None)
+    
+    # Get context from vector store
+    with tracing.span('retrieval'):
+        query_embedding = create_embedding(query)
+        if use_faq:
+            entry = faq_lookup(faq_index.nearest, course_id, query_embedding)
+            faq.LOOKUPS.inc(outcome='similar' if entry else 'miss')
+            if entry:
+                return faq_result(entry, query_embedding)
+        context_results = semantic_search(query, course_id, query_embedding=query_embedding)
+    
+    with tracing.span('prompt_build', context_chunks=len(context_results)) as prompt_span:
+        messages = build_chat_messages(query, context_results)
+        prompt_span.set(prompt_chars=sum(len(m["content"]) for m in messages))
+    
+    # Generate response using OpenAI
+    chat_response = generate_answer(messages)
+    
+    return {
+        'answer': chat_response.choices[0].message.content,
+        'sources': describe_sources(context_results),
+        'query_embedding': query_embedding,
+        'material_ids': cited_material_ids(context_results)
+    }
+
+def session_accessible(session):
+    """Whether the caller may read and write the session; only owned sessions need the Authorization header."""
+    user = get_current_user(request.headers.get('Authorization')) if session['user_id'] is not None else None
+    return chat_sessions.can_access(session, user)
+
+def answer_in_session(session, query):
+    """
+    Answer a follow-up within a chat session and record the turn.
+
+    Reuses the previous turn's context when the question is close to the last
+    one, sends the session summary plus the turns after it instead of the whole
+    conversation, and reports the prompt tokens that saved.
+    """
+    course_id = session['course_id']
+    with tracing.span('retrieval') as retrieval_span:
+        query_embedding = create_embedding(query)
+        context_results = chat_sessions.reusable_context(session, query_embedding)
+        context_reused = context_results is not None
+        if not context_reused:
+            context_results = semantic_search(query, course_id, query_embedding=query_embedding)
+        retrieval_span.set(context_reused=context_reused)
+    
+    with tracing.span('prompt_build', context_chunks=len(context_results)) as prompt_span:
+        messages = build_chat_messages(query, context_results, session['summary'], chat_sessions.history_messages(session))
+        # What the turn would cost resending every earlier turn
+        full_messages = build_chat_messages(query, context_results, history=chat_sessions.turn_messages(session['turns']))
+        prompt_tokens = chat_sessions.messages_tokens(messages)
+        prompt_tokens_saved = max(chat_sessions.messages_tokens(full_messages) - prompt_tokens, 0)
+        prompt_span.set(prompt_chars=sum(len(m["content"]) for m in messages), prompt_tokens_saved=prompt_tokens_saved)
+    
+    chat_response = generate_answer(messages)
+    answer = chat_response.choices[0].message.content
+    
+    cached_prompt_tokens = 0
+    if chat_response.usage is not None:
+        prompt_tokens = chat_response.usage.prompt_tokens
+        details = getattr(chat_response.usage, 'prompt_tokens_details', None)
+        cached_prompt_tokens = getattr(details, 'cached_tokens', None) or 0
+    
+    conn = get_db_connection()
+    conn.autocommit = False
+    cursor = conn.cursor()
+    try:
+        turn_index = chat_sessions.append_turn(
+            cursor, session['id'], query, answer, query_embedding,
+            context_results, context_reused, prompt_tokens, prompt_tokens_saved
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    
+    # Turns stored concurrently are not in this copy of the session; the next turn summarizes instead
+    if turn_index == len(session['turns']):
+        session['turns'].append({'query': query, 'answer': answer})
+        if chat_sessions.needs_summary(session):
+            chat_sessions.summarize_in_background(get_db_connection, gateway, session)
+    
+    return {
+        'answer': answer,
+        'sources': describe_sources(context_results),
+        'query_embedding': query_embedding,
+        'material_ids': cited_material_ids(context_results),
+        'turn': turn_index,
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'prompt_tokens_saved': prompt_tokens_saved,
+            'cached_prompt_tokens': cached_prompt_tokens,
+            'context_reused': context_reused
+        }
+    }
+
+# Chat queries are written in batches by a background thread instead of inline,
+# and each batch also updates the course analytics rollups
+query_log = querylog.QueryLogWriter(get_db_connection, sinks=[analytics.update_rollups])
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     data = request.json
     query = data.get('query', '')
     course_id = data.get('course_id', '')
     user_id = data.get('user_id', '')
+    session_id = data.get('session_id')
     
     if not query:
         return jsonify({'error': 'Query is required'}), 400
     
-    if not course_id:
+    if not course_id and not session_id:
         return jsonify({'error': 'Course ID is required'}), 400
     
-    # Get context from vector store
-    context_results = semantic_search(query, course_id, limit=5)
-    context = "\n\n".join([result["content"] for result in context_results])
-    
-    # Create system message with context and instructions
-    system_message = f"""
-    You are an AI teaching assistant for a course. Answer the student's question based on the course materials.
-    Here is some context from the course materials to help you answer:
+    try:
+        if session_id:
+            # Session turns depend on the conversation so far and are never coalesced
+            conn = get_db_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            session = chat_sessions.load_session(cursor, session_id)
+            cursor.close()
+            conn.close()
+            if not session or not session_accessible(session):
+                return jsonify({'error': 'Chat session not found'}), 404
+            course_id = session['course_id']
+            result = answer_in_session(session, query)
+        else:
+            result = chat_flight.do(
+                f"{course_id}\0{singleflight.normalize_query(query)}",
+                lambda: answer_question(query, course_id)
+            )
+        
+        # Log the query; the queries row is only written if user_id is provided
+        query_log.log(
+            user_id, course_id, query, result['answer'],
+            query_embedding=result['query_embedding'],
+            material_ids=result['material_ids']
+        )
+        
+        response = {'answer': result['answer'], 'sources': result['sources']}
+        if session_id:
+            response.update(session_id=session_id, turn=result['turn'], usage=result['usage'])
+        return jsonify(response)
     
-{context}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-    If the context doesn't help answer the question, you can say you don't know and suggest the student ask their professor.
-    Be friendly, helpful, and concise in your responses.
-    """
+# Chat sessions - POST /api/chat/sessions
+@app.route('/api/chat/sessions', methods=['POST'])
+def create_chat_session():
+    data = request.json or {}
+    course_id = data.get('course_id', '')
+    
+    if not course_id:
+        return jsonify({'error': 'Course ID is required'}), 400
+    
+    # A session is owned by the signed-in user creating it; without a token it is anonymous
+    user = get_current_user(request.headers.get('Authorization'))
+    if data.get('user_id') and (not user or data['user_id'] != user['id']):
+        return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        # Generate response using OpenAI
-        chat_response = client.chat.completions.create(
-            model="gpt-4-turbo",  # or another appropriate model
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": query}
-            ],
-            max_tokens=500
-        )
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        session_id = chat_sessions.create_session(cursor, course_id, user['id'] if user else None)
+        cursor.close()
+        conn.close()
         
-        answer = chat_response.choices[0].message.content
+        return jsonify({'session_id': session_id, 'course_id': course_id}), 201
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Chat session history - GET /api/chat/sessions/<session_id>
+@app.route('/api/chat/sessions/<session_id>', methods=['GET'])
+def get_chat_session(session_id):
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        session = chat_sessions.load_session(cursor, session_id)
+        cursor.close()
+        conn.close()
         
-        # Store the query in the database if user_id is provided
-        if user_id:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO queries (user_id, course_id, query, response, created_at)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (user_id, course_id, query, answer, time.strftime('%Y-%m-%d %H:%M:%S'))
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
+        if not session or not session_accessible(session):
+            return jsonify({'error': 'Chat session not found'}), 404
         
-        return jsonify({
-            'answer': answer,
-            'sources': [{"title": r["metadata"].get("title", "Unknown"), "type": r["metadata"].get("type", "Unknown")} for r in context_results]
-        })
-    
+        for turn in session['turns']:
+            turn.pop('query_embedding', None)
+            turn['sources'] = describe_sources(turn.pop('context') or [])
+        session['prompt_tokens_saved'] = sum(turn['prompt_tokens_saved'] or 0 for turn in session['turns'])
+        return jsonify(session)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/courses/<course_id>/materials', methods=['GET'])
 def get_materials(course_id):
     try:
-        conn = get_db_connection()
+        return list_course_materials(course_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Course analytics endpoint - GET /api/courses/<course_id>/analytics
+@app.route('/api/courses/<course_id>/analytics', methods=['GET'])
+def get_course_analytics(course_id):
+    auth_header = request.headers.get('Authorization')
+    user = get_current_user(auth_header)
+    
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        days = min(max(int(request.args.get('days', 30)), 1), 365)
+        top = min(max(int(request.args.get('top', 10)), 1), 50)
+        
+        conn = db_router.read()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(
-            """
-            SELECT * FROM materials
-            WHERE course_id = %s
-            ORDER BY created_at DESC
-            """,
-            (course_id,)
-        )
-        materials = cursor.fetchall()
+        cursor.execute('SELECT professor_id FROM courses WHERE id = %s', (course_id,))
+        course = cursor.fetchone()
+        if not course or str(course['professor_id']) != user['id']:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Course not found'}), 404
+        
+        payload = analytics.course_analytics(cursor, course_id, days=days, top=top)
         cursor.close()
         conn.close()
         
-        return jsonify({'materials': materials})
+        return conditional_listing(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -435,22 +862,27 @@ def get_student_courses():
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        conn = get_db_connection()
+        limit = get_page_size()
+        conn = db_router.read(user['id'])
         cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(
-            """
-            SELECT c.* FROM enrollments e
+        courses, next_cursor = fetch_page(
+            cursor,
+            f"""
+            SELECT {qualify_columns(COURSE_LIST_COLUMNS, 'c')}
+            FROM enrollments e
             JOIN courses c ON e.course_id = c.id
-            WHERE e.student_id = %s
-            ORDER BY c.created_at DESC
+            WHERE e.student_id = %s {{keyset}}
             """,
-            (user['id'],)
+            (user['id'],),
+            order_alias='c.',
+            limit=limit
         )
-        courses = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        return jsonify({'courses': courses})
+        return conditional_listing({'courses': courses, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -463,24 +895,27 @@ def get_recent_queries():
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        conn = get_db_connection()
+        limit = get_page_size(default=10)
+        conn = db_router.read(user['id'])
         cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(
-            """
-            SELECT q.*, c.title as course_title
+        queries, next_cursor = fetch_page(
+            cursor,
+            f"""
+            SELECT {qualify_columns(QUERY_LIST_COLUMNS, 'q')}, c.title as course_title
             FROM queries q
             JOIN courses c ON q.course_id = c.id
-            WHERE q.user_id = %s
-            ORDER BY q.created_at DESC
-            LIMIT 10
+            WHERE q.user_id = %s {{keyset}}
             """,
-            (user['id'],)
+            (user['id'],),
+            order_alias='q.',
+            limit=limit
         )
-        queries = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        return jsonify({'queries': queries})
+        return conditional_listing({'queries': queries, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -497,36 +932,41 @@ def get_courses():
             return jsonify({'error': 'Unauthorized'}), 401
         
         role = request.args.get('role', 'professor')
+        limit = get_page_size()
         
-        conn = get_db_connection()
+        conn = db_router.read(user['id'])
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
         if role == 'professor':
-            cursor.execute(
-                """
-                SELECT * FROM courses
-                WHERE professor_id = %s
-                ORDER BY created_at DESC
+            courses, next_cursor = fetch_page(
+                cursor,
+                f"""
+                SELECT {COURSE_LIST_COLUMNS} FROM courses
+                WHERE professor_id = %s {{keyset}}
                 """,
-                (user['id'],)
+                (user['id'],),
+                limit=limit
             )
-            courses = cursor.fetchall()
         else:
-            cursor.execute(
-                """
-                SELECT c.* FROM enrollments e
+            courses, next_cursor = fetch_page(
+                cursor,
+                f"""
+                SELECT {qualify_columns(COURSE_LIST_COLUMNS, 'c')}
+                FROM enrollments e
                 JOIN courses c ON e.course_id = c.id
-                WHERE e.student_id = %s
-                ORDER BY c.created_at DESC
+                WHERE e.student_id = %s {{keyset}}
                 """,
-                (user['id'],)
+                (user['id'],),
+                order_alias='c.',
+                limit=limit
             )
-            courses = cursor.fetchall()
         
         cursor.close()
         conn.close()
         
-        return jsonify({'courses': courses})
+        return conditional_listing({'courses': courses, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -586,6 +1026,7 @@ def create_course():
         
         course = cursor.fetchone()
         cursor.close()
+        db_router.mark_written(user['id'], conn)
         conn.close()
         
         return jsonify({'course': course})
@@ -601,21 +1042,9 @@ def get_course_materials():
         if not course_id:
             return jsonify({'error': 'Course ID is required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute(
-            """
-            SELECT * FROM materials
-            WHERE course_id = %s
-            ORDER BY created_at DESC
-            """,
-            (course_id,)
-        )
-        materials = cursor.fetchall()
-        cursor.close()
-        conn.close()
-        
-        return jsonify({'materials': materials})
+        return list_course_materials(course_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -630,28 +1059,57 @@ def process_document():
         if not file_path or not metadata:
             return jsonify({'error': 'File path and metadata are required'}), 400
         
-        if not os.environ.get('OPENAI_API_KEY'):
+        if not settings.openai_api_key:
             return jsonify({'error': 'OpenAI API key is not configured'}), 500
         
+        ingest_start = time.perf_counter()
+        
         # Get the file from Supabase storage
-        response = requests.get(
-            f"{SUPABASE_URL}/storage/v1/object/course-materials/{file_path}",
-            headers=get_admin_headers()
-        )
+        with metrics.STORAGE_REQUEST_DURATION.time(operation='download'):
+            response = http_session.get(
+                f"{SUPABASE_URL}/storage/v1/object/course-materials/{file_path}",
+                headers=get_admin_headers()
+            )
         
         if response.status_code != 200:
             return jsonify({'error': 'Failed to download file'}), 500
         
         file_content = response.text
+        sha256 = hashlib.sha256(response.content).hexdigest()
+        course_id = metadata.get('courseId')
         
-        # Process the document into chunks
-        documents = process_documents(file_content, {
-            **metadata,
-            'fileId': file_path
-        })
+        # A deduplicated object can back materials in several courses. Their chunks
+        # are named after the material, so courses do not replace each other's.
+        conn = db_router.read(course_id)
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(
+            """
+            SELECT id::text AS id,
+                   EXISTS (SELECT 1 FROM materials o WHERE o.file_path = m.file_path AND o.id <> m.id) AS shared
+            FROM materials m
+            WHERE file_path = %s AND course_id::text = %s
+            ORDER BY created_at
+            LIMIT 1
+            """,
+            (file_path, course_id)
+        )
+        target = cursor.fetchone()
+        original = dedup.find_processed_material(cursor, sha256, exclude_id=target['id']) if target else None
+        cursor.close()
+        conn.close()
         
-        # Create embeddings for the chunks
-        result = create_embeddings_for_documents(documents)
+        if target and (target['shared'] or original):
+            ingestor.forget_path(file_path, course_id)
+            metadata = {**{key: value for key, value in metadata.items() if key != 'fileId'}, 'materialId': target['id']}
+            chunks_count = ingestor.clone(original, metadata, source='process_document') if original else 0
+        else:
+            metadata = {**metadata, 'fileId': file_path}
+            chunks_count = 0
+        deduplicated = chunks_count > 0
+        dedup.record('process_document', deduplicated, len(response.content))
+        if not deduplicated:
+            # Chunk, embed and store the document
+            chunks_count = len(ingestor.ingest_text(file_content, metadata, source='process_document'))
         
         # Update the material status in the database
         conn = get_db_connection()
@@ -659,19 +1117,24 @@ def process_document():
         cursor.execute(
             """
             UPDATE materials
-            SET processed = true, chunks_count = %s
-            WHERE file_path = %s
+            SET processed = true, chunks_count = %s, content_sha256 = %s
+            WHERE file_path = %s AND (%s::text IS NULL OR id::text = %s)
             """,
-            (len(documents), file_path)
+            (chunks_count, sha256, file_path, target and target['id'], target and target['id'])
         )
         conn.commit()
         cursor.close()
+        db_router.mark_written(course_id, conn)
         conn.close()
+        faq_index.invalidate(course_id)
+        
+        metrics.INGESTION_DURATION.observe(time.perf_counter() - ingest_start, source='process_document')
         
         return jsonify({
             'success': True,
-            'documentsProcessed': len(documents),
-            'embeddingsCreated': result.get('count', 0)
+            'documentsProcessed': chunks_count,
+            'embeddingsCreated': 0 if deduplicated else chunks_count,
+            'deduplicated': deduplicated
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -680,55 +1143,9 @@ def process_document():
 @app.route('/api/setup-vector-store', methods=['POST'])
 def setup_vector_store():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Enable pgvector extension
-        cursor.execute('CREATE EXTENSION IF NOT EXISTS vector;')
-        
-        # Create embeddings table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS embeddings (
-                id TEXT PRIMARY KEY,
-                content TEXT NOT NULL,
-                embedding VECTOR(1536),
-                metadata JSONB,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        ''')
-        
-        # Create match_documents function
-        cursor.execute('''
-            CREATE OR REPLACE FUNCTION match_documents(
-                query_embedding VECTOR(1536),
-                match_threshold FLOAT,
-                match_count INT,
-                course_id TEXT
-            )
-            RETURNS TABLE(
-                id TEXT,
-                content TEXT,
-                similarity FLOAT,
-                metadata JSONB
-            )
-            LANGUAGE SQL
-            AS $$
-                SELECT
-                    id,
-                    content,
-                    1 - (embedding <=> query_embedding) as similarity,
-                    metadata
-                FROM embeddings
-                WHERE metadata->>'courseId' = course_id
-                AND 1 - (embedding <=> query_embedding) > match_threshold
-                ORDER BY similarity DESC
-                LIMIT match_count;
-            $$;
-        ''')
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
+        # Every node holding course vectors gets the same schema
+        for node in db_router.vector_nodes():
+            setup_vector_node(node)
         
         return jsonify({
             'success': True,
@@ -737,6 +1154,94 @@ def setup_vector_store():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def setup_vector_node(node):
+    conn = db_router.connect(**node.primary)
+    cursor = conn.cursor()
+    
+    # Enable pgvector extension
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS vector;')
+    
+    # Create embeddings table. The vector column has no fixed dimension so rows from
+    # different embedding models can coexist; each row records its model and dimension,
+    # and a chunk can have one row per model while it is being re-embedded.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embeddings (
+            id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            embedding VECTOR,
+            metadata JSONB,
+            embedding_model TEXT NOT NULL DEFAULT 'text-embedding-3-small',
+            embedding_dim INTEGER NOT NULL DEFAULT 1536,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, embedding_model)
+        );
+    ''')
+    
+    # Per-model vector index
+    embedding_providers.create_vector_index(cursor, embedding_provider.model_name, embedding_provider.dimension)
+    
+    # Lookup indexes for deleting a material's chunks
+    cursor.execute(deletion.CREATE_INDEXES_SQL)
+    
+    # Material and section centroids for hierarchical search
+    cursor.execute(material_summaries.CREATE_TABLE_SQL)
+    
+    # Create match_documents function
+    cursor.execute('DROP FUNCTION IF EXISTS match_documents(VECTOR, FLOAT, INT, TEXT);')
+    cursor.execute(MATCH_DOCUMENTS_SQL)
+    
+    # Per-course score statistics, backfilled for courses ingested before they existed
+    cursor.execute(course_stats.CREATE_TABLE_SQL)
+    course_stats.backfill_course_stats(cursor, embedding_provider.model_name)
+    
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+# Start a background re-embedding job - POST /api/embeddings/reembed
+@app.route('/api/embeddings/reembed', methods=['POST'])
+def start_reembed():
+    try:
+        data = request.json or {}
+        provider_kind = data.get('provider', 'openai')
+        model_name = data.get('model')
+        
+        if not model_name:
+            return jsonify({'error': 'Target model is required'}), 400
+        
+        provider = embedding_providers.create_embedding_provider(gateway, kind=provider_kind, model_name=model_name)
+        job = reembed.ReembedJob.create(
+            get_db_connection,
+            provider,
+            source_model=data.get('source_model') or embedding_provider.model_name,
+            course_id=data.get('course_id'),
+            provider_kind=provider_kind
+        )
+        reembed.start_background_job(job)
+        
+        return jsonify({'success': True, 'job_id': job.job_id}), 202
+    except (ValueError, KeyError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Re-embedding job progress - GET /api/embeddings/reembed/<job_id>
+@app.route('/api/embeddings/reembed/<job_id>', methods=['GET'])
+def get_reembed_status(job_id):
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        job = reembed.job_status(cursor, job_id)
+        cursor.close()
+        conn.close()
+        
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+        
+        return jsonify({'job': job})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # Setup Supabase - POST /api/setup-supabase
 @app.route('/api/setup-supabase', methods=['POST'])
 def setup_supabase():
@@ -805,6 +1310,68 @@ def setup_supabase():
             );
         ''')
         
+        # Content hashes of stored objects and materials, for upload dedup
+        cursor.execute(dedup.CREATE_TABLES_SQL)
+        
+        # Rollups behind the course analytics endpoint
+        cursor.execute(analytics.CREATE_TABLES_SQL)
+        
+        # Canonical answers served by chat for each course's frequent questions
+        cursor.execute(faq.CREATE_TABLE_SQL)
+        
+        # Server-side conversation store for chat sessions
+        cursor.execute(chat_sessions.CREATE_TABLES_SQL)
+        
+        # Indexes backing keyset pagination of the listing endpoints
+        cursor.execute('CREATE INDEX IF NOT EXISTS materials_course_id_created_at_idx ON materials (course_id, created_at DESC);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS courses_professor_id_created_at_idx ON courses (professor_id, created_at DESC);')
+        cursor.execute('CREATE INDEX IF NOT EXISTS queries_user_id_created_at_idx ON queries (user_id, created_at DESC);')
+        
+        # Per-course change version for materials listing ETags
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS course_versions (
+                course_id UUID PRIMARY KEY REFERENCES courses(id) ON DELETE CASCADE,
+                version BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        ''')
+        
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION bump_course_version()
+            RETURNS TRIGGER AS $$
+            DECLARE
+                changed_course_id UUID;
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    changed_course_id := OLD.course_id;
+                ELSE
+                    changed_course_id := NEW.course_id;
+                END IF;
+                
+                INSERT INTO course_versions (course_id, version, updated_at)
+                VALUES (changed_course_id, 1, CURRENT_TIMESTAMP)
+                ON CONFLICT (course_id)
+                DO UPDATE SET version = course_versions.version + 1, updated_at = CURRENT_TIMESTAMP;
+                
+                IF TG_OP = 'UPDATE' AND OLD.course_id IS DISTINCT FROM NEW.course_id THEN
+                    INSERT INTO course_versions (course_id, version, updated_at)
+                    VALUES (OLD.course_id, 1, CURRENT_TIMESTAMP)
+                    ON CONFLICT (course_id)
+                    DO UPDATE SET version = course_versions.version + 1, updated_at = CURRENT_TIMESTAMP;
+                END IF;
+                
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        ''')
+        
+        cursor.execute('DROP TRIGGER IF EXISTS materials_bump_course_version ON materials;')
+        cursor.execute('''
+            CREATE TRIGGER materials_bump_course_version
+            AFTER INSERT OR UPDATE OR DELETE ON materials
+            FOR EACH ROW EXECUTE FUNCTION bump_course_version();
+        ''')
+        
         conn.commit()
         cursor.close()
         conn.close()
@@ -830,15 +1397,27 @@ def upload_file():
         if file.filename == '' or not path:
             return jsonify({'error': 'No selected file or path'}), 400
         
+        # Content already stored in the same folder is referenced rather than uploaded again
+        sha256, file_size = dedup.upload_digest(file)
+        conn = db_router.read(sha256)
+        cursor = conn.cursor()
+        existing = dedup.find_object(cursor, sha256, dedup.storage_folder(path))
+        cursor.close()
+        conn.close()
+        if existing and storage_urls.resolve(existing):
+            dedup.record('storage_upload', True, file_size)
+            return jsonify({'Key': f"course-materials/{existing}", 'path': existing, 'deduplicated': True})
+        dedup.record('storage_upload', False, file_size)
+        
         # Save file temporarily
         filename = secure_filename(file.filename)
         temp_path = os.path.join('/tmp', filename)
         file.save(temp_path)
         
         # Upload to Supabase storage
-        with open(temp_path, 'rb') as f:
+        with open(temp_path, 'rb') as f, metrics.STORAGE_REQUEST_DURATION.time(operation='upload'):
             files = {'file': (filename, f)}
-            response = requests.post(
+            response = http_session.post(
                 f"{SUPABASE_URL}/storage/v1/object/course-materials/{path}",
                 headers={
                     "apikey": SUPABASE_SERVICE_KEY,
@@ -853,10 +1432,27 @@ def upload_file():
         if response.status_code != 200:
             return jsonify({'error': 'Error uploading file to Supabase'}), 500
         
-        return jsonify(response.json())
+        storage_urls.invalidate(path)
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        dedup.record_object(cursor, sha256, path, file_size)
+        conn.commit()
+        cursor.close()
+        db_router.mark_written(sha256, conn)
+        conn.close()
+        
+        return jsonify({**response.json(), 'path': path, 'deduplicated': False})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Existence checks and signed URLs for stored files, cached per path
+storage_urls = storage.StorageURLResolver(http_session, SUPABASE_URL, get_admin_headers)
+
+def describe_storage_url(resolved):
+    key = 'publicUrl' if storage_urls.public else 'signedUrl'
+    return {key: resolved['url'], **{k: v for k, v in resolved.items() if k != 'url'}}
+
 @app.route('/api/storage/getUrl', methods=['GET'])
 def get_file_url():
     try:
@@ -865,20 +1461,95 @@ def get_file_url():
         if not path:
             return jsonify({'error': 'Path is required'}), 400
         
-        response = requests.get(
-            f"{SUPABASE_URL}/storage/v1/object/public/course-materials/{path}",
-            headers=get_anon_headers()
-        )
+        resolved = storage_urls.resolve(path)
+        if resolved is None:
+            return jsonify({'error': 'File not found'}), 404
         
-        if response.status_code != 200:
-            return jsonify({'error': 'Error getting file URL'}), 500
+        return jsonify(describe_storage_url(resolved))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Batch URL resolution - POST /api/storage/getUrls
+@app.route('/api/storage/getUrls', methods=['POST'])
+def get_file_urls():
+    try:
+        data = request.json or {}
+        paths = data.get('paths')
         
+        if not isinstance(paths, list) or not paths or not all(isinstance(p, str) and p for p in paths):
+            return jsonify({'error': 'paths must be a non-empty list of paths'}), 400
+        
+        if len(paths) > storage.STORAGE_MAX_BATCH:
+            return jsonify({'error': f'At most {storage.STORAGE_MAX_BATCH} paths per request'}), 400
+        
+        resolved = storage_urls.resolve_many(paths)
         return jsonify({
-            'publicUrl': f"{SUPABASE_URL}/storage/v1/object/public/course-materials/{path}"
+            'urls': {path: describe_storage_url(value) if value else None for path, value in resolved.items()}
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def delete_storage_object(path):
+    with metrics.STORAGE_REQUEST_DURATION.time(operation='delete'):
+        response = http_session.delete(
+            f"{SUPABASE_URL}/storage/v1/object/course-materials/{path}",
+            headers=get_admin_headers()
+        )
+    storage_urls.invalidate(path)
+    if response.status_code != 200:
+        return False
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    dedup.forget_object(cursor, path)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return True
+
+# Vacuum or rebuild the embeddings indexes of each vector node in the background after deletions
+index_maintainers = [
+    deletion.IndexMaintainer(lambda node=node: db_router.connect(**node.primary))
+    for node in db_router.vector_nodes()
+]
+
+def delete_materials_cascade(material_ids=(), file_paths=()):
+    """
+    Delete materials with their chunks and storage objects, then schedule index
+    maintenance. Returns the deletion report.
+    """
+    conn = get_db_connection()
+    # The material's course is not known up front, so every shard is cleaned
+    vector_conns = [db_router.connect(**node.primary) for node in db_router.shards]
+    try:
+        report = deletion.delete_materials(
+            conn, material_ids=material_ids, file_paths=file_paths,
+            delete_object=delete_storage_object, vector_conns=vector_conns
+        )
+    finally:
+        for vector_conn in vector_conns:
+            vector_conn.close()
+        conn.close()
+    for course_id in report['courses']:
+        course_stats_cache.invalidate(course_id)
+        faq_index.invalidate(course_id)
+    if report['embeddings_deleted']:
+        for maintainer in index_maintainers:
+            maintainer.schedule()
+    report['last_maintenance'] = [maintainer.last_run for maintainer in index_maintainers]
+    return report
+
+@app.route('/api/storage/dedup', methods=['GET'])
+def get_dedup_stats():
+    try:
+        conn = db_router.read()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        stats = dedup.dedup_stats(cursor)
+        cursor.close()
+        conn.close()
+        return jsonify(stats)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/storage/delete', methods=['DELETE'])
 def delete_file():
     try:
@@ -888,17 +1559,91 @@ def delete_file():
         if not path:
             return jsonify({'error': 'Path is required'}), 400
         
-        response = requests.delete(
-            f"{SUPABASE_URL}/storage/v1/object/course-materials/{path}",
-            headers=get_admin_headers()
-        )
+        # Also removes the materials row and chunks that came from this file
+        report = delete_materials_cascade(file_paths=[path])
         
-        if response.status_code != 200:
+        if report['storage_failed'] and not report['materials_deleted'] and not report['embeddings_deleted']:
             return jsonify({'error': 'Error deleting file'}), 500
         
-        return jsonify({'success': True})
+        return jsonify({'success': True, **report})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Delete material endpoint - DELETE /api/materials/<material_id>
+@app.route('/api/materials/<material_id>', methods=['DELETE'])
+def delete_material(material_id):
+    auth_header = request.headers.get('Authorization')
+    user = get_current_user(auth_header)
+    
+    if not user:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(
+            """
+            SELECT c.professor_id FROM materials m
+            JOIN courses c ON c.id = m.course_id
+            WHERE m.id::text = %s
+            """,
+            (material_id,)
+        )
+        material = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        if not material or str(material['professor_id']) != user['id']:
+            return jsonify({'error': 'Material not found'}), 404
+        
+        report = delete_materials_cascade(material_ids=[material_id])
+        return jsonify({'success': True, **report})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def warm_up():
+    """
+    Do the first-request work up front: create the OpenAI client, open a
+    connection to every database node and load the course search parameters,
+    open the Supabase HTTP connection, and load the re-ranking model when
+    re-ranking is on. Call before the worker accepts traffic, e.g. from a WSGI
+    server's post-fork hook. Returns the seconds each step took.
+    """
+    def timed(name, step):
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"Warning: warm-up step {name} failed: {e}")
+        timings[name] = round(time.perf_counter() - start, 4)
+
+    def prime_database():
+        for node in db_router.vector_nodes():
+            conn = db_router.connect(**node.primary)
+            cursor = conn.cursor()
+            course_stats_cache.prime(cursor, embedding_provider.model_name)
+            cursor.close()
+            conn.close()
+        if db_router.sharded:
+            get_db_connection().close()
+
+    def open_storage_connection():
+        if SUPABASE_URL:
+            http_session.head(f"{SUPABASE_URL}/storage/v1/", headers=get_anon_headers(), timeout=5)
+
+    def import_numeric_modules():
+        # Used by the analytics, session and statistics paths of the first requests
+        import numpy  # noqa: F401
+
+    timings = {}
+    timed('openai_client', lambda: gateway.client)
+    timed('numpy', import_numeric_modules)
+    timed('database', prime_database)
+    timed('storage', open_storage_connection)
+    if reranking.RERANK_ENABLED:
+        timed('reranker', lambda: reranking.get_reranker().available())
+    return timings
+
 if __name__ == '__main__':
+    if settings.warm_up:
+        print(f"Warm-up: {warm_up()}")
     app.run(debug=True, port=8000)
@@ -0,0 +1,162 @@
+"""
+Deterministic fixtures shared by the benchmarks.
+
+HashEmbedder stands in for the OpenAI embedding model: every token maps to a
+fixed pseudo-random unit vector and a text embeds to the normalised sum of its
+tokens, so texts that share words are close in cosine space. make_corpus builds
+a seeded corpus of courses, materials and queries with a known target material
+for every query.
+"""
+
+import re
+import time
+import zlib
+import uuid
+import random
+
+import numpy as np
+
+from embedding_providers import EmbeddingProvider
+from reranking import Reranker
+
+EMBEDDING_DIM = 1536
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+GENERAL_WORDS = (
+    "the of and to in is for on that with as by this are be from at it an which "
+    "we can will students course week lecture assignment example problem section"
+).split()
+
+TOPIC_WORDS = {
+    "linear_algebra": "matrix vector eigenvalue eigenvector determinant basis span rank kernel orthogonal projection".split(),
+    "calculus": "derivative integral limit continuity series convergence gradient chain rule taylor".split(),
+    "probability": "random variable distribution expectation variance bayes conditional independence sample likelihood".split(),
+    "algorithms": "sorting graph dynamic programming greedy complexity recursion heap hashing shortest path".split(),
+    "databases": "index query transaction join schema normalization btree lock isolation replication".split(),
+    "networks": "packet router protocol latency bandwidth congestion tcp routing socket handshake".split(),
+    "logistics": "deadline office hours grading midterm final exam late policy syllabus submission".split(),
+    "machine_learning": "model training loss overfitting regularization neural network feature classifier dataset".split(),
+}
+
+class HashEmbedder(EmbeddingProvider):
+    """
+    Deterministic bag-of-words embedding provider with the same dimension as the real model.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, seed=0):
+        self.dim = dim
+        self.dimension = dim
+        self.model_name = f"hash-stub-{dim}"
+        self.seed = seed
+        self.calls = 0
+        self._token_vectors = {}
+
+    def token_vector(self, token):
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            rng = np.random.default_rng((zlib.crc32(token.encode('utf-8')) << 16) ^ self.seed)
+            vector = rng.standard_normal(self.dim).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+            self._token_vectors[token] = vector
+        return vector
+
+    def embed_array(self, text):
+        self.calls += 1
+        tokens = _TOKEN.findall(text.lower())
+        if not tokens:
+            return np.zeros(self.dim, dtype=np.float32)
+        vector = np.sum([self.token_vector(token) for token in tokens], axis=0)
+        return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+    def embed(self, texts, lane=None):
+        return [self.embed_array(text).tolist() for text in texts]
+
+class OverlapReranker(Reranker):
+    """
+    Stand-in cross-encoder scoring a pair by the share of query tokens found in
+    the chunk, with an optional per-batch delay to simulate model cost.
+    """
+
+    def __init__(self, batch_latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.batch_latency = batch_latency
+
+    def available(self):
+        return True
+
+    def predict(self, pairs):
+        if self.batch_latency:
+            time.sleep(self.batch_latency)
+        scores = []
+        for query, content in pairs:
+            query_tokens = set(_TOKEN.findall(query.lower()))
+            content_tokens = set(_TOKEN.findall(content.lower()))
+            scores.append(len(query_tokens & content_tokens) / max(1, len(query_tokens)))
+        return scores
+
+def make_text(rng, topic, sentences, keywords=()):
+    topic_words = TOPIC_WORDS[topic]
+    lines = []
+    for _ in range(sentences):
+        words = []
+        for _ in range(rng.randint(8, 20)):
+            roll = rng.random()
+            if keywords and roll < 0.15:
+                words.append(rng.choice(keywords))
+            elif roll < 0.75:
+                words.append(rng.choice(topic_words))
+            else:
+                words.append(rng.choice(GENERAL_WORDS))
+        lines.append(" ".join(words).capitalize() + ".")
+    return "\n".join(lines)
+
+def make_corpus(seed=0, courses=3, materials_per_course=20, queries_per_course=30, sentences=(20, 200)):
+    """
+    Build a seeded corpus.
+
+    Every material mixes its topic's vocabulary with a few keywords unique to it,
+    and every query combines topic words with keywords of one target material.
+
+    Returns a list of courses, each a dict with `id`, `materials` (id, title,
+    topic, material_type, keywords, text) and `queries` (text, target material id).
+    """
+    rng = random.Random(seed)
+    topics = sorted(TOPIC_WORDS)
+    corpus = []
+    for c in range(courses):
+        course_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        course_topics = rng.sample(topics, k=min(4, len(topics)))
+        materials = []
+        for i in range(materials_per_course):
+            topic = course_topics[i % len(course_topics)]
+            keywords = [f"{topic.split('_')[0]}{c}x{i}k{j}" for j in range(3)]
+            materials.append({
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "title": f"{topic.replace('_', ' ').title()} notes {i}",
+                "topic": topic,
+                "material_type": rng.choice(["lecture_notes", "transcript", "syllabus", "slideshow"]),
+                "keywords": keywords,
+                "text": make_text(rng, topic, rng.randint(*sentences), keywords),
+            })
+        queries = []
+        for _ in range(queries_per_course):
+            target = rng.choice(materials)
+            words = rng.sample(TOPIC_WORDS[target["topic"]], k=4) + rng.sample(target["keywords"], k=2)
+            rng.shuffle(words)
+            queries.append({
+                "text": "Explain " + " ".join(words) + "?",
+                "target_material_id": target["id"],
+            })
+        corpus.append({"id": course_id, "materials": materials, "queries": queries})
+    return corpus
+
+def percentiles(samples, points=(50, 90, 95, 99)):
+    """Latency percentiles in milliseconds from a list of seconds."""
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    summary = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in points}
+    summary["mean"] = round(float(values.mean()), 3)
+    summary["count"] = len(samples)
+    return summary
@@ -0,0 +1,103 @@
+"""
+Hierarchical versus flat retrieval benchmark.
+
+Ingests a seeded corpus of many long materials through /api/materials/process,
+which also builds the material and section summaries, and runs the same queries
+with semantic_search in flat mode and in hierarchical mode at several probe
+sizes (materials kept after the first stage). For each it reports latency
+percentiles, recall@k against brute-force NumPy ground truth over every chunk
+of the course, and the hit rate of the material each query was generated from.
+
+Everything runs in its own throwaway schema, with OpenAI replaced by the
+deterministic HashEmbedder, as in bench.retrieval.
+
+Run from the backend directory with SUPABASE_HOST/DATABASE/USER/PASSWORD set:
+    python -m bench.hierarchical --materials 80 --probe-materials 4,8,16 --output hierarchical.json
+"""
+
+import sys
+import json
+import time
+import argparse
+
+from bench import retrieval
+from bench.fixtures import HashEmbedder, make_corpus
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--courses', type=int, default=2)
+    parser.add_argument('--materials', type=int, default=80, help='materials per course')
+    parser.add_argument('--min-sentences', type=int, default=50)
+    parser.add_argument('--max-sentences', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=50, help='queries per course')
+    parser.add_argument('--k', type=int, default=None, help="results per query; defaults to each course's adaptive count")
+    parser.add_argument('--index', choices=['none', 'ivfflat', 'hnsw'], default='hnsw', help='chunk index used by flat search')
+    parser.add_argument('--probe-materials', default='4,8,16', help='comma-separated HIERARCHY_MATERIALS values to try')
+    parser.add_argument('--probe-sections', type=int, default=None, help='HIERARCHY_SECTIONS; defaults to the setting')
+    parser.add_argument('--output', default='hierarchical_benchmark.json')
+    return parser.parse_args(argv)
+
+def summary_counts(app):
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT count(*) FILTER (WHERE section = -1), count(*) FILTER (WHERE section >= 0) FROM material_summaries')
+    materials, sections = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return {"materials": materials, "sections": sections}
+
+def main(argv=None):
+    args = parse_args(argv)
+    retrieval.BENCH_SCHEMA = "bench_hierarchical"
+    app = retrieval.load_app()
+    import material_summaries
+
+    embedder = HashEmbedder(seed=args.seed)
+    app.embedding_provider = embedder
+    app.ingestor.provider = embedder
+
+    corpus = make_corpus(
+        seed=args.seed, courses=args.courses, materials_per_course=args.materials,
+        queries_per_course=args.queries, sentences=(args.min_sentences, args.max_sentences)
+    )
+
+    retrieval.prepare_schema(app)
+    ingestion, material_ids = retrieval.ingest(app, corpus)
+    retrieval.build_index(app, args.index)
+
+    if args.probe_sections:
+        material_summaries.HIERARCHY_SECTIONS = args.probe_sections
+    runs = []
+    material_summaries.SEARCH_MODE = material_summaries.FLAT
+    search, recall = retrieval.evaluate_search(app, embedder, corpus, material_ids, args.k)
+    runs.append({"mode": "flat", "latency_ms": search["latency_ms"], **recall})
+    material_summaries.SEARCH_MODE = material_summaries.HIERARCHICAL
+    for materials in [int(value) for value in args.probe_materials.split(',') if value.strip()]:
+        material_summaries.HIERARCHY_MATERIALS = materials
+        search, recall = retrieval.evaluate_search(app, embedder, corpus, material_ids, args.k)
+        runs.append({
+            "mode": "hierarchical",
+            "materials": materials,
+            "sections": material_summaries.HIERARCHY_SECTIONS,
+            "latency_ms": search["latency_ms"],
+            **recall,
+        })
+
+    results = {
+        "benchmark": "hierarchical",
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "git_commit": retrieval.git_commit(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "ingestion": ingestion,
+        "summaries": summary_counts(app),
+        "courses": search["courses"],
+        "runs": runs,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Load benchmark of the Flask API against local stand-ins for its services.
+
+Starts the stubs of bench/stubs.py in their own process and the app in another,
+with OpenAI and Supabase pointed at the stubs and every database connection
+pinned to a throwaway schema of a local Postgres with pgvector. Then:
+1. seeds a generated corpus through /api/materials/process,
+2. replays the scenario's mix of chat, search, materials listing and upload
+   requests at its target rate, open loop: requests are sent on a Poisson (or
+   evenly spaced) schedule whatever the app's latency, and each latency is
+   measured from the scheduled send time, so queueing in the app is not hidden.
+3. reports per route and overall: requests, achieved throughput, latency
+   percentiles, 4xx, 5xx and transport failures, plus the stubs' request and
+   429 counts and the app's OpenAI gateway metrics.
+
+Scenarios are JSON files in bench/scenarios. Bump a scenario's `version`
+whenever its workload changes; results carry its name, version and content
+hash so runs are only compared like for like.
+
+Run from the backend directory with SUPABASE_HOST/DATABASE/USER/PASSWORD set to
+a local Postgres that has the vector extension available:
+    python -m bench.load --scenario mixed --output load.json
+or point it at an app that is already running with --url.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import random
+import hashlib
+import argparse
+import threading
+import subprocess
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+
+from bench import stubs
+from bench.fixtures import make_corpus, make_text, percentiles
+
+SCENARIO_DIR = os.path.join(os.path.dirname(__file__), 'scenarios')
+BENCH_SCHEMA = "bench_load"
+ROUTES = ('chat', 'search', 'listing', 'upload', 'storage_upload')
+SEED_CONCURRENCY = 4
+UPLOAD_TEXTS = 32
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a mixed workload against the API with stubbed services.")
+    parser.add_argument('--scenario', default='mixed', help='name in bench/scenarios or path to a scenario file')
+    parser.add_argument('--rps', type=float, help="target requests per second; defaults to the scenario's")
+    parser.add_argument('--duration', type=float, help="measured seconds; defaults to the scenario's")
+    parser.add_argument('--url', help='load an app that is already running instead of starting one with the stubs')
+    parser.add_argument('--port', type=int, default=0, help='port for the app; any free port by default')
+    parser.add_argument('--app-log', default='load_app.log', help="where the app's output goes")
+    parser.add_argument('--output', default='load_benchmark.json')
+    # Internal: run as the app process
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--stub-url', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def load_scenario(name):
+    path = name if name.endswith('.json') else os.path.join(SCENARIO_DIR, f"{name}.json")
+    with open(path, 'rb') as f:
+        raw = f.read()
+    scenario = json.loads(raw)
+    unknown = set(scenario['mix']) - set(ROUTES)
+    if unknown:
+        raise ValueError(f"Unknown routes in scenario {scenario['name']}: {', '.join(sorted(unknown))}")
+    return scenario, hashlib.sha256(raw).hexdigest()[:16]
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip()
+    except Exception:
+        return None
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def app_environment(stub_url):
+    return {
+        'OPENAI_API_KEY': 'bench-stub',
+        'OPENAI_BASE_URL': f"{stub_url}/v1",
+        'NEXT_PUBLIC_SUPABASE_URL': stub_url,
+        'SUPABASE_SERVICE_ROLE': 'bench-stub',
+        'SUPABASE_ANON_PUBLIC': 'bench-stub',
+    }
+
+def serve_app(args):
+    """
+    App process: point the app at the stubs, create the benchmark schema, warm
+    up and serve on the threaded development server.
+    """
+    # A developer .env is loaded first and must not point the app back at the real services
+    import load_env
+    load_env.load_env()
+    os.environ.update(app_environment(args.stub_url))
+    load_env.load_env = lambda: None
+
+    import dedup
+    import analytics
+    import faq
+    from bench import retrieval
+    retrieval.BENCH_SCHEMA = BENCH_SCHEMA
+    app = retrieval.load_app()
+    retrieval.prepare_schema(app)
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    # Tables the chat and listing paths read besides those of the retrieval benchmark
+    cursor.execute('''
+        CREATE TABLE course_versions (
+            course_id UUID PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    cursor.execute(analytics.CREATE_TABLES_SQL)
+    cursor.execute(faq.CREATE_TABLE_SQL)
+    cursor.execute(dedup.CREATE_TABLES_SQL)
+    cursor.close()
+    conn.close()
+
+    if app.settings.warm_up:
+        print(f"Warm-up: {app.warm_up()}", flush=True)
+    app.app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+def start_stubs(settings):
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    process = context.Process(target=stubs.run_forever, args=(settings, 0, ready), daemon=True)
+    process.start()
+    return process, ready.get(timeout=30)
+
+def start_app(args, stub_url, log):
+    port = args.port or free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'bench.load', '--serve', '--port', str(port), '--stub-url', stub_url],
+        stdout=log, stderr=subprocess.STDOUT, env=os.environ.copy()
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited with {process.returncode}; see {args.app_log}")
+        try:
+            if requests.get(f"{url}/metrics", timeout=1).status_code == 200:
+                return process, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"App did not start within 120s; see {args.app_log}")
+
+class LoadGenerator:
+    def __init__(self, url, scenario):
+        self.url = url
+        self.scenario = scenario
+        self.rng = random.Random(scenario.get('seed', 0))
+        self.timeout = scenario.get('timeout_seconds', 30)
+        self.courses = []
+        self.users = [str(uuid.UUID(int=self.rng.getrandbits(128))) for _ in range(50)]
+        self._local = threading.local()
+
+        spec = scenario['corpus']
+        self.corpus = make_corpus(
+            seed=scenario.get('seed', 0),
+            courses=spec['courses'],
+            materials_per_course=spec['materials_per_course'],
+            queries_per_course=spec['queries_per_course'],
+            sentences=tuple(spec.get('sentences', (20, 200)))
+        )
+        topics = sorted({material['topic'] for course in self.corpus for material in course['materials']})
+        self.upload_texts = [
+            make_text(self.rng, self.rng.choice(topics), self.rng.randint(*scenario.get('upload_sentences', (20, 80))))
+            for _ in range(UPLOAD_TEXTS)
+        ]
+
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def seed(self):
+        """Upload the corpus through the API. Returns the seeding report."""
+        def upload(args):
+            course, material = args
+            response = self.session().post(
+                f"{self.url}/api/materials/process",
+                files={'file': (f"{material['id']}.txt", material['text'].encode('utf-8'), 'text/plain')},
+                data={'course_id': course['id'], 'material_type': material['material_type'], 'title': material['title']},
+                timeout=120
+            )
+            response.raise_for_status()
+            return response.json()['chunks_processed']
+
+        start = time.perf_counter()
+        work = [(course, material) for course in self.corpus for material in course['materials']]
+        with ThreadPoolExecutor(max_workers=SEED_CONCURRENCY) as pool:
+            chunks = sum(pool.map(upload, work))
+        self.courses = self.corpus
+        return {'materials': len(work), 'chunks': chunks, 'seconds': round(time.perf_counter() - start, 3)}
+
+    def build_request(self, route):
+        course = self.rng.choice(self.courses)
+        if route == 'chat':
+            return 'POST', '/api/chat', {'json': {
+                'query': self.rng.choice(course['queries'])['text'],
+                'course_id': course['id'],
+                'user_id': self.rng.choice(self.users),
+            }}
+        if route == 'search':
+            return 'POST', '/api/search', {'json': {'query': self.rng.choice(course['queries'])['text'], 'course_id': course['id']}}
+        if route == 'listing':
+            return 'GET', f"/api/courses/{course['id']}/materials", {'params': {'limit': 50}}
+        name = f"{uuid.UUID(int=self.rng.getrandbits(128))}.txt"
+        text = self.rng.choice(self.upload_texts).encode('utf-8')
+        if route == 'upload':
+            return 'POST', '/api/materials/process', {
+                'files': {'file': (name, text, 'text/plain')},
+                'data': {'course_id': course['id'], 'material_type': 'lecture_notes', 'title': name},
+            }
+        return 'POST', '/api/storage/upload', {
+            'files': {'file': (name, text, 'text/plain')},
+            'data': {'path': f"{course['id']}/{name}"},
+        }
+
+    def send(self, route, request, scheduled):
+        method, path, kwargs = request
+        started = time.perf_counter()
+        status, failure = None, None
+        try:
+            response = self.session().request(method, f"{self.url}{path}", timeout=self.timeout, **kwargs)
+            response.content
+            status = response.status_code
+        except requests.RequestException as e:
+            failure = type(e).__name__
+        finished = time.perf_counter()
+        return {
+            'route': route,
+            'status': status,
+            'failure': failure,
+            'latency': finished - scheduled,
+            'service': finished - started,
+            'lag': started - scheduled,
+        }
+
+    def run(self, rps, duration):
+        """Send `rps` requests per second for `duration` seconds, open loop. Returns the samples and elapsed seconds."""
+        routes, weights = zip(*sorted(self.scenario['mix'].items()))
+        poisson = self.scenario.get('arrival', 'poisson') == 'poisson'
+        pool = ThreadPoolExecutor(max_workers=self.scenario.get('max_in_flight', 256))
+        futures = []
+        offset = 0.0
+        start = time.perf_counter()
+        while True:
+            offset += self.rng.expovariate(rps) if poisson else 1 / rps
+            if offset >= duration:
+                break
+            route = self.rng.choices(routes, weights)[0]
+            request = self.build_request(route)
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(self.send, route, request, scheduled))
+        wait(futures)
+        elapsed = time.perf_counter() - start
+        pool.shutdown()
+        return [future.result() for future in futures], elapsed
+
+def summarize(samples, elapsed):
+    statuses = Counter(sample['status'] or sample['failure'] for sample in samples)
+    ok = sum(1 for sample in samples if sample['status'] is not None and sample['status'] < 400)
+    client_errors = sum(1 for sample in samples if sample['status'] is not None and 400 <= sample['status'] < 500)
+    server_errors = sum(1 for sample in samples if sample['status'] is not None and sample['status'] >= 500)
+    failures = sum(1 for sample in samples if sample['failure'])
+    return {
+        'requests': len(samples),
+        'ok': ok,
+        'client_errors': client_errors,
+        'server_errors': server_errors,
+        'failures': failures,
+        'error_rate': round((server_errors + failures) / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(ok / elapsed, 3),
+        'latency_ms': percentiles([sample['latency'] for sample in samples]),
+        'service_ms': percentiles([sample['service'] for sample in samples]),
+        'status_codes': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+def gateway_metrics(url):
+    """OpenAI gateway and coalescing counters from the app's /metrics."""
+    prefixes = ('openai_throttled_total', 'openai_retries_total', 'singleflight_requests_total', 'faq_lookups_total')
+    try:
+        text = requests.get(f"{url}/metrics", timeout=5).text
+    except requests.RequestException:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        if line.startswith(prefixes):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve:
+        return serve_app(args)
+
+    scenario, scenario_hash = load_scenario(args.scenario)
+    rps = args.rps or scenario['rps']
+    duration = args.duration or scenario['duration_seconds']
+
+    stub_process = app_process = None
+    stub_url = None
+    log = open(args.app_log, 'w')
+    try:
+        url = args.url
+        if not url:
+            stub_process, stub_url = start_stubs(scenario.get('stubs', {}))
+            app_process, url = start_app(args, stub_url, log)
+
+        generator = LoadGenerator(url, scenario)
+        seeding = generator.seed()
+        print(f"Seeded {seeding['materials']} materials ({seeding['chunks']} chunks) in {seeding['seconds']}s")
+        if scenario.get('warmup_seconds'):
+            generator.run(rps, scenario['warmup_seconds'])
+        metrics_before = gateway_metrics(url)
+        stubs_before = requests.get(f"{stub_url}/_stats", timeout=5).json() if stub_url else None
+
+        samples, elapsed = generator.run(rps, duration)
+
+        metrics_after = gateway_metrics(url)
+        stub_stats = None
+        if stub_url:
+            stubs_after = requests.get(f"{stub_url}/_stats", timeout=5).json()
+            stub_stats = {
+                key: {name: count - stubs_before[key].get(name, 0) for name, count in stubs_after[key].items()}
+                for key in ('requests', 'throttled')
+            }
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+        if stub_process is not None:
+            stub_process.terminate()
+        log.close()
+
+    routes = {route: summarize([s for s in samples if s['route'] == route], elapsed) for route in sorted(scenario['mix'])}
+    results = {
+        'benchmark': 'load',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'scenario': {'name': scenario['name'], 'version': scenario['version'], 'sha256': scenario_hash},
+        'config': {'target_rps': rps, 'duration_seconds': duration, 'url': args.url or 'local', 'seeding': seeding},
+        'overall': {
+            **summarize(samples, elapsed),
+            'achieved_rps': round(len(samples) / elapsed, 3),
+            # How late the generator sent requests; large values mean the harness, not the app, was the bottleneck
+            'send_lag_ms': percentiles([sample['lag'] for sample in samples]),
+        },
+        'routes': routes,
+        'stubs': stub_stats,
+        'app_metrics': {name: value - metrics_before.get(name, 0) for name, value in metrics_after.items()},
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Offline retrieval benchmark.
+
+Runs the real Flask handlers and SQL against a local Postgres with pgvector, with
+OpenAI replaced by the deterministic HashEmbedder and a mocked chat completion.
+Everything is created inside a throwaway schema, so the benchmark can point at a
+development database without touching its tables.
+
+Measures:
+- ingestion throughput of /api/materials/process (chunks/sec)
+- semantic_search latency percentiles
+- recall@k of match_documents against brute-force NumPy ground truth, and the
+  hit rate of the material each query was generated from
+- end-to-end /api/chat latency with a mocked LLM
+
+Results are written as JSON so runs can be compared across releases.
+
+Run from the backend directory with SUPABASE_HOST/DATABASE/USER/PASSWORD set to
+a local Postgres that has the vector extension available:
+    python -m bench.retrieval --output retrieval.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import subprocess
+
+import numpy as np
+from psycopg2.extras import RealDictCursor
+
+import embedding_providers
+import reranking
+from bench.fixtures import HashEmbedder, OverlapReranker, make_corpus, percentiles
+
+BENCH_SCHEMA = "bench_retrieval"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--courses', type=int, default=3)
+    parser.add_argument('--materials', type=int, default=20, help='materials per course')
+    parser.add_argument('--queries', type=int, default=50, help='queries per course')
+    parser.add_argument('--k', type=int, default=None, help="results per query; defaults to each course's adaptive count")
+    parser.add_argument('--index', choices=['none', 'ivfflat', 'hnsw'], default='hnsw')
+    parser.add_argument('--rerank', action='store_true', help='re-rank over-fetched candidates with a stub cross-encoder')
+    parser.add_argument('--rerank-batch-latency-ms', type=float, default=0.0, help='simulated cross-encoder cost per batch')
+    parser.add_argument('--llm-latency-ms', type=float, default=0.0, help='simulated chat completion latency')
+    parser.add_argument('--output', default='retrieval_benchmark.json')
+    return parser.parse_args(argv)
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip()
+    except Exception:
+        return None
+
+def load_app():
+    """
+    Import the app with all connections pinned to the benchmark schema.
+    """
+    # libpq applies PGOPTIONS to every connection the app opens
+    os.environ['PGOPTIONS'] = f"-c search_path={BENCH_SCHEMA},public"
+    os.environ.setdefault('OPENAI_API_KEY', 'bench-stub')
+    import app
+    return app
+
+def prepare_schema(app):
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS vector SCHEMA public;')
+    cursor.execute(f'DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE;')
+    cursor.execute(f'CREATE SCHEMA {BENCH_SCHEMA};')
+    # Same shape as the production tables, minus the foreign keys into auth
+    cursor.execute('''
+        CREATE TABLE materials (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            file_name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_type TEXT,
+            file_size BIGINT,
+            material_type TEXT,
+            course_id UUID,
+            processed BOOLEAN DEFAULT FALSE,
+            chunks_count INTEGER DEFAULT 0,
+            content_sha256 TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    cursor.execute('''
+        CREATE TABLE queries (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            user_id UUID,
+            course_id UUID,
+            query TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    cursor.close()
+    conn.close()
+
+    # Create embeddings and match_documents through the app's own setup path
+    response = app.app.test_client().post('/api/setup-vector-store')
+    if response.status_code != 200:
+        raise RuntimeError(f"Vector store setup failed: {response.get_json()}")
+
+def build_index(app, kind):
+    """
+    Replace the index created by the setup endpoint with the one under test, built
+    after ingestion so ivfflat trains on the real data.
+    """
+    provider = app.embedding_provider
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'DROP INDEX IF EXISTS embeddings_{embedding_providers.index_suffix(provider.model_name)}_idx;')
+    if kind == 'none':
+        cursor.close()
+        conn.close()
+        return
+    cursor.execute('SELECT count(*) FROM embeddings')
+    rows = cursor.fetchone()[0]
+    # Same partial expression index shape the app creates for its own model
+    column = f"(embedding::vector({provider.dimension}))"
+    if kind == 'ivfflat':
+        lists = max(1, int(np.sqrt(rows)))
+        cursor.execute(
+            f'CREATE INDEX ON embeddings USING ivfflat ({column} vector_cosine_ops) WITH (lists = {lists}) WHERE embedding_model = %s;',
+            (provider.model_name,)
+        )
+    else:
+        cursor.execute(
+            f'CREATE INDEX ON embeddings USING hnsw ({column} vector_cosine_ops) WHERE embedding_model = %s;',
+            (provider.model_name,)
+        )
+    cursor.execute('ANALYZE embeddings;')
+    cursor.close()
+    conn.close()
+
+def ingest(app, corpus):
+    """
+    Upload every material through /api/materials/process and time it.
+
+    Returns the throughput summary and a map from fixture material id to the id
+    assigned by the app.
+    """
+    client = app.app.test_client()
+    material_ids = {}
+    chunks = 0
+    start = time.perf_counter()
+    for course in corpus:
+        for material in course["materials"]:
+            response = client.post('/api/materials/process', data={
+                'file': (io.BytesIO(material["text"].encode('utf-8')), f"{material['id']}.txt", 'text/plain'),
+                'material_type': material["material_type"],
+                'course_id': course["id"],
+                'title': material["title"],
+            }, content_type='multipart/form-data')
+            body = response.get_json()
+            if response.status_code != 200:
+                raise RuntimeError(f"Ingestion failed: {body}")
+            material_ids[material["id"]] = body["material_id"]
+            chunks += body["chunks_processed"]
+    elapsed = time.perf_counter() - start
+    materials = len(material_ids)
+    return {
+        "materials": materials,
+        "chunks": chunks,
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(chunks / elapsed, 2),
+        "materials_per_sec": round(materials / elapsed, 2),
+    }, material_ids
+
+def load_course_vectors(app, course_id):
+    conn = app.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, embedding::text FROM embeddings WHERE metadata->>'courseId' = %s",
+        (course_id,)
+    )
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    ids = [row[0] for row in rows]
+    matrix = np.array([np.fromstring(row[1].strip('[]'), sep=',', dtype=np.float32) for row in rows])
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return ids, matrix
+
+def course_search_params(app, course_id):
+    conn = app.get_db_connection()
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    params = app.course_stats_cache.get(cursor, course_id, app.embedding_provider.model_name)
+    cursor.close()
+    conn.close()
+    return params
+
+def exact_top_k(ids, matrix, query_vector, k, threshold):
+    scores = matrix @ query_vector
+    order = np.argsort(-scores)[:k]
+    return [ids[i] for i in order if scores[i] > threshold]
+
+def evaluate_search(app, embedder, corpus, material_ids, k, rerank=False):
+    latencies = []
+    recalls = []
+    hits = 0
+    total = 0
+    course_params = {}
+    for course in corpus:
+        ids, matrix = load_course_vectors(app, course["id"])
+        threshold, course_k = course_search_params(app, course["id"])
+        course_params[course["id"]] = {"threshold": round(threshold, 4), "k": course_k, "chunks": len(ids)}
+        for query in course["queries"]:
+            start = time.perf_counter()
+            results = app.semantic_search(query["text"], course["id"], limit=k, rerank=rerank)
+            latencies.append(time.perf_counter() - start)
+
+            returned = [row["id"] for row in results]
+            expected = exact_top_k(ids, matrix, embedder.embed_array(query["text"]), k or course_k, threshold)
+            if expected:
+                recalls.append(len(set(returned) & set(expected)) / len(expected))
+
+            target = material_ids[query["target_material_id"]]
+            hits += any(row["metadata"].get("materialId") == target for row in results)
+            total += 1
+    return {
+        "latency_ms": percentiles(latencies),
+        "courses": course_params,
+    }, {
+        "k": k,
+        "recall_at_k": round(float(np.mean(recalls)), 4) if recalls else None,
+        "queries_with_ground_truth": len(recalls),
+        "target_hit_rate": round(hits / total, 4) if total else None,
+    }
+
+def mock_chat_completion(latency):
+    def create_chat_completion(messages, model, max_tokens=None, lane=None, **kwargs):
+        if latency:
+            time.sleep(latency)
+        message = types.SimpleNamespace(content="Mocked answer.")
+        usage = types.SimpleNamespace(prompt_tokens=sum(len(m["content"]) // 4 for m in messages), completion_tokens=3, total_tokens=0)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+    return create_chat_completion
+
+def evaluate_chat(app, corpus):
+    client = app.app.test_client()
+    latencies = []
+    for course in corpus:
+        for query in course["queries"]:
+            start = time.perf_counter()
+            response = client.post('/api/chat', json={'query': query["text"], 'course_id': course["id"]})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"Chat failed: {response.get_json()}")
+    return {"latency_ms": percentiles(latencies)}
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = load_app()
+
+    embedder = HashEmbedder(seed=args.seed)
+    app.embedding_provider = embedder
+    app.ingestor.provider = embedder
+    app.gateway.create_chat_completion = mock_chat_completion(args.llm_latency_ms / 1000)
+    if args.rerank:
+        reranking._reranker = OverlapReranker(batch_latency=args.rerank_batch_latency_ms / 1000)
+
+    corpus = make_corpus(seed=args.seed, courses=args.courses, materials_per_course=args.materials, queries_per_course=args.queries)
+
+    prepare_schema(app)
+    ingestion, material_ids = ingest(app, corpus)
+    build_index(app, args.index)
+    search, recall = evaluate_search(app, embedder, corpus, material_ids, args.k, rerank=args.rerank)
+    chat = evaluate_chat(app, corpus)
+
+    results = {
+        "benchmark": "retrieval",
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": vars(args),
+        "ingestion": ingestion,
+        "search": search,
+        "recall": recall,
+        "chat": chat,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Microbenchmark for API response serialization.
+
+Compares Flask's default JSON provider against the fast provider in
+serialization.py on payloads shaped like real responses, and reports the
+cost and ratio of response compression.
+
+Run from the backend directory:
+    python -m bench.serialization
+"""
+
+import gzip
+import time
+import uuid
+import random
+import decimal
+import datetime
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import serialization
+
+def make_search_payload(rows=20, seed=0):
+    """Rows shaped like match_documents output: content, JSONB metadata, similarity."""
+    rng = random.Random(seed)
+    words = ["gradient", "lecture", "matrix", "syllabus", "exam", "vector", "proof", "lemma"]
+    results = []
+    for i in range(rows):
+        material_id = str(uuid.UUID(int=rng.getrandbits(128)))
+        results.append({
+            "id": f"{material_id}_chunk_{i}",
+            "content": " ".join(rng.choice(words) for _ in range(160)),
+            "similarity": rng.random(),
+            "metadata": {
+                "materialId": material_id,
+                "courseId": str(uuid.UUID(int=rng.getrandbits(128))),
+                "title": f"Lecture {i}",
+                "type": "lecture_notes",
+                "description": "Week notes",
+                "chunkIndex": i,
+                "totalChunks": 40,
+            },
+        })
+    return {"results": results}
+
+def make_materials_payload(rows=2000, seed=0):
+    """Rows shaped like a materials listing straight from psycopg2."""
+    rng = random.Random(seed)
+    course_id = uuid.UUID(int=rng.getrandbits(128))
+    base = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    materials = []
+    for i in range(rows):
+        materials.append({
+            "id": uuid.UUID(int=rng.getrandbits(128)),
+            "file_name": f"lecture_{i:04d}.pdf",
+            "file_path": f"{course_id}/lecture_{i:04d}.pdf",
+            "file_type": "application/pdf",
+            "file_size": rng.randint(10_000, 50_000_000),
+            "material_type": "slideshow",
+            "course_id": course_id,
+            "processed": True,
+            "chunks_count": rng.randint(1, 300),
+            "created_at": base + datetime.timedelta(minutes=i),
+            "score": decimal.Decimal("0.75"),
+        })
+    return {"materials": materials, "next_cursor": None}
+
+def bench(fn, payload, repeat):
+    fn(payload)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(payload)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = serialization.FastJSONProvider(app)
+
+    payloads = {
+        "search (20 rows)": (make_search_payload(), 2000),
+        "materials (2000 rows)": (make_materials_payload(), 50),
+    }
+
+    backend = "orjson" if serialization.orjson is not None else "json"
+    print(f"Fast provider backend: {backend}")
+    print(f"{'payload':<24}{'default ms':>12}{'fast ms':>10}{'speedup':>9}{'bytes':>10}{'gzip ms':>9}{'ratio':>7}")
+
+    for name, (payload, repeat) in payloads.items():
+        default_ms = bench(lambda p: default_provider.dumps(p).encode('utf-8'), payload, repeat)
+        fast_ms = bench(serialization.dumps_bytes, payload, repeat)
+        body = serialization.dumps_bytes(payload)
+        gzip_ms = bench(lambda b: gzip.compress(b, compresslevel=serialization.GZIP_LEVEL), body, max(1, repeat // 10))
+        ratio = len(body) / len(gzip.compress(body, compresslevel=serialization.GZIP_LEVEL))
+        print(f"{name:<24}{default_ms:>12.3f}{fast_ms:>10.3f}{default_ms / fast_ms:>8.1f}x{len(body):>10}{gzip_ms:>9.3f}{ratio:>6.1f}x")
+
+if __name__ == "__main__":
+    main()
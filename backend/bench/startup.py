@@ -0,0 +1,112 @@
+"""
+Cold-start benchmark.
+
+Imports a backend module in fresh interpreters under `python -X importtime` and
+reports:
+- wall-clock time of the whole process and the import time of the module itself
+- self import time aggregated by top-level package, to show what startup pays for
+- optionally, with --warm-up, the seconds app.warm_up() spends on each step,
+  which needs the same database settings as the app
+
+Results are written as JSON so runs can be compared across releases.
+
+Run from the backend directory:
+    python -m bench.startup --module app --runs 5 --output startup.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+from bench.fixtures import percentiles
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Measure backend import and warm-up time.")
+    parser.add_argument('--module', action='append', help='module to import (repeatable); defaults to app and ingestion')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='packages to list by import time')
+    parser.add_argument('--warm-up', action='store_true', help='also time app.warm_up() in a fresh process')
+    parser.add_argument('--output', default='startup_benchmark.json')
+    return parser.parse_args(argv)
+
+def parse_importtime(stderr):
+    """Return [(self_us, cumulative_us, depth, module)] from -X importtime output."""
+    entries = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((int(self_us), int(cumulative_us), (len(indent) - 1) // 2, module))
+    return entries
+
+def run_import(module):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, env=os.environ.copy()
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    return wall, parse_importtime(proc.stderr)
+
+def measure_module(module, runs, top):
+    walls = []
+    module_seconds = []
+    by_package = defaultdict(list)
+    for _ in range(runs):
+        wall, entries = run_import(module)
+        walls.append(wall)
+        module_seconds.append(next(cumulative for _, cumulative, depth, name in entries if depth == 0 and name == module) / 1e6)
+        totals = defaultdict(int)
+        for self_us, _, _, name in entries:
+            totals[name.split('.')[0]] += self_us
+        for package, total in totals.items():
+            by_package[package].append(total / 1000)
+    packages = sorted(
+        ((package, sorted(values)[len(values) // 2]) for package, values in by_package.items()),
+        key=lambda item: item[1], reverse=True
+    )[:top]
+    return {
+        'module': module,
+        'runs': runs,
+        'process_ms': percentiles(walls),
+        'import_ms': percentiles(module_seconds),
+        'top_packages_self_ms': [{'package': package, 'median_ms': round(ms, 2)} for package, ms in packages],
+        'imports_openai': 'openai' in by_package,
+        'imports_numpy': 'numpy' in by_package,
+    }
+
+def measure_warm_up():
+    code = 'import json, app; print(json.dumps(app.warm_up()))'
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, env=os.environ.copy())
+    if proc.returncode != 0:
+        raise RuntimeError(f"warm-up failed:\n{proc.stderr[-2000:]}")
+    return {
+        'process_ms': round((time.perf_counter() - start) * 1000, 2),
+        'steps_seconds': json.loads(proc.stdout.strip().splitlines()[-1]),
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        'python': sys.version.split()[0],
+        'modules': [measure_module(module, args.runs, args.top) for module in (args.module or ['app', 'ingestion'])],
+    }
+    if args.warm_up:
+        results['warm_up'] = measure_warm_up()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Local stand-ins for OpenAI and Supabase, used by the load harness.
+
+One HTTP server answers both APIs, so the app only needs its base URLs pointed at it:
+- OpenAI (OPENAI_BASE_URL=<url>/v1): /v1/embeddings returns HashEmbedder vectors,
+  as float lists or base64 like the real API, and /v1/chat/completions a canned
+  answer. Each call waits a configurable latency with jitter, and a fraction of
+  calls is answered 429 with the retry-after and rate-limit headers the gateway
+  reads.
+- Supabase (NEXT_PUBLIC_SUPABASE_URL=<url>): /auth/v1/user accepts any bearer
+  token, and storage objects are kept in memory for upload, HEAD, GET, signing
+  and delete.
+
+GET /_stats returns request and 429 counts per operation.
+"""
+
+import json
+import time
+import random
+import base64
+import threading
+from collections import Counter
+from urllib.parse import unquote, urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bench.fixtures import HashEmbedder
+
+DEFAULT_SETTINGS = {
+    'embedding_latency_ms': 20.0,
+    'chat_latency_ms': 600.0,
+    'storage_latency_ms': 10.0,
+    'latency_jitter': 0.25,
+    'rate_limit_fraction': 0.0,
+    'retry_after_ms': 200,
+}
+
+CHAT_ANSWER = "Based on the course materials, here is a short answer to your question."
+
+class StubServices:
+    def __init__(self, settings=None, seed=0):
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.embedder = HashEmbedder()
+        self.objects = {}
+        self.requests = Counter()
+        self.throttled = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, kind):
+        latency = self.settings[f'{kind}_latency_ms'] / 1000
+        jitter = self.settings['latency_jitter']
+        with self._lock:
+            factor = 1 + jitter * self._rng.uniform(-1, 1)
+        time.sleep(max(0.0, latency * factor))
+
+    def should_throttle(self, operation):
+        with self._lock:
+            self.requests[operation] += 1
+            throttled = self._rng.random() < self.settings['rate_limit_fraction']
+            if throttled:
+                self.throttled[operation] += 1
+        return throttled
+
+    def stats(self):
+        with self._lock:
+            return {'requests': dict(self.requests), 'throttled': dict(self.throttled), 'objects': len(self.objects)}
+
+    def embeddings(self, body):
+        inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+        data = []
+        for index, text in enumerate(inputs):
+            vector = self.embedder.embed_array(text)
+            if body.get('encoding_format') == 'base64':
+                embedding = base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii')
+            else:
+                embedding = vector.tolist()
+            data.append({'object': 'embedding', 'index': index, 'embedding': embedding})
+        tokens = sum(len(text) // 4 + 1 for text in inputs)
+        return {'object': 'list', 'data': data, 'model': body.get('model'),
+                'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}}
+
+    def chat_completion(self, body):
+        prompt_tokens = sum(len(message.get('content') or '') // 4 + 1 for message in body.get('messages', []))
+        completion_tokens = len(CHAT_ANSWER) // 4
+        return {
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': CHAT_ANSWER}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }
+
+def make_handler(services):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def object_path(self, prefix):
+            # /storage/v1/object[/public]/<bucket>/<path>
+            path = unquote(urlparse(self.path).path)[len(prefix):]
+            if path.startswith('public/'):
+                path = path[len('public/'):]
+            return path
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            body = self.read_body()
+            if path in ('/v1/embeddings', '/v1/chat/completions'):
+                operation = 'embeddings' if path == '/v1/embeddings' else 'chat'
+                if services.should_throttle(operation):
+                    retry_after = str(services.settings['retry_after_ms'])
+                    return self.send_json(429, {'error': {'message': 'Rate limit reached (stub)', 'type': 'requests',
+                                                          'code': 'rate_limit_exceeded'}},
+                                          {'retry-after-ms': retry_after, 'x-ratelimit-remaining-requests': '0',
+                                           'x-ratelimit-reset-requests': retry_after + 'ms'})
+                services.wait('embedding' if operation == 'embeddings' else 'chat')
+                payload = json.loads(body)
+                result = services.embeddings(payload) if operation == 'embeddings' else services.chat_completion(payload)
+                return self.send_json(200, result)
+            if path.startswith('/storage/v1/object/sign/'):
+                services.should_throttle('storage_sign')
+                services.wait('storage')
+                bucket = path[len('/storage/v1/object/sign/'):]
+                return self.send_json(200, [
+                    {'path': item, 'signedURL': f"/object/sign/{bucket}/{item}?token=stub", 'error': None}
+                    if f"{bucket}/{item}" in services.objects else
+                    {'path': item, 'signedURL': None, 'error': 'Object not found'}
+                    for item in json.loads(body).get('paths', [])
+                ])
+            if path.startswith('/storage/v1/object/'):
+                services.should_throttle('storage_upload')
+                services.wait('storage')
+                key = self.object_path('/storage/v1/object/')
+                services.objects[key] = body
+                return self.send_json(200, {'Key': key})
+            self.send_json(404, {'error': f'No stub for POST {path}'})
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == '/_stats':
+                return self.send_json(200, services.stats())
+            if path == '/auth/v1/user':
+                services.should_throttle('auth')
+                token = (self.headers.get('Authorization') or '').split(' ')[-1]
+                if not token:
+                    return self.send_json(401, {'error': 'missing token'})
+                return self.send_json(200, {'id': token if len(token) == 36 else '00000000-0000-0000-0000-000000000000',
+                                            'role': 'authenticated'})
+            if path.startswith('/storage/v1/object/'):
+                services.should_throttle('storage_get')
+                data = services.objects.get(self.object_path('/storage/v1/object/'))
+                if data is None:
+                    return self.send_json(404, {'error': 'Object not found'})
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                return self.wfile.write(data)
+            self.send_json(404, {'error': f'No stub for GET {path}'})
+
+        def do_HEAD(self):
+            path = urlparse(self.path).path
+            if path.startswith('/storage/v1/object/'):
+                services.should_throttle('storage_head')
+                data = services.objects.get(self.object_path('/storage/v1/object/'))
+                self.send_response(404 if data is None else 200)
+                self.send_header('Content-Length', str(0 if data is None else len(data)))
+                self.send_header('Content-Type', 'application/octet-stream')
+                return self.end_headers()
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_DELETE(self):
+            path = urlparse(self.path).path
+            if path.startswith('/storage/v1/object/'):
+                services.should_throttle('storage_delete')
+                found = services.objects.pop(self.object_path('/storage/v1/object/'), None) is not None
+                return self.send_json(200 if found else 404, {'message': 'deleted' if found else 'Object not found'})
+            self.send_json(404, {'error': f'No stub for DELETE {path}'})
+
+    return Handler
+
+def serve(settings=None, host='127.0.0.1', port=0, seed=0):
+    """Start the stubs on a daemon thread. Returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), make_handler(StubServices(settings, seed)))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='bench-stubs', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def run_forever(settings, port, ready):
+    """Process entry point: serve the stubs until terminated, reporting the URL on `ready`."""
+    server, url = serve(settings, port=port)
+    ready.put(url)
+    threading.Event().wait()
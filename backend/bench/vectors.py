@@ -0,0 +1,202 @@
+"""
+Embedding transfer benchmark: float lists versus the compact vector path.
+
+For N chunks (10k by default) of DIM-dimensional embeddings, measures both ends
+of the ingestion path in two ways:
+- decode: parsing OpenAI embedding responses, either the JSON float format into
+  lists of Python floats, or the base64 format into float32 arrays with
+  vectors.decode_base64()
+- write: loading the vectors into a temporary table shaped like embeddings,
+  with execute_values and list parameters, with execute_values and float32
+  arrays through the vectors adapter, or with the binary COPY of
+  vectors.copy_rows()
+
+For each, reports client CPU seconds, wall seconds, peak Python memory while
+holding all N embeddings (tracemalloc, in a separate pass so it does not skew
+the timings) and bytes transferred per chunk, all scaled to 10k chunks.
+Results are written as JSON so runs can be compared across releases.
+
+The write half needs SUPABASE_HOST/DATABASE/USER/PASSWORD pointing at a Postgres
+with pgvector; only temporary tables are created. Run from the backend directory:
+    python -m bench.vectors --chunks 10000 --output vectors.json
+"""
+
+import sys
+import json
+import time
+import base64
+import argparse
+import tracemalloc
+
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+
+import config
+import vectors
+
+OPENAI_BATCH = 64
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--chunks', type=int, default=10000)
+    parser.add_argument('--dim', type=int, default=1536)
+    parser.add_argument('--batch', type=int, default=512, help='rows per write, as in INGEST_BATCH_CHUNKS')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-database', action='store_true', help='only measure decoding')
+    parser.add_argument('--output', default='vectors_benchmark.json')
+    return parser.parse_args(argv)
+
+def make_vectors(chunks, dim, seed):
+    matrix = np.random.default_rng(seed).standard_normal((chunks, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+def make_responses(matrix):
+    """OpenAI response bodies for the matrix, in the float and base64 formats."""
+    float_bodies = []
+    base64_bodies = []
+    for start in range(0, len(matrix), OPENAI_BATCH):
+        batch = matrix[start:start + OPENAI_BATCH]
+        # The float format prints each float32 with about 9 significant digits
+        float_bodies.append('{"object":"list","data":[' + ','.join(
+            '{"object":"embedding","index":%d,"embedding":[%s]}' % (i, ','.join('%.9g' % value for value in row.tolist()))
+            for i, row in enumerate(batch)
+        ) + ']}')
+        base64_bodies.append(json.dumps({'object': 'list', 'data': [
+            {'object': 'embedding', 'index': i, 'embedding': base64.b64encode(row.astype('<f4').tobytes()).decode('ascii')}
+            for i, row in enumerate(batch)
+        ]}))
+    return float_bodies, base64_bodies
+
+def decode_floats(bodies):
+    embeddings = []
+    for body in bodies:
+        embeddings.extend(item['embedding'] for item in json.loads(body)['data'])
+    return embeddings
+
+def decode_base64(bodies, dim):
+    matrix = np.empty((sum(body.count('"index"') for body in bodies), dim), dtype=np.float32)
+    start = 0
+    for body in bodies:
+        data = json.loads(body)['data']
+        for item in data:
+            matrix[start + item['index']] = vectors.decode_base64(item['embedding'])
+        start += len(data)
+    return matrix
+
+def measure(fn):
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    result = fn()
+    return result, time.process_time() - cpu, time.perf_counter() - wall
+
+def peak_memory(fn):
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+def connect():
+    settings = config.get_config()
+    conn = psycopg2.connect(host=settings.db_host, database=settings.db_name, user=settings.db_user, password=settings.db_password)
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TEMP TABLE bench_vectors (
+            id TEXT, content TEXT, embedding VECTOR, metadata JSONB,
+            embedding_model TEXT, embedding_dim INTEGER, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    return conn, cursor
+
+def rows(embeddings, offset=0):
+    for i, embedding in enumerate(embeddings, offset):
+        yield (f"bench_chunk_{i}", "x" * 200, embedding, json.dumps({'chunkIndex': i}), 'bench', len(embedding))
+
+def write_lists(conn, cursor, embeddings, batch):
+    for start in range(0, len(embeddings), batch):
+        execute_values(
+            cursor,
+            'INSERT INTO bench_vectors (id, content, embedding, metadata, embedding_model, embedding_dim) VALUES %s',
+            list(rows(embeddings[start:start + batch], start)),
+            page_size=batch
+        )
+        conn.commit()
+
+def write_binary(conn, cursor, matrix, batch):
+    sent = 0
+    for start in range(0, len(matrix), batch):
+        sent += vectors.copy_rows(cursor, 'bench_vectors', [
+            ('id', 'text'), ('content', 'text'), ('embedding', 'vector'), ('metadata', 'jsonb'),
+            ('embedding_model', 'text'), ('embedding_dim', 'int4'),
+        ], rows(matrix[start:start + batch], start))
+        conn.commit()
+    return sent
+
+def list_payload_bytes(cursor, embeddings, batch):
+    # What execute_values sends: the mogrified VALUES list
+    return sum(len(cursor.mogrify('(%s,%s,%s,%s,%s,%s)', row)) for row in rows(embeddings[:batch])) * len(embeddings) / batch
+
+def scaled(value, chunks):
+    return round(value * 10000 / chunks, 4)
+
+def stage(name, cpu, wall, peak, transferred, chunks):
+    return {
+        'method': name,
+        'cpu_seconds_per_10k': scaled(cpu, chunks),
+        'wall_seconds_per_10k': scaled(wall, chunks),
+        'peak_mb_per_10k': scaled(peak / 1e6, chunks) if peak is not None else None,
+        'bytes_per_chunk': round(transferred / chunks),
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    matrix = make_vectors(args.chunks, args.dim, args.seed)
+    float_bodies, base64_bodies = make_responses(matrix)
+
+    float_lists, cpu, wall = measure(lambda: decode_floats(float_bodies))
+    decode = [stage('json floats -> lists', cpu, wall, peak_memory(lambda: decode_floats(float_bodies)),
+                    sum(map(len, float_bodies)), args.chunks)]
+    decoded, cpu, wall = measure(lambda: decode_base64(base64_bodies, args.dim))
+    decode.append(stage('base64 -> float32', cpu, wall, peak_memory(lambda: decode_base64(base64_bodies, args.dim)),
+                        sum(map(len, base64_bodies)), args.chunks))
+    assert np.allclose(decoded, np.asarray(float_lists, dtype=np.float32), atol=1e-6)
+    results = {
+        'benchmark': 'vectors',
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'config': vars(args),
+        'decode': decode,
+    }
+
+    if not args.no_database:
+        conn, cursor = connect()
+        try:
+            payload = list_payload_bytes(cursor, float_lists, args.batch)
+            _, cpu, wall = measure(lambda: write_lists(conn, cursor, float_lists, args.batch))
+            write = [stage('execute_values lists', cpu, wall, None, payload, args.chunks)]
+            cursor.execute('TRUNCATE bench_vectors')
+            # float32 rows go through the vectors adapter as pgvector literals
+            payload = list_payload_bytes(cursor, decoded, args.batch)
+            _, cpu, wall = measure(lambda: write_lists(conn, cursor, decoded, args.batch))
+            write.append(stage('execute_values float32 adapter', cpu, wall, None, payload, args.chunks))
+            cursor.execute('TRUNCATE bench_vectors')
+            sent, cpu, wall = measure(lambda: write_binary(conn, cursor, decoded, args.batch))
+            write.append(stage('binary COPY float32', cpu, wall, None, sent, args.chunks))
+            cursor.execute("SELECT count(*), (SELECT embedding::text FROM bench_vectors WHERE id = 'bench_chunk_0') FROM bench_vectors")
+            count, first = cursor.fetchone()
+            assert count == args.chunks and np.allclose(np.fromstring(first[1:-1], sep=','), matrix[0], atol=1e-6)
+            results['write'] = write
+        finally:
+            cursor.close()
+            conn.close()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Server-side conversation store for multi-turn chat.
+
+A session belongs to one course. Each turn stores the question, the answer, the
+question's embedding and the context chunks the answer was generated from, so a
+follow-up can be handled without starting from scratch:
+
+- the prompt keeps the fixed instructions first and the retrieved context second,
+  so consecutive turns share as long a prefix as possible for provider-side
+  prompt caching
+- when a follow-up's embedding is within SESSION_CONTEXT_REUSE_SIMILARITY of the
+  previous question's, the previous turn's context is reused instead of
+  searching again, which also keeps the cached prefix intact
+- once the turns not yet summarized exceed SESSION_HISTORY_TOKEN_BUDGET, all but
+  the last SESSION_RECENT_TURNS are folded into a running summary in the
+  background, and later prompts carry the summary instead of those turns
+
+Every turn records how many prompt tokens it saved against resending the whole
+conversation. Turns are numbered as they are stored, under a lock on the
+session row, so concurrent messages to one session are stored one after the
+other. A session created by a signed-in user is only readable and writable by
+that user.
+"""
+
+import os
+import json
+import uuid
+import threading
+
+import openai_gateway
+
+SESSION_HISTORY_TOKEN_BUDGET = int(os.environ.get("SESSION_HISTORY_TOKEN_BUDGET", "1500"))
+SESSION_RECENT_TURNS = int(os.environ.get("SESSION_RECENT_TURNS", "2"))
+SESSION_CONTEXT_REUSE_SIMILARITY = float(os.environ.get("SESSION_CONTEXT_REUSE_SIMILARITY", "0.85"))
+SESSION_SUMMARY_MODEL = os.environ.get("SESSION_SUMMARY_MODEL", "gpt-3.5-turbo")
+SESSION_SUMMARY_MAX_TOKENS = 300
+
+CREATE_TABLES_SQL = '''
+    CREATE TABLE IF NOT EXISTS chat_sessions (
+        id TEXT PRIMARY KEY,
+        course_id TEXT NOT NULL,
+        user_id TEXT,
+        summary TEXT,
+        summarized_turns INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS chat_turns (
+        session_id TEXT NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+        turn_index INTEGER NOT NULL,
+        query TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        query_embedding FLOAT8[],
+        context JSONB,
+        context_reused BOOLEAN NOT NULL DEFAULT FALSE,
+        prompt_tokens INTEGER,
+        prompt_tokens_saved INTEGER,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (session_id, turn_index)
+    );
+'''
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize this conversation between a student and a course teaching assistant. "
+    "Keep the questions asked, the facts given in answers and anything the student "
+    "said about their situation. Be concise."
+)
+
+def messages_tokens(messages):
+    return sum(openai_gateway.estimate_tokens(message['content']) for message in messages)
+
+def create_session(cursor, course_id, user_id=None):
+    session_id = str(uuid.uuid4())
+    cursor.execute(
+        'INSERT INTO chat_sessions (id, course_id, user_id) VALUES (%s, %s, %s)',
+        (session_id, course_id, user_id)
+    )
+    return session_id
+
+def can_access(session, user):
+    """Whether `user` (the signed-in user, or None) may read and write the session."""
+    return session['user_id'] is None or (user is not None and session['user_id'] == user['id'])
+
+def load_session(cursor, session_id):
+    """
+    Return the session with all of its turns in order, or None. Expects a RealDictCursor.
+    """
+    cursor.execute(
+        'SELECT id, course_id, user_id, summary, summarized_turns, created_at, updated_at FROM chat_sessions WHERE id = %s',
+        (session_id,)
+    )
+    session = cursor.fetchone()
+    if session is None:
+        return None
+    cursor.execute(
+        """
+        SELECT turn_index, query, answer, query_embedding, context, context_reused, prompt_tokens, prompt_tokens_saved, created_at
+        FROM chat_turns WHERE session_id = %s ORDER BY turn_index
+        """,
+        (session_id,)
+    )
+    session = dict(session)
+    session['turns'] = [dict(turn) for turn in cursor.fetchall()]
+    return session
+
+def reusable_context(session, query_embedding):
+    """
+    The previous turn's context if the new question is close enough to the
+    previous one, otherwise None.
+    """
+    import numpy as np
+
+    if not session['turns']:
+        return None
+    previous = session['turns'][-1]
+    if not previous['query_embedding'] or previous['context'] is None:
+        return None
+    a = np.asarray(previous['query_embedding'], dtype=np.float64)
+    b = np.asarray(query_embedding, dtype=np.float64)
+    if a.shape != b.shape:
+        return None
+    similarity = float(a @ b) / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12)
+    return previous['context'] if similarity >= SESSION_CONTEXT_REUSE_SIMILARITY else None
+
+def turn_messages(turns):
+    messages = []
+    for turn in turns:
+        messages.append({"role": "user", "content": turn['query']})
+        messages.append({"role": "assistant", "content": turn['answer']})
+    return messages
+
+def history_messages(session):
+    """Turns not yet covered by the summary, as chat messages."""
+    return turn_messages(session['turns'][session['summarized_turns']:])
+
+def append_turn(cursor, session_id, query, answer, query_embedding, context, context_reused, prompt_tokens, prompt_tokens_saved):
+    """
+    Store the next turn of the session on the caller's transaction and return
+    its index. The session row stays locked until the transaction ends.
+    """
+    # Locks the session row, so the next statement sees every turn stored before this one
+    cursor.execute('UPDATE chat_sessions SET updated_at = CURRENT_TIMESTAMP WHERE id = %s', (session_id,))
+    cursor.execute(
+        """
+        INSERT INTO chat_turns (session_id, turn_index, query, answer, query_embedding, context, context_reused, prompt_tokens, prompt_tokens_saved)
+        SELECT %s, COALESCE(max(turn_index) + 1, 0), %s, %s, %s, %s, %s, %s, %s
+        FROM chat_turns WHERE session_id = %s
+        RETURNING turn_index
+        """,
+        (session_id, query, answer, query_embedding, json.dumps(context, default=str), context_reused, prompt_tokens, prompt_tokens_saved, session_id)
+    )
+    row = cursor.fetchone()
+    return row['turn_index'] if isinstance(row, dict) else row[0]
+
+def needs_summary(session):
+    pending = session['turns'][session['summarized_turns']:]
+    return len(pending) > SESSION_RECENT_TURNS and messages_tokens(turn_messages(pending)) > SESSION_HISTORY_TOKEN_BUDGET
+
+def summarize(connect, gateway, session):
+    """
+    Fold all but the most recent turns into the session summary.
+
+    Only applied if no other summary landed first, so concurrent turns cannot
+    overwrite each other's summaries.
+    """
+    through = len(session['turns']) - SESSION_RECENT_TURNS
+    turns = session['turns'][session['summarized_turns']:through]
+    if not turns:
+        return
+    transcript = "\n\n".join(f"Student: {turn['query']}\nAssistant: {turn['answer']}" for turn in turns)
+    if session['summary']:
+        transcript = f"Summary so far:\n{session['summary']}\n\nLater conversation:\n{transcript}"
+    response = gateway.create_chat_completion(
+        model=SESSION_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": transcript}
+        ],
+        max_tokens=SESSION_SUMMARY_MAX_TOKENS,
+        lane=openai_gateway.BULK
+    )
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE chat_sessions SET summary = %s, summarized_turns = %s, updated_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND summarized_turns = %s
+        """,
+        (response.choices[0].message.content, through, session['id'], session['summarized_turns'])
+    )
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def summarize_in_background(connect, gateway, session):
+    def run():
+        try:
+            summarize(connect, gateway, session)
+        except Exception as e:
+            print(f"Warning: summarizing chat session {session['id']} failed: {e}")
+    threading.Thread(target=run, name=f"summarize-{session['id']}", daemon=True).start()
@@ -0,0 +1,34 @@
+"""
+Configuration shared by app.py and the benchmarks.
+
+get_config() loads .env into the environment the first time it is called and
+returns the same Config object afterwards, so the file is read once per process
+however many modules ask for it. Call it before importing modules that read
+their own settings from the environment at import time.
+"""
+
+import os
+import functools
+
+class Config:
+    def __init__(self, environ):
+        self.openai_api_key = environ.get("OPENAI_API_KEY")
+        self.supabase_url = environ.get("NEXT_PUBLIC_SUPABASE_URL")
+        self.supabase_service_key = environ.get("SUPABASE_SERVICE_ROLE")  # Service role for admin ops
+        self.supabase_anon_key = environ.get("SUPABASE_ANON_PUBLIC")  # Anon key for client-side ops
+        self.db_host = environ.get("SUPABASE_HOST")
+        self.db_name = environ.get("SUPABASE_DATABASE")
+        self.db_user = environ.get("SUPABASE_USER")
+        self.db_password = environ.get("SUPABASE_PASSWORD")
+        # Open connections and fill caches before serving the first request
+        self.warm_up = environ.get("WARM_UP_ON_START", "true").lower() in ("1", "true", "yes")
+
+@functools.lru_cache(maxsize=None)
+def get_config():
+    # Load environment variables from .env file
+    try:
+        from load_env import load_env
+        load_env()
+    except ImportError:
+        print("Warning: load_env module not found. Using existing environment variables.")
+    return Config(os.environ)
@@ -0,0 +1,247 @@
+"""
+Per-course similarity statistics used to pick match_documents' threshold and count.
+
+A fixed 0.5 threshold suits some courses and not others: chunks of a short
+syllabus are far apart, while chunks of a long lecture transcript all sit close
+together. For every (course, embedding model) pair, course_score_stats keeps the
+chunk count and the running sum of the course's unit embeddings. For unit
+vectors the mean pairwise cosine similarity is exactly
+
+    (|sum|^2 - n) / (n (n - 1))
+
+which is how similar an unrelated chunk of that course is to a query about
+something else. The threshold sits ADAPTIVE_THRESHOLD_MARGIN above that
+background, clamped to a sane range, and the count grows with the log of the
+course size. Both are updated in the ingestion transaction, and searches read
+them from an in-process cache, so a search never computes them.
+"""
+
+import os
+import math
+import time
+import threading
+
+DEFAULT_MATCH_THRESHOLD = 0.5
+DEFAULT_MATCH_COUNT = 5
+
+# Below this many chunks the statistics are too noisy to trust
+ADAPTIVE_MIN_CHUNKS = int(os.environ.get("ADAPTIVE_MIN_CHUNKS", "20"))
+ADAPTIVE_THRESHOLD_MARGIN = float(os.environ.get("ADAPTIVE_THRESHOLD_MARGIN", "0.2"))
+ADAPTIVE_THRESHOLD_MIN = float(os.environ.get("ADAPTIVE_THRESHOLD_MIN", "0.25"))
+ADAPTIVE_THRESHOLD_MAX = float(os.environ.get("ADAPTIVE_THRESHOLD_MAX", "0.75"))
+ADAPTIVE_COUNT_MIN = int(os.environ.get("ADAPTIVE_COUNT_MIN", "3"))
+ADAPTIVE_COUNT_MAX = int(os.environ.get("ADAPTIVE_COUNT_MAX", "8"))
+STATS_CACHE_TTL = float(os.environ.get("COURSE_STATS_CACHE_TTL", "300"))
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS course_score_stats (
+        course_id TEXT NOT NULL,
+        embedding_model TEXT NOT NULL,
+        chunk_count BIGINT NOT NULL DEFAULT 0,
+        vector_sum FLOAT8[] NOT NULL,
+        background_similarity FLOAT8,
+        match_threshold FLOAT8 NOT NULL,
+        match_count INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (course_id, embedding_model)
+    );
+'''
+
+def background_similarity(chunk_count, vector_sum):
+    """Mean cosine similarity between two distinct chunks of the course."""
+    import numpy as np
+
+    if chunk_count < 2:
+        return None
+    return (float(np.dot(vector_sum, vector_sum)) - chunk_count) / (chunk_count * (chunk_count - 1))
+
+def search_params(chunk_count, vector_sum):
+    """
+    Threshold and count for a course with the given statistics.
+    """
+    if chunk_count < max(2, ADAPTIVE_MIN_CHUNKS):
+        return DEFAULT_MATCH_THRESHOLD, DEFAULT_MATCH_COUNT
+    background = background_similarity(chunk_count, vector_sum)
+    threshold = min(ADAPTIVE_THRESHOLD_MAX, max(ADAPTIVE_THRESHOLD_MIN, background + ADAPTIVE_THRESHOLD_MARGIN))
+    count = ADAPTIVE_COUNT_MIN + round(math.log2(1 + chunk_count / 100))
+    return threshold, min(ADAPTIVE_COUNT_MAX, count)
+
+def update_course_stats(cursor, course_id, model_name, embeddings, removed=False):
+    """
+    Fold newly ingested embeddings into a course's statistics, or take deleted
+    ones back out with `removed`.
+
+    Runs on the caller's cursor. The row is locked for the read-modify-write, so
+    concurrent ingestion into one course serialises here; on an autocommit
+    connection the update gets its own transaction to hold that lock.
+    """
+    import numpy as np
+
+    if not course_id or not len(embeddings):
+        return
+    vectors = np.asarray(embeddings, dtype=np.float64)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    sign = -1 if removed else 1
+    fold_vector_sum(cursor, course_id, model_name, sign * len(vectors), sign * vectors.sum(axis=0))
+
+def fold_vector_sum(cursor, course_id, model_name, count, vector_sum):
+    """
+    Add `count` unit vectors known only by their sum to a course's statistics,
+    e.g. chunks copied in SQL whose vectors never reach Python. Negative to take
+    them out. Locks like update_course_stats.
+    """
+    import numpy as np
+
+    if not course_id or not count:
+        return
+    own_transaction = cursor.connection.autocommit
+    if own_transaction:
+        cursor.execute('BEGIN')
+    try:
+        _fold_vectors(cursor, course_id, model_name, count, np.asarray(vector_sum, dtype=np.float64))
+    except Exception:
+        if own_transaction:
+            cursor.execute('ROLLBACK')
+        raise
+    if own_transaction:
+        cursor.execute('COMMIT')
+
+def _fold_vectors(cursor, course_id, model_name, count_delta, sum_delta):
+    import numpy as np
+
+    # Make sure a row exists to lock, so two first ingestions cannot both start from zero
+    cursor.execute(
+        """
+        INSERT INTO course_score_stats (course_id, embedding_model, vector_sum, match_threshold, match_count)
+        VALUES (%s, %s, '{}', %s, %s)
+        ON CONFLICT (course_id, embedding_model) DO NOTHING
+        """,
+        (course_id, model_name, DEFAULT_MATCH_THRESHOLD, DEFAULT_MATCH_COUNT)
+    )
+    cursor.execute(
+        """
+        SELECT chunk_count, vector_sum
+        FROM course_score_stats
+        WHERE course_id = %s AND embedding_model = %s
+        FOR UPDATE
+        """,
+        (course_id, model_name)
+    )
+    row = cursor.fetchone()
+    if row and len(row[1]) == len(sum_delta):
+        count, vector_sum = int(row[0]), np.asarray(row[1], dtype=np.float64)
+    else:
+        count, vector_sum = 0, np.zeros(len(sum_delta))
+
+    count = max(count + count_delta, 0)
+    vector_sum = vector_sum + sum_delta if count else np.zeros(len(sum_delta))
+    threshold, match_count = search_params(count, vector_sum)
+
+    cursor.execute(
+        """
+        INSERT INTO course_score_stats
+            (course_id, embedding_model, chunk_count, vector_sum, background_similarity, match_threshold, match_count, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (course_id, embedding_model) DO UPDATE SET
+            chunk_count = EXCLUDED.chunk_count,
+            vector_sum = EXCLUDED.vector_sum,
+            background_similarity = EXCLUDED.background_similarity,
+            match_threshold = EXCLUDED.match_threshold,
+            match_count = EXCLUDED.match_count,
+            updated_at = EXCLUDED.updated_at
+        """,
+        (course_id, model_name, count, vector_sum.tolist(), background_similarity(count, vector_sum), threshold, match_count)
+    )
+
+def backfill_course_stats(cursor, model_name, batch_size=1000):
+    """
+    Build statistics for courses that have embeddings but no stats row, e.g.
+    after the table is first created. Returns the number of courses filled.
+    """
+    import numpy as np
+
+    cursor.execute(
+        """
+        SELECT DISTINCT e.metadata->>'courseId'
+        FROM embeddings e
+        WHERE e.embedding_model = %s
+          AND e.metadata->>'courseId' IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM course_score_stats s
+              WHERE s.course_id = e.metadata->>'courseId' AND s.embedding_model = e.embedding_model
+          )
+        """,
+        (model_name,)
+    )
+    course_ids = [row[0] for row in cursor.fetchall()]
+    for course_id in course_ids:
+        cursor.execute(
+            """
+            SELECT embedding::text FROM embeddings
+            WHERE embedding_model = %s AND metadata->>'courseId' = %s
+            ORDER BY created_at, id
+            """,
+            (model_name, course_id)
+        )
+        embeddings = [np.fromstring(row[0].strip('[]'), sep=',') for row in cursor.fetchall()]
+        for start in range(0, len(embeddings), batch_size):
+            update_course_stats(cursor, course_id, model_name, embeddings[start:start + batch_size])
+    return len(course_ids)
+
+class CourseStatsCache:
+    """
+    In-process cache of (threshold, count) per course and model.
+
+    Misses are read on the caller's cursor, so a search adds at most one primary
+    key lookup to a connection it already holds. Entries expire after
+    COURSE_STATS_CACHE_TTL so other workers' ingestion is picked up.
+    """
+
+    def __init__(self, ttl=STATS_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, cursor, course_id, model_name):
+        if not course_id or course_id == 'all':
+            return DEFAULT_MATCH_THRESHOLD, DEFAULT_MATCH_COUNT
+        key = (course_id, model_name)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and entry[0] > now:
+            return entry[1]
+
+        cursor.execute(
+            """
+            SELECT match_threshold, match_count FROM course_score_stats
+            WHERE course_id = %s AND embedding_model = %s
+            """,
+            (course_id, model_name)
+        )
+        row = cursor.fetchone()
+        if row:
+            params = (float(row['match_threshold']), int(row['match_count'])) if isinstance(row, dict) else (float(row[0]), int(row[1]))
+        else:
+            params = (DEFAULT_MATCH_THRESHOLD, DEFAULT_MATCH_COUNT)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, params)
+        return params
+
+    def prime(self, cursor, model_name):
+        """Load the parameters of every course for the model, e.g. while warming up. Returns how many."""
+        cursor.execute(
+            'SELECT course_id, match_threshold, match_count FROM course_score_stats WHERE embedding_model = %s',
+            (model_name,)
+        )
+        rows = [tuple(row.values()) if isinstance(row, dict) else row for row in cursor.fetchall()]
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for course_id, threshold, count in rows:
+                self._entries[(course_id, model_name)] = (expires, (float(threshold), int(count)))
+        return len(rows)
+
+    def invalidate(self, course_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == course_id]:
+                del self._entries[key]
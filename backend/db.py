@@ -0,0 +1,188 @@
+"""
+Routing of database connections across a primary, read replicas and shards.
+
+Without configuration every connection goes to SUPABASE_HOST, as before.
+
+- DATABASE_REPLICAS: comma-separated replica hosts (host or host:port) of the
+  main database. Read-only endpoints and searches are spread over them round
+  robin; a replica that cannot be reached is skipped, and the primary is the last
+  resort.
+- DATABASE_SHARDS: comma-separated nodes holding course vectors (embeddings and
+  course_score_stats), each written as primary|replica|replica. A course lives
+  on the node picked by a stable hash of its id; relational tables (courses,
+  materials, queries, ...) stay on the main database. Searches with
+  course_id='all' query every node in parallel and merge the top results.
+
+Read-your-writes: after a write commits, mark_written() records the primary's WAL
+position under a key, the course for ingestion or the user for their own rows.
+For READ_YOUR_WRITES_TTL seconds, reads with that key go to the next replica
+that has replayed past that position, and to the primary if none has. The pin is
+kept per process.
+"""
+
+import os
+import time
+import zlib
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+
+import metrics
+
+DATABASE_REPLICAS = os.environ.get("DATABASE_REPLICAS", "")
+DATABASE_SHARDS = os.environ.get("DATABASE_SHARDS", "")
+READ_YOUR_WRITES_TTL = float(os.environ.get("READ_YOUR_WRITES_TTL", "10"))
+
+ROUTES = metrics.counter(
+    'db_route_total', 'Database connections by routing target and reason.', ('target', 'reason')
+)
+
+def parse_host(spec):
+    """'host', 'host:port' or a socket directory; returns psycopg2 connect arguments."""
+    spec = spec.strip()
+    if ':' in spec and not spec.startswith('/'):
+        host, port = spec.rsplit(':', 1)
+        return {'host': host, 'port': int(port)}
+    return {'host': spec}
+
+class Node:
+    def __init__(self, primary, replicas=()):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self._next_replica = itertools.count()
+
+    @classmethod
+    def parse(cls, spec):
+        hosts = [parse_host(part) for part in spec.split('|') if part.strip()]
+        return cls(hosts[0], hosts[1:])
+
+    def replica_order(self):
+        if not self.replicas:
+            return []
+        start = next(self._next_replica) % len(self.replicas)
+        return self.replicas[start:] + self.replicas[:start]
+
+class DatabaseRouter:
+    def __init__(self, connect, main, shards=(), read_your_writes_ttl=READ_YOUR_WRITES_TTL):
+        # connect(**host_params) opens a connection to one server
+        self.connect = connect
+        self.main = main
+        self.shards = list(shards)
+        self.read_your_writes_ttl = read_your_writes_ttl
+        self._written = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, connect, main_host):
+        replicas = [parse_host(spec) for spec in DATABASE_REPLICAS.split(',') if spec.strip()]
+        shards = [Node.parse(spec) for spec in DATABASE_SHARDS.split(',') if spec.strip()]
+        return cls(connect, Node(main_host, replicas), shards)
+
+    @property
+    def sharded(self):
+        return bool(self.shards)
+
+    def vector_node(self, course_id):
+        """The node holding a course's vectors."""
+        if not self.shards:
+            return self.main
+        return self.shards[zlib.crc32(str(course_id).encode('utf-8')) % len(self.shards)]
+
+    def vector_nodes(self):
+        return self.shards or [self.main]
+
+    def primary(self):
+        ROUTES.inc(target='primary', reason='direct')
+        return self.connect(**self.main.primary)
+
+    def vector_primary(self, course_id):
+        ROUTES.inc(target='primary', reason='write')
+        return self.connect(**self.vector_node(course_id).primary)
+
+    def read(self, key=None):
+        """
+        Connection for a read of the main database, on a replica when possible.
+        `key` is the course or user a preceding write was marked with.
+        """
+        return self._read(self.main, key)
+
+    def vector_read(self, course_id):
+        """Connection for a read of a course's vectors, on a replica when possible."""
+        return self._read(self.vector_node(course_id), course_id)
+
+    def _read(self, node, key):
+        pinned_lsn = self._pinned_lsn(node, key)
+        lagging = False
+        for replica in node.replica_order():
+            try:
+                conn = self.connect(**replica)
+            except psycopg2.OperationalError as e:
+                ROUTES.inc(target='primary', reason='replica_down')
+                print(f"Warning: replica {replica['host']} unavailable: {e}")
+                continue
+            if pinned_lsn is None or self._replayed(conn, pinned_lsn):
+                ROUTES.inc(target='replica', reason='read')
+                return conn
+            conn.close()
+            lagging = True
+        if lagging:
+            ROUTES.inc(target='primary', reason='read_your_writes')
+        elif node.replicas:
+            ROUTES.inc(target='primary', reason='no_replica')
+        else:
+            ROUTES.inc(target='primary', reason='read')
+        return self.connect(**node.primary)
+
+    def mark_written(self, key, conn, vectors=False):
+        """
+        Pin reads with `key` to servers that have seen this write. Call with the
+        primary connection after committing, before closing it; `vectors` when
+        it is the course's vector node rather than the main database.
+        """
+        node = self.vector_node(key) if vectors else self.main
+        if key is None or not node.replicas:
+            return
+        cursor = conn.cursor()
+        cursor.execute('SELECT pg_current_wal_lsn()::text')
+        lsn = cursor.fetchone()[0]
+        cursor.close()
+        with self._lock:
+            self._written[(id(node), key)] = (time.monotonic() + self.read_your_writes_ttl, lsn)
+
+    def _pinned_lsn(self, node, key):
+        if key is None or not node.replicas:
+            return None
+        with self._lock:
+            entry = self._written.get((id(node), key))
+            if entry and entry[0] <= time.monotonic():
+                del self._written[(id(node), key)]
+                entry = None
+        return entry[1] if entry else None
+
+    @staticmethod
+    def _replayed(conn, lsn):
+        cursor = conn.cursor()
+        # NULL on a server that is not replaying WAL, which cannot have the write
+        cursor.execute('SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn', (lsn,))
+        replayed = cursor.fetchone()[0]
+        cursor.close()
+        return bool(replayed)
+
+    def scatter(self, fn):
+        """
+        Run fn(conn) against a read connection of every vector node in parallel and
+        return the results in node order.
+        """
+        def run(node):
+            conn = self._read(node, None)
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+        nodes = self.vector_nodes()
+        if len(nodes) == 1:
+            return [run(nodes[0])]
+        with ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+            return list(pool.map(run, nodes))
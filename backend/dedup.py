@@ -0,0 +1,180 @@
+"""
+Content-addressed deduplication of uploads.
+
+Professors often upload the same file to several sections of a course. Every
+upload is hashed with SHA-256 while werkzeug spools it (HashingRequest), so
+recognising a duplicate costs no extra pass over the file. Then:
+- /api/storage/upload: content_objects maps each hash to the first storage
+  object uploaded with it, per folder (the path up to its last '/'). An upload
+  whose content is already stored in the same folder, in an object that still
+  exists, is answered with that object's key and path instead of being stored
+  again. Objects are never shared across folders, so one course's uploads
+  cannot end up pointing at, or be deleted along with, another's.
+- /api/materials/process and /api/process-document: materials.content_sha256
+  records what each material was built from. When a processed material has the
+  same content, its chunks are cloned into the new material on the vector
+  nodes (Ingestor.clone), so nothing is extracted or embedded again.
+
+Outcomes are counted per path in dedup_uploads_total, and dedup_stats()
+reports stored hit rates and bytes saved.
+"""
+
+import hashlib
+
+from flask import Request
+
+import metrics
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+UPLOADS = metrics.counter(
+    'dedup_uploads_total', 'Uploads checked for duplicate content by path and outcome.', ('path', 'outcome')
+)
+BYTES_SAVED = metrics.counter(
+    'dedup_bytes_saved_total', 'Upload bytes not stored or processed again.', ('path',)
+)
+PATHS = ('storage_upload', 'process_material', 'process_document')
+
+CREATE_TABLES_SQL = '''
+    CREATE TABLE IF NOT EXISTS content_objects (
+        folder TEXT NOT NULL,
+        sha256 TEXT NOT NULL,
+        storage_path TEXT NOT NULL,
+        file_size BIGINT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (folder, sha256)
+    );
+    CREATE INDEX IF NOT EXISTS content_objects_storage_path_idx ON content_objects (storage_path);
+    ALTER TABLE materials ADD COLUMN IF NOT EXISTS content_sha256 TEXT;
+    CREATE INDEX IF NOT EXISTS materials_content_sha256_idx ON materials (content_sha256) WHERE content_sha256 IS NOT NULL;
+'''
+
+# Materials per distinct content, for the stored hit rate
+STATS_SQL = '''
+    SELECT COALESCE(sum(copies), 0) AS materials,
+           count(*) AS distinct_contents,
+           COALESCE(sum(copies - 1), 0) AS duplicates,
+           COALESCE(sum((copies - 1) * file_size), 0) AS bytes_saved
+    FROM (
+        SELECT content_sha256, count(*) AS copies, max(file_size) AS file_size
+        FROM materials
+        WHERE content_sha256 IS NOT NULL
+        GROUP BY content_sha256
+    ) contents
+'''
+
+class HashingStream:
+    """Spool for an uploaded file that hashes everything written to it."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._stream.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+class HashingRequest(Request):
+    """Request whose uploaded files are hashed as the multipart body is parsed."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingStream(super()._get_file_stream(total_content_length, content_type, filename, content_length))
+
+def upload_digest(file):
+    """(sha256 hex digest, size in bytes) of an uploaded FileStorage."""
+    stream = file.stream
+    if isinstance(stream, HashingStream):
+        return stream.hexdigest(), stream.size
+    # Not received through HashingRequest: hash it now and rewind
+    digest = hashlib.sha256()
+    size = 0
+    stream.seek(0)
+    for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+        digest.update(block)
+        size += len(block)
+    stream.seek(0)
+    return digest.hexdigest(), size
+
+def storage_folder(path):
+    """The folder of a storage path, which scopes dedup; '' at the bucket root."""
+    return path.rsplit('/', 1)[0] if '/' in path else ''
+
+def find_object(cursor, sha256, folder):
+    """Storage path of the object first uploaded with this content to `folder`, if any."""
+    cursor.execute('SELECT storage_path FROM content_objects WHERE folder = %s AND sha256 = %s', (folder, sha256))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return row['storage_path'] if isinstance(row, dict) else row[0]
+
+def record_object(cursor, sha256, path, size):
+    cursor.execute(
+        """
+        INSERT INTO content_objects (folder, sha256, storage_path, file_size) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (folder, sha256) DO UPDATE SET
+            storage_path = EXCLUDED.storage_path,
+            file_size = EXCLUDED.file_size,
+            created_at = CURRENT_TIMESTAMP
+        """,
+        (storage_folder(path), sha256, path, size)
+    )
+
+def forget_object(cursor, path):
+    cursor.execute('DELETE FROM content_objects WHERE storage_path = %s', (path,))
+
+def find_processed_material(cursor, sha256, exclude_id=None):
+    """
+    The oldest processed material built from this content, other than
+    `exclude_id`, as a dict of id, course_id and file_path. Expects a RealDictCursor.
+    """
+    cursor.execute(
+        """
+        SELECT id::text AS id, course_id::text AS course_id, file_path
+        FROM materials
+        WHERE content_sha256 = %s AND processed AND chunks_count > 0
+          AND (%s::text IS NULL OR id::text <> %s)
+        ORDER BY created_at
+        LIMIT 1
+        """,
+        (sha256, exclude_id, exclude_id)
+    )
+    return cursor.fetchone()
+
+def record(path, hit, size):
+    UPLOADS.inc(path=path, outcome='hit' if hit else 'miss')
+    if hit:
+        BYTES_SAVED.inc(size, path=path)
+
+def dedup_stats(cursor):
+    """
+    Stored hit rate over every hashed material, and this process's hit rates per
+    upload path. Expects a RealDictCursor.
+    """
+    cursor.execute(STATS_SQL)
+    stored = {key: int(value) for key, value in cursor.fetchone().items()}
+    stored['hit_rate'] = round(stored['duplicates'] / stored['materials'], 4) if stored['materials'] else 0.0
+    cursor.execute('SELECT count(*) AS objects FROM content_objects')
+    stored['storage_objects'] = int(cursor.fetchone()['objects'])
+
+    uploads = {}
+    for path in PATHS:
+        hits = int(UPLOADS.value(path=path, outcome='hit'))
+        misses = int(UPLOADS.value(path=path, outcome='miss'))
+        uploads[path] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            'bytes_saved': int(BYTES_SAVED.value(path=path)),
+        }
+    return {'stored': stored, 'since_start': uploads}
@@ -0,0 +1,293 @@
+"""
+Cascading cleanup of deleted course materials.
+
+Deleting a material removes, in this order:
+1. its chunks from embeddings, DELETE_BATCH_SIZE rows per transaction, matched
+   by metadata materialId or fileId (both indexed). Each batch takes its vectors
+   back out of the course score statistics in the same transaction, and drops
+   any re-embedding shadow rows for those chunks. The materials' summary rows
+   go with the first batch.
+2. its materials row, which bumps the course version for listing ETags.
+3. its storage object, last, so a failure there leaves nothing searchable.
+
+A storage object still referenced by another material, which happens when
+uploads are deduplicated (see dedup.py), is kept, and chunks named after its
+path are only deleted in courses left without a material using it.
+
+Large deletes leave dead tuples in embeddings and its vector indexes. After a
+deletion, IndexMaintainer checks the table's dead-tuple ratio in the background:
+past MAINTENANCE_VACUUM_RATIO it runs VACUUM (ANALYZE), and past
+MAINTENANCE_REINDEX_RATIO it first rebuilds the HNSW/ivfflat indexes
+concurrently, since vacuuming a graph index full of dead entries is slower than
+building it again. Requests arriving while a run is in progress are folded into
+one follow-up run.
+"""
+
+import os
+import time
+import threading
+
+import metrics
+import course_stats
+import material_summaries
+
+DELETE_BATCH_SIZE = int(os.environ.get("DELETE_BATCH_SIZE", "500"))
+MAINTENANCE_VACUUM_RATIO = float(os.environ.get("MAINTENANCE_VACUUM_RATIO", "0.1"))
+MAINTENANCE_REINDEX_RATIO = float(os.environ.get("MAINTENANCE_REINDEX_RATIO", "0.3"))
+
+DELETED_ROWS = metrics.counter(
+    'deleted_rows_total', 'Rows removed by material deletion.', ('table',)
+)
+DELETED_BYTES = metrics.counter(
+    'deleted_bytes_total', 'Bytes of embeddings rows removed by material deletion.'
+)
+MAINTENANCE_RUNS = metrics.counter(
+    'index_maintenance_total', 'Background maintenance runs on embeddings by action.', ('action',)
+)
+
+CREATE_INDEXES_SQL = '''
+    CREATE INDEX IF NOT EXISTS embeddings_material_id_idx ON embeddings ((metadata->>'materialId'));
+    CREATE INDEX IF NOT EXISTS embeddings_file_id_idx ON embeddings ((metadata->>'fileId'));
+'''
+
+# One batch of a material's chunks, with what is needed to correct the course statistics
+DELETE_BATCH_SQL = '''
+    DELETE FROM embeddings
+    WHERE ctid IN (
+        SELECT ctid FROM embeddings
+        WHERE metadata->>'materialId' = ANY(%(material_ids)s)
+           OR (metadata->>'fileId' = ANY(%(file_paths)s) AND (%(course_id)s::text IS NULL OR metadata->>'courseId' = %(course_id)s))
+        LIMIT %(limit)s
+    )
+    RETURNING id, metadata->>'courseId', embedding_model, embedding::text, pg_column_size(embeddings.*)
+'''
+
+def delete_materials(conn, material_ids=(), file_paths=(), delete_object=None, batch_size=DELETE_BATCH_SIZE, vector_conns=()):
+    """
+    Delete materials, given by id and/or storage path, with their chunks and
+    storage objects. `delete_object(path)` removes one storage object and returns
+    whether it succeeded. Chunks are deleted on `vector_conns` when the vectors
+    are sharded, otherwise on `conn`. Returns a report of what was reclaimed.
+    """
+    conn.autocommit = False
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            'SELECT id::text, file_path, course_id::text FROM materials WHERE id::text = ANY(%s) OR file_path = ANY(%s)',
+            (list(material_ids), list(file_paths))
+        )
+        materials = cursor.fetchall()
+        material_ids = sorted(set(material_ids) | {row[0] for row in materials})
+        file_paths = sorted(set(file_paths) | {row[1] for row in materials if row[1]})
+
+        # Paths other materials still use keep their object and other courses' chunks
+        cursor.execute(
+            'SELECT file_path, course_id::text FROM materials WHERE file_path = ANY(%s) AND NOT (id::text = ANY(%s))',
+            (file_paths, material_ids)
+        )
+        surviving = cursor.fetchall()
+        shared = {row[0] for row in surviving}
+        shared_chunks = sorted(
+            {(row[1], row[2]) for row in materials if row[1] in shared and row[2]} - set(surviving)
+        )
+        file_paths = [path for path in file_paths if path not in shared]
+        conn.commit()
+
+        courses = set()
+        rows = 0
+        row_bytes = 0
+        for vector_conn in vector_conns or [conn]:
+            deleted_rows, deleted_bytes = delete_chunks(vector_conn, material_ids, file_paths, batch_size, courses)
+            rows += deleted_rows
+            row_bytes += deleted_bytes
+            for path, course_id in shared_chunks:
+                deleted_rows, deleted_bytes = delete_chunks(vector_conn, (), [path], batch_size, courses, course_id)
+                rows += deleted_rows
+                row_bytes += deleted_bytes
+
+        cursor.execute('DELETE FROM materials WHERE id::text = ANY(%s) RETURNING course_id::text', (material_ids,))
+        courses.update(row[0] for row in cursor.fetchall())
+        materials_deleted = cursor.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    objects_deleted = []
+    objects_failed = []
+    if delete_object is not None:
+        for path in file_paths:
+            (objects_deleted if delete_object(path) else objects_failed).append(path)
+
+    DELETED_ROWS.inc(rows, table='embeddings')
+    DELETED_ROWS.inc(materials_deleted, table='materials')
+    DELETED_BYTES.inc(row_bytes)
+    return {
+        'material_ids': material_ids,
+        'courses': sorted(courses),
+        'materials_deleted': materials_deleted,
+        'embeddings_deleted': rows,
+        'bytes_reclaimed': row_bytes,
+        'storage_deleted': objects_deleted,
+        'storage_failed': objects_failed,
+        'storage_kept': sorted(shared),
+    }
+
+def delete_chunks(conn, material_ids=(), file_paths=(), batch_size=DELETE_BATCH_SIZE, courses=None, course_id=None):
+    """
+    Delete the chunks of materials or files on one vector node, batch by batch,
+    taking them out of the course statistics. With `course_id`, only that
+    course's chunks named after `file_paths` are deleted. Adds the courses
+    touched to `courses` and returns (rows, bytes) removed.
+    """
+    conn.autocommit = False
+    cursor = conn.cursor()
+    try:
+        removed = remove_chunks(cursor, material_ids, file_paths, batch_size, courses, course_id, after_batch=conn.commit)
+        conn.commit()
+        return removed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def remove_chunks(cursor, material_ids=(), file_paths=(), batch_size=DELETE_BATCH_SIZE, courses=None, course_id=None, after_batch=None):
+    """
+    delete_chunks on the caller's cursor and transaction, for callers that
+    replace chunks and must commit the removal together with what replaces it.
+    `after_batch`, when given, is called after each batch, e.g. to commit it.
+    """
+    import numpy as np
+
+    material_ids = list(material_ids)
+    file_paths = list(file_paths)
+    courses = set() if courses is None else courses
+
+    has_shadow = _table_exists(cursor, 'embeddings_reembed')
+    if _table_exists(cursor, 'material_summaries'):
+        material_summaries.delete_summaries(cursor, material_ids + file_paths, course_id)
+    rows = 0
+    row_bytes = 0
+    while True:
+        cursor.execute(DELETE_BATCH_SQL, {
+            'material_ids': material_ids, 'file_paths': file_paths, 'course_id': course_id, 'limit': batch_size
+        })
+        deleted = cursor.fetchall()
+        if not deleted:
+            return rows, row_bytes
+        removed = {}
+        for _, chunk_course, model_name, embedding, size in deleted:
+            removed.setdefault((chunk_course, model_name), []).append(np.fromstring(embedding[1:-1], sep=','))
+            row_bytes += size
+        for (chunk_course, model_name), vectors in sorted(removed.items(), key=lambda item: (item[0][0] or '', item[0][1])):
+            if chunk_course:
+                course_stats.update_course_stats(cursor, chunk_course, model_name, vectors, removed=True)
+                courses.add(chunk_course)
+        if has_shadow:
+            cursor.execute('DELETE FROM embeddings_reembed WHERE id = ANY(%s)', (list({row[0] for row in deleted}),))
+        if after_batch is not None:
+            after_batch()
+        rows += len(deleted)
+
+def _table_exists(cursor, table):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (table,))
+    return cursor.fetchone()[0]
+
+def dead_tuple_ratio(cursor, table='embeddings'):
+    cursor.execute(
+        'SELECT n_live_tup, n_dead_tup FROM pg_stat_user_tables WHERE relid = to_regclass(%s)',
+        (table,)
+    )
+    row = cursor.fetchone()
+    if not row or not (row[0] + row[1]):
+        return 0.0
+    return row[1] / (row[0] + row[1])
+
+def vector_indexes(cursor, table='embeddings'):
+    cursor.execute(
+        """
+        SELECT i.indexrelid::regclass::text
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.indrelid = to_regclass(%s) AND am.amname IN ('hnsw', 'ivfflat')
+        ORDER BY 1
+        """,
+        (table,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+class IndexMaintainer:
+    def __init__(self, connect, vacuum_ratio=MAINTENANCE_VACUUM_RATIO, reindex_ratio=MAINTENANCE_REINDEX_RATIO, log=print):
+        self.connect = connect
+        self.vacuum_ratio = vacuum_ratio
+        self.reindex_ratio = reindex_ratio
+        self.log = log
+        self.last_run = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = False
+
+    def schedule(self):
+        """Run maintenance in the background, or once more after the current run."""
+        with self._lock:
+            if self._running:
+                self._pending = True
+                return
+            self._running = True
+        threading.Thread(target=self._loop, name='index-maintenance', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.run()
+            except Exception as e:
+                self.log(f"Warning: embeddings maintenance failed: {e}")
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                self._pending = False
+
+    def run(self):
+        """Check the dead-tuple ratio and vacuum or rebuild as needed. Returns what was done."""
+        conn = self.connect()
+        # VACUUM and REINDEX CONCURRENTLY cannot run inside a transaction
+        conn.autocommit = True
+        cursor = conn.cursor()
+        try:
+            start = time.perf_counter()
+            ratio = dead_tuple_ratio(cursor)
+            cursor.execute("SELECT pg_total_relation_size('embeddings')")
+            size_before = cursor.fetchone()[0]
+            actions = []
+            if ratio >= self.reindex_ratio:
+                for index in vector_indexes(cursor):
+                    cursor.execute(f'REINDEX INDEX CONCURRENTLY {index}')
+                actions.append('reindex')
+            if ratio >= self.vacuum_ratio:
+                cursor.execute('VACUUM (ANALYZE) embeddings')
+                actions.append('vacuum')
+            cursor.execute("SELECT pg_total_relation_size('embeddings')")
+            size_after = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+            conn.close()
+
+        for action in actions or ['none']:
+            MAINTENANCE_RUNS.inc(action=action)
+        self.last_run = {
+            'dead_tuple_ratio': round(ratio, 4),
+            'actions': actions,
+            'bytes_before': size_before,
+            'bytes_after': size_after,
+            'bytes_reclaimed': max(size_before - size_after, 0),
+            'seconds': round(time.perf_counter() - start, 3),
+            'finished_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        if actions:
+            self.log(f"Embeddings maintenance: {', '.join(actions)} at dead ratio {ratio:.2f}, reclaimed {self.last_run['bytes_reclaimed']} bytes")
+        return self.last_run
@@ -0,0 +1,208 @@
+"""
+Streaming export and import of stored embeddings.
+
+An archive is a directory holding:
+- vectors.npy: float32 matrix with one row per chunk, written through a
+  memory-mapped .npy file, so the client never holds the full matrix
+- rows.jsonl: id, content, metadata, model and created_at of each row, in the
+  same order as the matrix
+- manifest.json: model, dimension, row count and where the export came from
+
+Exports read from a named server-side cursor inside a REPEATABLE READ
+transaction, so the row count taken up front matches the rows streamed. Imports
+COPY batches into a temporary staging table and merge them into embeddings in
+one transaction, then rebuild the score statistics of the affected courses.
+
+Run from the backend directory:
+    python embedding_archive.py export DIR [--course COURSE_ID] [--model MODEL]
+    python embedding_archive.py import DIR [--replace]
+"""
+
+import io
+import os
+import csv
+import json
+import time
+import argparse
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+import course_stats
+
+ARCHIVE_FORMAT = 1
+EXPORT_FETCH_SIZE = 2000
+IMPORT_BATCH_SIZE = 5000
+
+def export_embeddings(conn, directory, model_name, course_id=None, fetch_size=EXPORT_FETCH_SIZE):
+    """
+    Write one model's embeddings, optionally for one course, to an archive directory.
+    Returns the manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    conn.autocommit = False
+    conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+    start = time.perf_counter()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT count(*), max(embedding_dim) FROM embeddings
+            WHERE embedding_model = %s AND (%s::text IS NULL OR metadata->>'courseId' = %s)
+            """,
+            (model_name, course_id, course_id)
+        )
+        count, dimension = cursor.fetchone()
+        cursor.close()
+
+        vectors = open_memmap(os.path.join(directory, 'vectors.npy'), mode='w+', dtype=np.float32, shape=(count, dimension or 0))
+        stream = conn.cursor(name='embedding_export')
+        stream.itersize = fetch_size
+        stream.execute(
+            """
+            SELECT id, content, metadata, created_at, embedding::text FROM embeddings
+            WHERE embedding_model = %s AND (%s::text IS NULL OR metadata->>'courseId' = %s)
+            ORDER BY id
+            """,
+            (model_name, course_id, course_id)
+        )
+        with open(os.path.join(directory, 'rows.jsonl'), 'w') as rows_file:
+            for i, (chunk_id, content, metadata, created_at, embedding) in enumerate(stream):
+                vectors[i] = np.fromstring(embedding[1:-1], sep=',', dtype=np.float32)
+                rows_file.write(json.dumps({
+                    'id': chunk_id,
+                    'content': content,
+                    'metadata': metadata,
+                    'created_at': created_at.isoformat() if created_at else None,
+                }) + '\n')
+        stream.close()
+        vectors.flush()
+        del vectors
+    finally:
+        conn.rollback()
+
+    manifest = {
+        'format': ARCHIVE_FORMAT,
+        'embedding_model': model_name,
+        'embedding_dim': dimension,
+        'count': count,
+        'course_id': course_id,
+        'exported_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def _copy_batch(cursor, model_name, dimension, rows, vectors):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row, vector in zip(rows, vectors):
+        writer.writerow([
+            row['id'],
+            row['content'],
+            '[' + ','.join(map(str, vector.tolist())) + ']',
+            json.dumps(row['metadata']) if row['metadata'] is not None else None,
+            model_name,
+            dimension,
+            row['created_at'],
+        ])
+    buffer.seek(0)
+    cursor.copy_expert(
+        'COPY embeddings_import (id, content, embedding, metadata, embedding_model, embedding_dim, created_at) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (content))',
+        buffer
+    )
+
+def import_embeddings(conn, directory, replace=False, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Load an archive into embeddings. Existing (id, model) rows are kept unless
+    `replace` is set. Returns the number of rows inserted or replaced.
+    """
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != ARCHIVE_FORMAT:
+        raise ValueError(f"Unsupported archive format: {manifest.get('format')}")
+    model_name = manifest['embedding_model']
+    dimension = manifest['embedding_dim']
+    vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+    if vectors.shape[0] != manifest['count']:
+        raise ValueError("vectors.npy does not match the manifest row count")
+
+    conn.autocommit = False
+    cursor = conn.cursor()
+    try:
+        cursor.execute('CREATE TEMP TABLE embeddings_import (LIKE embeddings INCLUDING DEFAULTS) ON COMMIT DROP')
+        course_ids = set()
+        with open(os.path.join(directory, 'rows.jsonl')) as rows_file:
+            batch = []
+            offset = 0
+            for line in rows_file:
+                row = json.loads(line)
+                course_ids.add((row['metadata'] or {}).get('courseId'))
+                batch.append(row)
+                if len(batch) == batch_size:
+                    _copy_batch(cursor, model_name, dimension, batch, vectors[offset:offset + len(batch)])
+                    offset += len(batch)
+                    batch = []
+            if batch:
+                _copy_batch(cursor, model_name, dimension, batch, vectors[offset:offset + len(batch)])
+
+        conflict = '''DO UPDATE SET
+                content = EXCLUDED.content,
+                embedding = EXCLUDED.embedding,
+                metadata = EXCLUDED.metadata,
+                embedding_dim = EXCLUDED.embedding_dim,
+                created_at = EXCLUDED.created_at''' if replace else 'DO NOTHING'
+        cursor.execute(f'''
+            INSERT INTO embeddings (id, content, embedding, metadata, embedding_model, embedding_dim, created_at)
+            SELECT id, content, embedding, metadata, embedding_model, embedding_dim, created_at FROM embeddings_import
+            ON CONFLICT (id, embedding_model) {conflict}
+        ''')
+        loaded = cursor.rowcount
+
+        # Statistics are cheaper to rebuild than to correct for replaced rows
+        course_ids.discard(None)
+        if course_ids:
+            cursor.execute(
+                'DELETE FROM course_score_stats WHERE embedding_model = %s AND course_id = ANY(%s)',
+                (model_name, list(course_ids))
+            )
+            course_stats.backfill_course_stats(cursor, model_name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return loaded
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import stored embeddings.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='write embeddings to an archive directory')
+    export_parser.add_argument('directory')
+    export_parser.add_argument('--course', help='only export this course')
+    export_parser.add_argument('--model', help="embedding model; defaults to the app's current model")
+    import_parser = commands.add_parser('import', help='load an archive directory into embeddings')
+    import_parser.add_argument('directory')
+    import_parser.add_argument('--replace', action='store_true', help='overwrite rows that already exist')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    from app import get_db_connection, embedding_provider
+    conn = get_db_connection()
+    start = time.perf_counter()
+    try:
+        if args.command == 'export':
+            manifest = export_embeddings(conn, args.directory, args.model or embedding_provider.model_name, args.course)
+            print(f"Exported {manifest['count']} rows ({manifest['embedding_model']}, dim {manifest['embedding_dim']}) to {args.directory}")
+        else:
+            loaded = import_embeddings(conn, args.directory, replace=args.replace)
+            print(f"Imported {loaded} rows from {args.directory}")
+    finally:
+        conn.close()
+    print(f"Took {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Pluggable embedding providers.
+
+The backend embeds text through an EmbeddingProvider chosen by the
+EMBEDDING_PROVIDER environment variable:
+
+- `openai` (default): text-embedding-3-small through the OpenAI gateway, with
+  chunks sent in batches instead of one request per chunk.
+- `local`: a sentence-transformers model on CPU. Batches are spread across a
+  process pool, with each worker loading the model once, so bulk re-indexing is
+  not bound by network latency or API rate limits.
+
+Every stored row records the provider's model name and dimension, and searches
+only compare against rows embedded by the same model.
+"""
+
+import os
+import re
+import abc
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import vectors
+import openai_gateway
+
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+OPENAI_BATCH_SIZE = int(os.environ.get("OPENAI_EMBEDDING_BATCH_SIZE", "64"))
+
+LOCAL_EMBEDDING_MODEL = os.environ.get("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_WORKERS = int(os.environ.get("LOCAL_EMBEDDING_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+LOCAL_BATCH_SIZE = int(os.environ.get("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+
+# Output dimensions of common local models, so the pool need not start just to ask
+KNOWN_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+    "sentence-transformers/all-MiniLM-L6-v2": 384,
+    "sentence-transformers/all-mpnet-base-v2": 768,
+    "BAAI/bge-small-en-v1.5": 384,
+    "BAAI/bge-base-en-v1.5": 768,
+}
+
+def index_suffix(model_name):
+    """Identifier-safe form of a model name, used to name its vector index."""
+    return re.sub(r'[^a-z0-9]+', '_', model_name.lower()).strip('_')
+
+def create_vector_index(cursor, model_name, dimension, concurrently=False):
+    """
+    Create the model's partial HNSW index on embeddings; queries must cast to the
+    same dimension to use it. HNSW needs no training data, so it can be created
+    while the model has no rows yet.
+    """
+    cursor.execute(f'''
+        CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS embeddings_{index_suffix(model_name)}_idx
+        ON embeddings USING hnsw ((embedding::vector({int(dimension)})) vector_cosine_ops)
+        WHERE embedding_model = %s;
+    ''', (model_name,))
+
+def batched(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+class EmbeddingProvider(abc.ABC):
+    """
+    Interface for turning texts into vectors. Subclasses implement embed;
+    embed_matrix defaults to converting its result.
+
+    `model_name` and `dimension` are stored with every row the provider embeds.
+    """
+
+    model_name = None
+    dimension = None
+
+    @abc.abstractmethod
+    def embed(self, texts, lane=openai_gateway.BULK):
+        """Return one embedding (list of floats) per input text, in order."""
+
+    def embed_matrix(self, texts, lane=openai_gateway.BULK):
+        """Return the embeddings as one (len(texts), dimension) float32 array."""
+        return vectors.as_matrix(self.embed(texts, lane=lane), self.dimension)
+
+    def embed_one(self, text, lane=openai_gateway.INTERACTIVE):
+        return self.embed([text], lane=lane)[0]
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    def __init__(self, gateway, model_name=OPENAI_EMBEDDING_MODEL, batch_size=OPENAI_BATCH_SIZE):
+        self.gateway = gateway
+        self.model_name = model_name
+        self.dimension = KNOWN_DIMENSIONS[model_name]
+        self.batch_size = batch_size
+
+    def embed(self, texts, lane=openai_gateway.BULK):
+        return self.embed_matrix(texts, lane=lane).tolist()
+
+    def embed_matrix(self, texts, lane=openai_gateway.BULK):
+        import numpy as np
+        texts = list(texts)
+        # Decoded from base64 straight into the array, never as Python floats
+        matrix = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for start, batch in zip(range(0, len(texts), self.batch_size), batched(texts, self.batch_size)):
+            response = self.gateway.create_embedding(model=self.model_name, input=batch, lane=lane, encoding_format='base64')
+            # The API does not promise to return items in input order
+            for item in response.data:
+                matrix[start + item.index] = vectors.decode_base64(item.embedding)
+        return matrix
+
+# Model instance inside each local worker process
+_worker_model = None
+
+def _init_local_worker(model_name):
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name, device='cpu')
+
+def _encode_local_batch(texts):
+    encoded = _worker_model.encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True)
+    return encoded.astype('float32')
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    CPU embedding with a sentence-transformers model across a process pool.
+    """
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, workers=LOCAL_EMBEDDING_WORKERS, batch_size=LOCAL_BATCH_SIZE):
+        self.model_name = model_name
+        self.workers = workers
+        self.batch_size = batch_size
+        self._executor = None
+        self._lock = threading.Lock()
+        self.dimension = KNOWN_DIMENSIONS.get(model_name) or int(os.environ.get("LOCAL_EMBEDDING_DIM", "0")) or None
+        if self.dimension is None:
+            self.dimension = len(self.embed_one("dimension probe"))
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn avoids forking a process that may already hold threads or sockets
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_local_worker,
+                    initargs=(self.model_name,)
+                )
+            return self._executor
+
+    def embed(self, texts, lane=openai_gateway.BULK):
+        return self.embed_matrix(texts, lane=lane).tolist()
+
+    def embed_matrix(self, texts, lane=openai_gateway.BULK):
+        import numpy as np
+        texts = list(texts)
+        if not texts:
+            return vectors.as_matrix([], self.dimension)
+        return vectors.as_matrix(np.concatenate(list(self._get_executor().map(_encode_local_batch, batched(texts, self.batch_size)))))
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+def create_embedding_provider(gateway, kind=None, model_name=None):
+    """
+    Build the provider selected by EMBEDDING_PROVIDER, or the given kind and model.
+    """
+    kind = (kind or os.environ.get("EMBEDDING_PROVIDER", "openai")).lower()
+    if kind == "local":
+        return LocalEmbeddingProvider(model_name or LOCAL_EMBEDDING_MODEL)
+    if kind == "openai":
+        return OpenAIEmbeddingProvider(gateway, model_name or os.environ.get("OPENAI_EMBEDDING_MODEL", OPENAI_EMBEDDING_MODEL))
+    raise ValueError(f"Unknown EMBEDDING_PROVIDER: {kind}")
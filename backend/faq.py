@@ -0,0 +1,484 @@
+"""
+Precomputed per-course FAQ answered without retrieval or a completion.
+
+Most chat traffic is a few logistics questions per course, such as due dates,
+office hours and the grading policy, asked over and over. An offline job mines
+them and stores a canonical answer for each:
+
+1. the course's questions from the last FAQ_LOOKBACK_DAYS in the queries table
+   are grouped by their normalised text, the distinct phrasings embedded, and
+   clustered greedily, most asked first: a phrasing joins the closest cluster
+   if its centroid is at least FAQ_CLUSTER_SIMILARITY similar, else starts one.
+2. clusters asked at least FAQ_MIN_QUERIES times become entries, at most
+   FAQ_MAX_ENTRIES per course. The canonical question is the most asked
+   phrasing.
+3. each answer is generated from the course's syllabus chunks closest to the
+   cluster, followed by the usual search results, on the BULK lane.
+
+Entries record the course version (course_versions, bumped whenever the
+course's materials change) they were built against and are only served while
+it is current. When a course's materials change in the app, FaqRebuilder
+rebuilds its FAQ in the background, FAQ_REBUILD_DELAY seconds later so a burst
+of uploads costs one rebuild; only courses that already have entries are
+rebuilt. Rebuild the courses whose materials changed since with --stale.
+
+Chat keeps a small in-process index per course, reloaded every FAQ_INDEX_TTL
+seconds: a question whose normalised text is a known phrasing is answered
+before it is even embedded, and otherwise its embedding is compared with every
+entry's centroid, answering when the best is at least FAQ_MATCH_SIMILARITY.
+
+Build or refresh the FAQ with:
+    python faq.py [--course COURSE_ID] [--stale]
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import metrics
+import vectors
+import singleflight
+import openai_gateway
+
+FAQ_ENABLED = os.environ.get("FAQ_ENABLED", "true").lower() == "true"
+FAQ_MATCH_SIMILARITY = float(os.environ.get("FAQ_MATCH_SIMILARITY", "0.9"))
+FAQ_CLUSTER_SIMILARITY = float(os.environ.get("FAQ_CLUSTER_SIMILARITY", "0.85"))
+FAQ_MIN_QUERIES = int(os.environ.get("FAQ_MIN_QUERIES", "5"))
+FAQ_MAX_ENTRIES = int(os.environ.get("FAQ_MAX_ENTRIES", "12"))
+FAQ_LOOKBACK_DAYS = int(os.environ.get("FAQ_LOOKBACK_DAYS", "60"))
+FAQ_SYLLABUS_CHUNKS = int(os.environ.get("FAQ_SYLLABUS_CHUNKS", "3"))
+FAQ_INDEX_TTL = float(os.environ.get("FAQ_INDEX_TTL", "60"))
+FAQ_REBUILD_DELAY = float(os.environ.get("FAQ_REBUILD_DELAY", "30"))
+
+# Only the most asked phrasings are embedded when mining
+MAX_PHRASINGS = 2000
+MAX_VARIANTS = 50
+
+LOOKUPS = metrics.counter(
+    'faq_lookups_total', 'Chat questions checked against the course FAQ by outcome.', ('outcome',)
+)
+REBUILDS = metrics.counter(
+    'faq_rebuilds_total', 'Background FAQ rebuilds after material changes by outcome.', ('outcome',)
+)
+
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS course_faq (
+        course_id TEXT NOT NULL,
+        entry_id INTEGER NOT NULL,
+        question TEXT NOT NULL,
+        variants TEXT[] NOT NULL DEFAULT '{}',
+        answer TEXT NOT NULL,
+        sources JSONB NOT NULL DEFAULT '[]',
+        material_ids TEXT[] NOT NULL DEFAULT '{}',
+        embedding_model TEXT NOT NULL,
+        centroid FLOAT8[] NOT NULL,
+        query_count BIGINT NOT NULL DEFAULT 0,
+        course_version BIGINT NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (course_id, entry_id)
+    );
+'''
+
+# Entries of a course built against its current materials
+LOAD_ENTRIES_SQL = '''
+    SELECT f.entry_id, f.question, f.variants, f.answer, f.sources, f.material_ids, f.centroid
+    FROM course_faq f
+    LEFT JOIN course_versions v ON v.course_id::text = f.course_id
+    WHERE f.course_id = %s
+      AND f.embedding_model = %s
+      AND f.course_version = COALESCE(v.version, 0)
+    ORDER BY f.entry_id
+'''
+
+SYLLABUS_CHUNKS_SQL = '''
+    SELECT id, content, metadata, 1 - (embedding::vector({dim}) <=> %(query)s::vector({dim})) AS similarity
+    FROM embeddings
+    WHERE embedding_model = %(model)s
+      AND embedding_dim = {dim}
+      AND metadata->>'courseId' = %(course_id)s
+      AND metadata->>'type' = 'syllabus'
+    ORDER BY embedding::vector({dim}) <=> %(query)s::vector({dim})
+    LIMIT %(count)s
+'''
+
+def course_version(cursor, course_id):
+    cursor.execute('SELECT version FROM course_versions WHERE course_id::text = %s', (course_id,))
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
+
+def is_stale(cursor, course_id, model_name):
+    """Whether the course has FAQ entries out of date with its materials or the embedding model."""
+    cursor.execute(
+        """
+        SELECT 1 FROM course_faq f
+        LEFT JOIN course_versions v ON v.course_id::text = f.course_id
+        WHERE f.course_id = %s AND (f.course_version <> COALESCE(v.version, 0) OR f.embedding_model <> %s)
+        LIMIT 1
+        """,
+        (course_id, model_name)
+    )
+    return cursor.fetchone() is not None
+
+def recent_questions(cursor, course_id, days=FAQ_LOOKBACK_DAYS):
+    """
+    Distinct normalised questions asked in the course, most asked first, as
+    (normalised, most common phrasing, count).
+    """
+    cursor.execute(
+        """
+        SELECT query FROM queries
+        WHERE course_id::text = %s AND created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+        """,
+        (course_id, days)
+    )
+    counts = Counter()
+    phrasings = {}
+    for (query,) in cursor.fetchall():
+        normalized = singleflight.normalize_query(query)
+        if not normalized:
+            continue
+        counts[normalized] += 1
+        phrasings.setdefault(normalized, Counter())[query.strip()] += 1
+    return [
+        (normalized, phrasings[normalized].most_common(1)[0][0], count)
+        for normalized, count in counts.most_common(MAX_PHRASINGS)
+    ]
+
+def cluster_questions(questions, embeddings, similarity=FAQ_CLUSTER_SIMILARITY,
+                      min_queries=FAQ_MIN_QUERIES, max_entries=FAQ_MAX_ENTRIES):
+    """
+    Group (normalised, phrasing, count) questions, most asked first, by their
+    embeddings. Returns the clusters asked at least `min_queries` times, most
+    asked first, each with its canonical question, phrasings and unit centroid.
+    """
+    import numpy as np
+
+    unit = np.asarray(embeddings, dtype=np.float64)
+    unit /= np.maximum(np.linalg.norm(unit, axis=1, keepdims=True), 1e-12)
+    clusters = []
+    centroids = np.empty((len(questions), unit.shape[1] if len(unit) else 0))
+    for (normalized, phrasing, count), vector in zip(questions, unit):
+        best = None
+        if clusters:
+            scores = centroids[:len(clusters)] @ vector
+            index = int(np.argmax(scores))
+            if scores[index] >= similarity:
+                best = clusters[index]
+        if best is None:
+            best = {'index': len(clusters), 'question': phrasing, 'variants': [], 'query_count': 0,
+                    'sum': np.zeros(len(vector))}
+            clusters.append(best)
+        best['variants'].append(normalized)
+        best['query_count'] += count
+        best['sum'] += count * vector
+        centroids[best['index']] = best['sum'] / max(np.linalg.norm(best['sum']), 1e-12)
+
+    frequent = sorted((c for c in clusters if c['query_count'] >= min_queries), key=lambda c: -c['query_count'])
+    return [
+        {
+            'question': cluster['question'],
+            'variants': cluster['variants'][:MAX_VARIANTS],
+            'query_count': cluster['query_count'],
+            'centroid': centroids[cluster['index']].tolist(),
+        }
+        for cluster in frequent[:max_entries]
+    ]
+
+def syllabus_chunks(cursor, course_id, model_name, embedding, count=FAQ_SYLLABUS_CHUNKS):
+    """The course's syllabus chunks closest to `embedding`. Expects a RealDictCursor."""
+    cursor.execute(SYLLABUS_CHUNKS_SQL.format(dim=int(len(embedding))), {
+        'query': vectors.to_text(embedding),
+        'model': model_name,
+        'course_id': course_id,
+        'count': count,
+    })
+    return cursor.fetchall()
+
+def store_entries(cursor, course_id, model_name, version, entries):
+    """Replace the course's FAQ with `entries` on the caller's transaction."""
+    # Rebuilds of one course in several workers replace it one after the other
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext('course_faq:' || %s))", (course_id,))
+    cursor.execute('DELETE FROM course_faq WHERE course_id = %s', (course_id,))
+    if not entries:
+        return
+    execute_values(cursor, '''
+        INSERT INTO course_faq
+            (course_id, entry_id, question, variants, answer, sources, material_ids,
+             embedding_model, centroid, query_count, course_version)
+        VALUES %s
+    ''', [
+        (course_id, entry_id, entry['question'], entry['variants'], entry['answer'], json.dumps(entry['sources']),
+         entry['material_ids'], model_name, entry['centroid'], entry['query_count'], version)
+        for entry_id, entry in enumerate(entries, 1)
+    ])
+
+class FaqIndex:
+    """
+    In-process nearest-neighbour index over the FAQ entries of each course.
+
+    A course is loaded on its first question, on a connection from `connect`,
+    and kept for FAQ_INDEX_TTL seconds, so other workers' rebuilds and material
+    changes are picked up; a course without entries is cached as empty.
+    Invalidating a course also schedules its rebuild on `rebuilder`, if given.
+    """
+
+    def __init__(self, connect, ttl=FAQ_INDEX_TTL, similarity=FAQ_MATCH_SIMILARITY, rebuilder=None):
+        self.connect = connect
+        self.ttl = ttl
+        self.similarity = similarity
+        self.rebuilder = rebuilder
+        self._courses = {}
+        self._lock = threading.Lock()
+
+    def exact(self, course_id, model_name, query):
+        """The entry listing the question's normalised text as a phrasing, if any."""
+        index = self._get(course_id, model_name)
+        return index['phrasings'].get(singleflight.normalize_query(query))
+
+    def nearest(self, course_id, model_name, query_embedding):
+        """The entry closest to the query embedding if it is similar enough, else None."""
+        import numpy as np
+
+        index = self._get(course_id, model_name)
+        matrix = index['matrix']
+        if matrix is None or matrix.shape[1] != len(query_embedding):
+            return None
+        vector = np.asarray(query_embedding, dtype=np.float32)
+        scores = matrix @ (vector / max(float(np.linalg.norm(vector)), 1e-12))
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return index['entries'][best]
+
+    def invalidate(self, course_id, rebuild=True):
+        with self._lock:
+            for key in [key for key in self._courses if key[0] == course_id]:
+                del self._courses[key]
+        if rebuild and self.rebuilder is not None:
+            self.rebuilder.schedule(course_id)
+
+    def _get(self, course_id, model_name):
+        key = (course_id, model_name)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._courses.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        index = self._load(course_id, model_name)
+        with self._lock:
+            self._courses[key] = (now + self.ttl, index)
+        return index
+
+    def _load(self, course_id, model_name):
+        import numpy as np
+
+        entries = []
+        try:
+            conn = self.connect(course_id)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(LOAD_ENTRIES_SQL, (course_id, model_name))
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                conn.close()
+        except psycopg2.Error as e:
+            print(f"Warning: could not load the FAQ of course {course_id}: {e}")
+            rows = []
+        for entry_id, question, variants, answer, sources, material_ids, centroid in rows:
+            entries.append({
+                'entry_id': entry_id,
+                'question': question,
+                'variants': variants,
+                'answer': answer,
+                'sources': sources,
+                'material_ids': material_ids,
+                'centroid': centroid,
+            })
+
+        matrix = None
+        if entries and len({len(entry['centroid']) for entry in entries}) == 1:
+            matrix = np.asarray([entry['centroid'] for entry in entries], dtype=np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        return {
+            'entries': entries,
+            'matrix': matrix,
+            'phrasings': {variant: entry for entry in entries for variant in entry['variants']},
+        }
+
+class FaqRebuilder:
+    """
+    Rebuilds the FAQ of courses whose materials changed, in a background
+    thread. `build(course_id)` does the work; courses scheduled while a pass
+    runs are rebuilt in the next one.
+    """
+
+    def __init__(self, build, delay=FAQ_REBUILD_DELAY, log=print):
+        self.build = build
+        self.delay = delay
+        self.log = log
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._running = False
+
+    def schedule(self, course_id):
+        """Rebuild the course in the background after the delay, once however often it is scheduled."""
+        with self._lock:
+            self._pending.add(course_id)
+            if self._running:
+                return
+            self._running = True
+        threading.Thread(target=self._loop, name='faq-rebuild', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.delay)
+            with self._lock:
+                courses, self._pending = self._pending, set()
+                if not courses:
+                    self._running = False
+                    return
+            for course_id in sorted(courses):
+                try:
+                    REBUILDS.inc(outcome='rebuilt' if self.build(course_id) else 'skipped')
+                except Exception as e:
+                    REBUILDS.inc(outcome='failed')
+                    self.log(f"Warning: FAQ rebuild of course {course_id} failed: {e}")
+
+def build_course_faq(course_id, conn, vector_conn, provider, answer, args):
+    """
+    Mine, answer and store the FAQ of one course. `answer(course_id, question,
+    context, embedding)` returns (answer, sources, material_ids). Returns the entries.
+    """
+    from psycopg2.extras import RealDictCursor
+
+    cursor = conn.cursor()
+    version = course_version(cursor, course_id)
+    questions = recent_questions(cursor, course_id, args.days)
+    entries = []
+    if questions:
+        embeddings = provider.embed_matrix([phrasing for _, phrasing, _ in questions], lane=openai_gateway.BULK)
+        entries = cluster_questions(questions, embeddings, args.cluster_similarity, args.min_queries, args.max_entries)
+
+    vector_cursor = vector_conn.cursor(cursor_factory=RealDictCursor)
+    for entry in entries:
+        context = syllabus_chunks(vector_cursor, course_id, provider.model_name, entry['centroid'], args.syllabus_chunks)
+        entry['answer'], entry['sources'], entry['material_ids'] = answer(course_id, entry['question'], context, entry['centroid'])
+    vector_cursor.close()
+
+    conn.autocommit = False
+    try:
+        store_entries(cursor, course_id, provider.model_name, version, entries)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return entries
+
+def answer_with(gateway, semantic_search, build_chat_messages, describe_sources, cited_material_ids, chat_model):
+    """The `answer` function of build_course_faq over the app's search and completion."""
+    def answer(course_id, question, syllabus, embedding):
+        # Syllabus chunks first, then whatever search finds that they do not cover
+        seen = {row['id'] for row in syllabus}
+        context = list(syllabus) + [row for row in semantic_search(question, course_id, query_embedding=embedding)
+                                    if row.get('id') not in seen]
+        response = gateway.create_chat_completion(
+            model=chat_model,
+            messages=build_chat_messages(question, context),
+            max_tokens=500,
+            lane=openai_gateway.BULK
+        )
+        return response.choices[0].message.content, describe_sources(context), cited_material_ids(context)
+    return answer
+
+def rebuild_course(course_id, db_router, provider, answer, args, stale_only=False):
+    """
+    Build the course's FAQ on its primaries. With `stale_only`, courses without
+    out-of-date entries are left alone and None is returned; else the entries.
+    """
+    conn = db_router.primary()
+    try:
+        if stale_only:
+            cursor = conn.cursor()
+            stale = is_stale(cursor, course_id, provider.model_name)
+            cursor.close()
+            if not stale:
+                return None
+        vector_conn = db_router.vector_primary(course_id)
+        try:
+            return build_course_faq(course_id, conn, vector_conn, provider, answer, args)
+        finally:
+            vector_conn.close()
+    finally:
+        conn.close()
+
+def faq_courses(cursor, model_name, days, min_queries, stale_only):
+    """
+    Courses to rebuild: those whose entries are out of date with their
+    materials or the embedding model, or, unless `stale_only`, every course
+    asked at least `min_queries` questions in the last `days` days.
+    """
+    cursor.execute(
+        """
+        SELECT DISTINCT f.course_id FROM course_faq f
+        LEFT JOIN course_versions v ON v.course_id::text = f.course_id
+        WHERE f.course_version <> COALESCE(v.version, 0) OR f.embedding_model <> %s
+        """,
+        (model_name,)
+    )
+    courses = {row[0] for row in cursor.fetchall()}
+    if not stale_only:
+        cursor.execute(
+            """
+            SELECT course_id::text FROM queries
+            WHERE created_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+            GROUP BY course_id HAVING count(*) >= %s
+            """,
+            (days, min_queries)
+        )
+        courses.update(row[0] for row in cursor.fetchall())
+    return sorted(courses)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the per-course FAQ served by chat.")
+    parser.add_argument('--course', help='only rebuild this course')
+    parser.add_argument('--stale', action='store_true', help='only rebuild courses whose materials changed since')
+    parser.add_argument('--days', type=int, default=FAQ_LOOKBACK_DAYS)
+    parser.add_argument('--min-queries', type=int, default=FAQ_MIN_QUERIES)
+    parser.add_argument('--max-entries', type=int, default=FAQ_MAX_ENTRIES)
+    parser.add_argument('--cluster-similarity', type=float, default=FAQ_CLUSTER_SIMILARITY)
+    parser.add_argument('--syllabus-chunks', type=int, default=FAQ_SYLLABUS_CHUNKS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    from app import (db_router, embedding_provider, gateway, semantic_search, build_chat_messages,
+                     describe_sources, cited_material_ids, CHAT_MODEL)
+
+    answer = answer_with(gateway, semantic_search, build_chat_messages, describe_sources, cited_material_ids, CHAT_MODEL)
+
+    conn = db_router.primary()
+    cursor = conn.cursor()
+    cursor.execute(CREATE_TABLE_SQL)
+    courses = [args.course] if args.course else faq_courses(
+        cursor, embedding_provider.model_name, args.days, args.min_queries, args.stale
+    )
+    cursor.close()
+    conn.close()
+
+    start = time.perf_counter()
+    for course_id in courses:
+        entries = rebuild_course(course_id, db_router, embedding_provider, answer, args)
+        print(f"Stored {len(entries)} FAQ entries for course {course_id}")
+    print(f"Rebuilt {len(courses)} courses in {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
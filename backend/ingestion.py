@@ -0,0 +1,593 @@
+"""
+Ingestion of course materials: text extraction, chunking, embedding and storage.
+
+/api/materials/process (uploads), /api/process-document (objects already in
+storage) and the bulk CLI below all go through this module. Every chunk gets the
+same id, `{source}_chunk_{i}` where the source is the material id or else the
+storage path, and the same metadata: courseId, materialId and/or fileId,
+chunkIndex and totalChunks, plus whatever fields the caller passes.
+
+Chunks are embedded into float32 arrays and written with one binary COPY and
+upsert per batch (see vectors.py), in the same transaction as the course score
+statistics and material summaries updates. Ingesting a source again replaces its
+chunks rather than failing on the primary key or leaving stale ones behind.
+
+A material whose content was already processed (see dedup.py) gets a copy of the
+original's chunks and vectors instead, with one INSERT ... SELECT when both
+courses live on the same node and a binary COPY between nodes otherwise.
+
+The CLI ingests a directory tree into one course:
+    python ingestion.py DIRECTORY --course COURSE_ID [--material-type lecture_notes]
+Files are hashed, extracted and chunked in a process pool, chunks are embedded
+in batches of INGEST_BATCH_CHUNKS with a few batches in flight, and each batch
+is stored in bulk with its materials rows. After each batch commits, the
+SHA-256 of every file in it is recorded in a manifest in the directory
+(.ingest-manifest.json). Running the command again skips files whose content
+and embedding model are unchanged, so an interrupted run resumes where it
+stopped. Material ids are derived from the course and relative path, so a
+changed file replaces its previous chunks.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import mimetypes
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+import metrics
+import tracing
+import deletion
+import vectors
+import course_stats
+import openai_gateway
+import material_summaries
+
+INGEST_BATCH_CHUNKS = int(os.environ.get("INGEST_BATCH_CHUNKS", "512"))
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+INGEST_EMBED_CONCURRENCY = int(os.environ.get("INGEST_EMBED_CONCURRENCY", "2"))
+
+MANIFEST_NAME = '.ingest-manifest.json'
+HASH_BLOCK_SIZE = 1 << 20
+
+# Material ids of CLI-ingested files are stable across runs
+MATERIAL_NAMESPACE = uuid.UUID('6f1d2c1e-5b7a-4c1f-9a8e-3d2b1c0a9e8f')
+
+# Chunks are loaded with a binary COPY into a per-session staging table, then upserted
+CREATE_STAGING_SQL = '''
+    CREATE TEMP TABLE IF NOT EXISTS embeddings_ingest (LIKE embeddings INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+'''
+
+STAGING_COLUMNS = [
+    ('id', 'text'),
+    ('content', 'text'),
+    ('embedding', 'vector'),
+    ('metadata', 'jsonb'),
+    ('embedding_model', 'text'),
+    ('embedding_dim', 'int4'),
+]
+
+INSERT_CHUNKS_SQL = '''
+    INSERT INTO embeddings (id, content, embedding, metadata, embedding_model, embedding_dim, created_at)
+    SELECT id, content, embedding, metadata, embedding_model, embedding_dim, created_at FROM embeddings_ingest
+    ON CONFLICT (id, embedding_model) DO UPDATE
+    SET content = EXCLUDED.content,
+        embedding = EXCLUDED.embedding,
+        metadata = EXCLUDED.metadata,
+        embedding_dim = EXCLUDED.embedding_dim,
+        created_at = EXCLUDED.created_at
+'''
+
+UPSERT_MATERIALS_SQL = '''
+    INSERT INTO materials (id, file_name, file_path, file_type, file_size, material_type, course_id, processed, chunks_count, content_sha256)
+    VALUES %s
+    ON CONFLICT (id) DO UPDATE
+    SET file_type = EXCLUDED.file_type,
+        file_size = EXCLUDED.file_size,
+        content_sha256 = EXCLUDED.content_sha256,
+        material_type = EXCLUDED.material_type,
+        processed = EXCLUDED.processed,
+        chunks_count = EXCLUDED.chunks_count
+'''
+
+# Another material's chunks renamed for the target material, in STAGING_COLUMNS order.
+# Chunks of documents processed from storage may be named after the path instead.
+CLONE_CHUNKS_SQL = '''
+    SELECT %(material_id)s || '_chunk_' || (metadata->>'chunkIndex'),
+           content,
+           embedding,
+           (metadata - 'fileId') || %(metadata)s::jsonb,
+           embedding_model,
+           embedding_dim
+    FROM embeddings
+    WHERE embedding_model = %(model)s
+      AND (metadata->>'materialId' = %(source_id)s
+           OR (metadata->>'materialId' IS NULL AND metadata->>'fileId' = %(source_path)s
+               AND metadata->>'courseId' = %(source_course)s))
+'''
+
+def chunk_text(text, chunk_size=1000, overlap=200):
+    """
+    Split text into overlapping chunks for better semantic search.
+    """
+    if len(text) <= chunk_size:
+        return [text]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        # Try to find a natural break point like a newline or period
+        if end < len(text):
+            # Look for the last period or newline within the chunk
+            for break_char in ['\n', '.', '!', '?']:
+                last_break = text[start:end].rfind(break_char)
+                if last_break != -1:
+                    end = start + last_break + 1
+                    break
+
+        chunks.append(text[start:end])
+        start = end - overlap if end - overlap > start else end
+
+    return chunks
+
+def extract_text_from_file(file_path, file_type=None):
+    """
+    Extract text from different file types.
+    This is a simplified implementation. In production, use specific libraries for each file type.
+    """
+    file_type = file_type or mimetypes.guess_type(file_path)[0]
+    if file_type == 'text/plain':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    # In a real application, you would add support for more file types:
+    # - PDF: using PyPDF2 or pdfminer
+    # - DOCX: using python-docx
+    # - PPTX: using python-pptx
+    # - etc.
+    else:
+        # For simplicity, just read the file as text
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except Exception:
+            return "Could not extract text from this file type."
+
+def build_documents(text, metadata):
+    """
+    Chunk `text` into documents with ids and metadata. `metadata` needs a
+    materialId or a fileId to name the chunks after.
+    """
+    source_id = metadata.get('materialId') or metadata['fileId']
+    if not text.strip():
+        return []
+    with tracing.span('chunk_text', input_chars=len(text)) as chunk_span:
+        chunks = chunk_text(text)
+        chunk_span.set(chunks=len(chunks))
+    return [
+        {
+            "id": f"{source_id}_chunk_{i}",
+            "content": chunk,
+            "metadata": {
+                **metadata,
+                "chunkIndex": i,
+                "totalChunks": len(chunks)
+            }
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+
+def store_documents(conn, documents, embeddings, model_name, replace=True):
+    """
+    Write embedded documents to embeddings on `conn`, the primary of the node
+    holding their courses' vectors, and fold them into the course statistics in
+    the same transaction. `embeddings` is a float32 matrix from embed_matrix()
+    or a list of vectors. With `replace`, earlier chunks of the same materials or
+    files are deleted first, in the same transaction.
+    """
+    if not documents:
+        return
+
+    conn.autocommit = False
+    cursor = conn.cursor()
+    try:
+        if replace:
+            # In the same transaction, so a failed write leaves the previous chunks in place
+            material_ids = sorted({doc['metadata']['materialId'] for doc in documents if doc['metadata'].get('materialId')})
+            file_paths = sorted({doc['metadata']['fileId'] for doc in documents if doc['metadata'].get('fileId')})
+            deletion.remove_chunks(cursor, material_ids, file_paths)
+        cursor.execute(CREATE_STAGING_SQL)
+        vectors.copy_rows(cursor, 'embeddings_ingest', STAGING_COLUMNS, (
+            (doc['id'], doc['content'], embedding, json.dumps(doc['metadata']), model_name, len(embedding))
+            for doc, embedding in zip(documents, embeddings)
+        ))
+        cursor.execute(INSERT_CHUNKS_SQL)
+        by_course = {}
+        for doc, embedding in zip(documents, embeddings):
+            by_course.setdefault(doc['metadata'].get('courseId'), []).append(embedding)
+        # Lock statistics rows in a fixed order so concurrent batches cannot deadlock
+        for course_id in sorted(by_course, key=str):
+            course_stats.update_course_stats(cursor, course_id, model_name, by_course[course_id])
+        material_summaries.update_summaries(
+            cursor, model_name, {doc['metadata'].get('materialId') or doc['metadata'].get('fileId') for doc in documents}
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def clone_chunks(source_conn, conn, original, metadata, model_name):
+    """
+    Copy the chunks of `original` (a processed material's id, course_id and
+    file_path) into the material `metadata` describes, on `conn`, the primary of
+    the node holding its course's vectors. `source_conn` reads the original's
+    node and may be `conn` itself, in which case rows never leave the database;
+    otherwise they are streamed across in binary COPY format. Nothing is
+    extracted or embedded. Returns the number of chunks copied.
+    """
+    query = CLONE_CHUNKS_SQL
+    params = {
+        'material_id': metadata['materialId'],
+        'metadata': json.dumps(metadata),
+        'model': model_name,
+        'source_id': original['id'],
+        'source_path': original['file_path'],
+        'source_course': original['course_id'],
+    }
+    columns = ', '.join(name for name, _ in STAGING_COLUMNS)
+
+    conn.autocommit = False
+    cursor = conn.cursor()
+    try:
+        deletion.remove_chunks(cursor, [metadata['materialId']])
+        cursor.execute(CREATE_STAGING_SQL)
+        if source_conn is conn:
+            cursor.execute(f"INSERT INTO embeddings_ingest ({columns}) {query}", params)
+        else:
+            buffer = io.BytesIO()
+            source_cursor = source_conn.cursor()
+            try:
+                source_cursor.copy_expert(
+                    f"COPY ({source_cursor.mogrify(query, params).decode()}) TO STDOUT WITH (FORMAT binary)", buffer
+                )
+            finally:
+                source_cursor.close()
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY embeddings_ingest ({columns}) FROM STDIN WITH (FORMAT binary)", buffer)
+        cursor.execute('SELECT count(*), sum(embedding)::text FROM embeddings_ingest')
+        count, vector_sum = cursor.fetchone()
+        if count:
+            cursor.execute(INSERT_CHUNKS_SQL)
+            # Stored embeddings are unit length, so their sum is all the statistics need
+            course_stats.fold_vector_sum(
+                cursor, metadata.get('courseId'), model_name, count, [float(value) for value in vector_sum[1:-1].split(',')]
+            )
+            material_summaries.update_summaries(cursor, model_name, {metadata['materialId']})
+        conn.commit()
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+class Ingestor:
+    """
+    Embeds documents and stores them on the node holding each course's vectors.
+    """
+
+    def __init__(self, router, provider, stats_cache=None):
+        self.router = router
+        self.provider = provider
+        self.stats_cache = stats_cache
+
+    def ingest_text(self, text, metadata, source):
+        """Chunk, embed and store one source's text. Returns its documents."""
+        documents = build_documents(text, metadata)
+        embeddings = self.provider.embed_matrix([doc['content'] for doc in documents], lane=openai_gateway.BULK)
+        self.store(documents, embeddings, source)
+        return documents
+
+    def store(self, documents, embeddings, source):
+        by_course = {}
+        for doc, embedding in zip(documents, embeddings):
+            by_course.setdefault(doc['metadata'].get('courseId'), []).append((doc, embedding))
+
+        for course_id, pairs in by_course.items():
+            conn = self.router.vector_primary(course_id)
+            try:
+                store_documents(conn, [doc for doc, _ in pairs], [embedding for _, embedding in pairs], self.provider.model_name)
+                self.router.mark_written(course_id, conn, vectors=True)
+            finally:
+                conn.close()
+            if self.stats_cache is not None:
+                self.stats_cache.invalidate(course_id)
+
+        metrics.INGESTION_CHUNKS.inc(len(documents), source=source)
+
+    def clone(self, original, metadata, source):
+        """
+        Copy a processed material's chunks into the material in `metadata`
+        (materialId, courseId and the fields to set). Returns the chunk count.
+        """
+        course_id = metadata.get('courseId')
+        conn = self.router.vector_primary(course_id)
+        try:
+            same_node = self.router.vector_node(original['course_id']) is self.router.vector_node(course_id)
+            source_conn = conn if same_node else self.router.vector_read(original['course_id'])
+            try:
+                count = clone_chunks(source_conn, conn, original, metadata, self.provider.model_name)
+            finally:
+                if source_conn is not conn:
+                    source_conn.close()
+            self.router.mark_written(course_id, conn, vectors=True)
+        finally:
+            conn.close()
+        if self.stats_cache is not None:
+            self.stats_cache.invalidate(course_id)
+
+        metrics.INGESTION_CHUNKS.inc(count, source=source)
+        return count
+
+    def forget_path(self, file_path, course_id):
+        """Delete a course's chunks that are named after a storage path rather than a material."""
+        conn = self.router.vector_primary(course_id)
+        try:
+            deletion.delete_chunks(conn, file_paths=[file_path], course_id=course_id)
+            self.router.mark_written(course_id, conn, vectors=True)
+        finally:
+            conn.close()
+
+# Bulk directory ingestion
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def material_id_for(course_id, relative_path):
+    return str(uuid.uuid5(MATERIAL_NAMESPACE, f"{course_id}/{relative_path}"))
+
+def list_files(directory):
+    """Relative paths of the files under `directory`, skipping hidden files and directories."""
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if not name.startswith('.'):
+                paths.append(os.path.relpath(os.path.join(root, name), directory))
+    return paths
+
+def _prepare_file(task):
+    """
+    Runs in a worker process: hash a file and, unless the hash is `known_hash`,
+    extract and chunk it.
+    """
+    directory, relative_path, known_hash, metadata = task
+    start = time.perf_counter()
+    path = os.path.join(directory, relative_path)
+    sha256 = file_sha256(path)
+    prepared = {
+        'path': relative_path,
+        'material_id': material_id_for(metadata['courseId'], relative_path),
+        'sha256': sha256,
+        'size': os.path.getsize(path),
+        'file_type': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        'documents': None,
+    }
+    if sha256 != known_hash:
+        text = extract_text_from_file(path, prepared['file_type'])
+        prepared['documents'] = build_documents(text, {**metadata, 'materialId': prepared['material_id']})
+    prepared['seconds'] = time.perf_counter() - start
+    return prepared
+
+def load_manifest(path, course_id, model_name):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = None
+    if not manifest or manifest.get('course_id') != course_id or manifest.get('embedding_model') != model_name:
+        if manifest:
+            print(f"Manifest {path} is for another course or model; ingesting every file")
+        manifest = {'course_id': course_id, 'embedding_model': model_name, 'files': {}}
+    return manifest
+
+def save_manifest(path, manifest):
+    # Write a new file and rename it over the old one, so a crash cannot leave it half written
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+class DirectoryIngestion:
+    def __init__(self, router, provider, directory, course_id, material_type='lecture_notes',
+                 manifest_path=None, workers=INGEST_WORKERS, batch_chunks=INGEST_BATCH_CHUNKS,
+                 embed_concurrency=INGEST_EMBED_CONCURRENCY, log=print):
+        self.router = router
+        self.provider = provider
+        self.directory = directory
+        self.course_id = course_id
+        self.material_type = material_type
+        self.manifest_path = manifest_path or os.path.join(directory, MANIFEST_NAME)
+        self.workers = workers
+        self.batch_chunks = batch_chunks
+        self.embed_concurrency = embed_concurrency
+        self.log = log
+        self.stats = {
+            'files_total': 0, 'files_skipped': 0, 'files_ingested': 0,
+            'chunks': 0, 'bytes': 0,
+            'extract_seconds': 0.0, 'embed_seconds': 0.0, 'store_seconds': 0.0,
+        }
+
+    def run(self):
+        start = time.perf_counter()
+        manifest = load_manifest(self.manifest_path, self.course_id, self.provider.model_name)
+        known = manifest['files']
+        paths = [p for p in list_files(self.directory) if os.path.abspath(os.path.join(self.directory, p)) != os.path.abspath(self.manifest_path)]
+        self.stats['files_total'] = len(paths)
+        metadata = {'courseId': self.course_id, 'type': self.material_type, 'description': ''}
+        tasks = [
+            (self.directory, p, known.get(p, {}).get('sha256'), {**metadata, 'title': os.path.splitext(os.path.basename(p))[0]})
+            for p in paths
+        ]
+
+        vector_conn = self.router.vector_primary(self.course_id)
+        main_conn = self.router.primary()
+        in_flight = deque()
+        batch = []
+        batch_size = 0
+        try:
+            # spawn, as the embedding pool does, so workers do not inherit threads or sockets
+            with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')) as extract_pool, \
+                    ThreadPoolExecutor(max_workers=self.embed_concurrency) as embed_pool:
+                for prepared in extract_pool.map(_prepare_file, tasks, chunksize=4):
+                    self.stats['extract_seconds'] += prepared['seconds']
+                    if prepared['documents'] is None:
+                        self.stats['files_skipped'] += 1
+                        continue
+                    batch.append(prepared)
+                    batch_size += len(prepared['documents'])
+                    if batch_size >= self.batch_chunks:
+                        in_flight.append((batch, embed_pool.submit(self._embed, batch)))
+                        batch, batch_size = [], 0
+                        # Bound the vectors held in memory while extraction runs ahead
+                        while len(in_flight) > self.embed_concurrency:
+                            self._store(vector_conn, main_conn, manifest, *in_flight.popleft(), started=start)
+                if batch:
+                    in_flight.append((batch, embed_pool.submit(self._embed, batch)))
+                while in_flight:
+                    self._store(vector_conn, main_conn, manifest, *in_flight.popleft(), started=start)
+        finally:
+            vector_conn.close()
+            main_conn.close()
+
+        return self.report(time.perf_counter() - start)
+
+    def _embed(self, batch):
+        start = time.perf_counter()
+        texts = [doc['content'] for prepared in batch for doc in prepared['documents']]
+        embeddings = self.provider.embed_matrix(texts, lane=openai_gateway.BULK)
+        return embeddings, time.perf_counter() - start
+
+    def _store(self, vector_conn, main_conn, manifest, batch, future, started):
+        embeddings, embed_seconds = future.result()
+        self.stats['embed_seconds'] += embed_seconds
+        start = time.perf_counter()
+        documents = [doc for prepared in batch for doc in prepared['documents']]
+
+        # Chunks first, then the materials rows, as the upload endpoint does
+        store_documents(vector_conn, documents, embeddings, self.provider.model_name)
+        main_conn.autocommit = False
+        cursor = main_conn.cursor()
+        try:
+            execute_values(cursor, UPSERT_MATERIALS_SQL, [
+                (
+                    prepared['material_id'],
+                    os.path.basename(prepared['path']),
+                    prepared['path'],
+                    prepared['file_type'],
+                    prepared['size'],
+                    self.material_type,
+                    self.course_id,
+                    True,
+                    len(prepared['documents']),
+                    prepared['sha256']
+                )
+                for prepared in batch
+            ])
+            main_conn.commit()
+        except Exception:
+            main_conn.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.stats['store_seconds'] += time.perf_counter() - start
+
+        finished_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        for prepared in batch:
+            manifest['files'][prepared['path']] = {
+                'sha256': prepared['sha256'],
+                'material_id': prepared['material_id'],
+                'chunks': len(prepared['documents']),
+                'ingested_at': finished_at,
+            }
+        save_manifest(self.manifest_path, manifest)
+
+        self.stats['files_ingested'] += len(batch)
+        self.stats['chunks'] += len(documents)
+        self.stats['bytes'] += sum(prepared['size'] for prepared in batch)
+        metrics.INGESTION_CHUNKS.inc(len(documents), source='cli')
+        elapsed = time.perf_counter() - started
+        self.log(
+            f"{self.stats['files_ingested'] + self.stats['files_skipped']}/{self.stats['files_total']} files, "
+            f"{self.stats['chunks']} chunks, {self.stats['chunks'] / elapsed:.1f} chunks/s"
+        )
+
+    def report(self, seconds):
+        report = dict(self.stats)
+        report.update({
+            'course_id': self.course_id,
+            'embedding_model': self.provider.model_name,
+            'seconds': round(seconds, 3),
+            'files_per_sec': round(self.stats['files_ingested'] / seconds, 2) if seconds else 0.0,
+            'chunks_per_sec': round(self.stats['chunks'] / seconds, 2) if seconds else 0.0,
+            'mb_per_sec': round(self.stats['bytes'] / 1e6 / seconds, 3) if seconds else 0.0,
+        })
+        for key in ('extract_seconds', 'embed_seconds', 'store_seconds'):
+            report[key] = round(report[key], 3)
+        return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest a directory of course materials into a course.")
+    parser.add_argument('directory')
+    parser.add_argument('--course', required=True, help='course id to ingest into')
+    parser.add_argument('--material-type', default='lecture_notes')
+    parser.add_argument('--provider', choices=['openai', 'local'], help="embedding provider; defaults to the app's")
+    parser.add_argument('--model', help='embedding model for --provider')
+    parser.add_argument('--workers', type=int, default=INGEST_WORKERS, help='extraction processes')
+    parser.add_argument('--batch-chunks', type=int, default=INGEST_BATCH_CHUNKS, help='chunks per embedding batch and insert')
+    parser.add_argument('--embed-concurrency', type=int, default=INGEST_EMBED_CONCURRENCY, help='embedding batches in flight')
+    parser.add_argument('--manifest', help=f'manifest path; defaults to DIRECTORY/{MANIFEST_NAME}')
+    parser.add_argument('--output', help='also write the throughput report as JSON')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.directory):
+        sys.exit(f"{args.directory} is not a directory")
+    from app import db_router, gateway, embedding_provider
+    import embedding_providers
+    provider = embedding_provider
+    if args.provider:
+        provider = embedding_providers.create_embedding_provider(gateway, kind=args.provider, model_name=args.model)
+
+    job = DirectoryIngestion(
+        db_router, provider, args.directory, args.course, material_type=args.material_type,
+        manifest_path=args.manifest, workers=args.workers, batch_chunks=args.batch_chunks,
+        embed_concurrency=args.embed_concurrency
+    )
+    report = job.run()
+    print(
+        f"Ingested {report['files_ingested']} files ({report['files_skipped']} unchanged) as {report['chunks']} chunks "
+        f"in {report['seconds']:.2f}s: {report['files_per_sec']} files/s, {report['chunks_per_sec']} chunks/s, "
+        f"{report['mb_per_sec']} MB/s"
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
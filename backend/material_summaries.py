@@ -0,0 +1,190 @@
+"""
+Two-level index over course materials for hierarchical retrieval.
+
+Every material (a materialId, or the fileId of a document processed from
+storage) has a summary row holding the centroid of its chunk embeddings. Its
+chunks are also grouped into sections of SUMMARY_SECTION_CHUNKS consecutive
+chunks, each with its own centroid and the ids of its chunks, so a long
+transcript is several sections and a short handout is one. Cosine distance
+ignores magnitude, so the plain average of the unit chunk vectors is used as
+the centroid. Summaries are recomputed in SQL whenever a material's chunks are
+written, and deleted with them.
+
+Hierarchical search, semantic_search(mode='hierarchical'):
+1. ranks the course's material centroids and keeps the HIERARCHY_MATERIALS closest,
+2. within each of those keeps the HIERARCHY_SECTIONS closest sections,
+3. scores only the chunks of the kept sections, fetched by primary key.
+So the chunk-level work no longer grows with the number of materials in the
+course. Flat search stays the default (SEARCH_MODE).
+
+Build summaries for chunks ingested before they existed with:
+    python material_summaries.py [--course COURSE_ID] [--model MODEL]
+"""
+
+import os
+import time
+import argparse
+
+import vectors
+
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "flat")
+SUMMARY_SECTION_CHUNKS = int(os.environ.get("SUMMARY_SECTION_CHUNKS", "16"))
+HIERARCHY_MATERIALS = int(os.environ.get("HIERARCHY_MATERIALS", "8"))
+HIERARCHY_SECTIONS = int(os.environ.get("HIERARCHY_SECTIONS", "2"))
+
+FLAT = 'flat'
+HIERARCHICAL = 'hierarchical'
+SEARCH_MODES = (FLAT, HIERARCHICAL)
+
+# Section -1 is the material as a whole; sections 0.. list their chunk ids
+CREATE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS material_summaries (
+        source_id TEXT NOT NULL,
+        embedding_model TEXT NOT NULL,
+        section INTEGER NOT NULL,
+        course_id TEXT,
+        embedding_dim INTEGER NOT NULL,
+        centroid VECTOR NOT NULL,
+        chunk_ids TEXT[] NOT NULL DEFAULT '{}',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (source_id, embedding_model, section)
+    );
+    CREATE INDEX IF NOT EXISTS material_summaries_course_idx
+        ON material_summaries (course_id, embedding_model) WHERE section = -1;
+'''
+
+# Recompute the summaries of the given sources (all when NULL), optionally of one course
+SUMMARIZE_SQL = '''
+    WITH chunks AS (
+        SELECT id, embedding, embedding_dim,
+               coalesce(metadata->>'materialId', metadata->>'fileId') AS source_id,
+               metadata->>'courseId' AS course_id,
+               coalesce((metadata->>'chunkIndex')::int, 0) AS chunk_index
+        FROM embeddings
+        WHERE embedding_model = %(model)s
+          AND embedding IS NOT NULL
+          AND (%(course_id)s::text IS NULL OR metadata->>'courseId' = %(course_id)s)
+          AND (%(source_ids)s::text[] IS NULL
+               OR metadata->>'materialId' = ANY(%(source_ids)s)
+               OR metadata->>'fileId' = ANY(%(source_ids)s))
+    )
+    INSERT INTO material_summaries (source_id, embedding_model, section, course_id, embedding_dim, centroid, chunk_ids)
+    SELECT source_id, %(model)s, -1, min(course_id), min(embedding_dim), avg(embedding), '{}'
+    FROM chunks WHERE source_id IS NOT NULL
+    GROUP BY source_id
+    UNION ALL
+    SELECT source_id, %(model)s, chunk_index / %(section_chunks)s, min(course_id), min(embedding_dim),
+           avg(embedding), array_agg(id ORDER BY chunk_index)
+    FROM chunks WHERE source_id IS NOT NULL
+    GROUP BY source_id, chunk_index / %(section_chunks)s
+'''
+
+MATCH_HIERARCHICAL_SQL = '''
+    WITH q AS (
+        SELECT %(query)s::vector({dim}) AS v
+    ), top_materials AS (
+        SELECT s.source_id
+        FROM material_summaries s, q
+        WHERE s.embedding_model = %(model)s
+          AND s.section = -1
+          AND s.embedding_dim = {dim}
+          AND (%(course_id)s = 'all' OR s.course_id = %(course_id)s)
+        ORDER BY s.centroid::vector({dim}) <=> q.v
+        LIMIT %(materials)s
+    ), ranked_sections AS (
+        SELECT s.chunk_ids,
+               row_number() OVER (PARTITION BY s.source_id ORDER BY s.centroid::vector({dim}) <=> q.v) AS rank
+        FROM material_summaries s
+        JOIN top_materials t ON t.source_id = s.source_id
+        CROSS JOIN q
+        WHERE s.embedding_model = %(model)s AND s.section >= 0
+    ), candidates AS (
+        SELECT DISTINCT unnest(chunk_ids) AS id FROM ranked_sections WHERE rank <= %(sections)s
+    )
+    SELECT e.id, e.content, e.metadata, 1 - (e.embedding::vector({dim}) <=> q.v) AS similarity
+    FROM candidates c
+    JOIN embeddings e ON e.id = c.id AND e.embedding_model = %(model)s
+    CROSS JOIN q
+    WHERE 1 - (e.embedding::vector({dim}) <=> q.v) > %(threshold)s
+    ORDER BY e.embedding::vector({dim}) <=> q.v
+    LIMIT %(count)s
+'''
+
+def update_summaries(cursor, model_name, source_ids=None, course_id=None, section_chunks=SUMMARY_SECTION_CHUNKS):
+    """
+    Recompute the summary and section rows of `source_ids` (material ids or file
+    paths), or of every material of `course_id`, or of everything. Runs on the
+    caller's cursor and transaction. Returns the number of rows written.
+    """
+    if source_ids is not None:
+        source_ids = sorted(set(source_ids))
+        if not source_ids:
+            return 0
+        cursor.execute(
+            'DELETE FROM material_summaries WHERE embedding_model = %s AND source_id = ANY(%s)',
+            (model_name, source_ids)
+        )
+    else:
+        cursor.execute(
+            'DELETE FROM material_summaries WHERE embedding_model = %s AND (%s::text IS NULL OR course_id = %s)',
+            (model_name, course_id, course_id)
+        )
+    cursor.execute(SUMMARIZE_SQL, {
+        'model': model_name,
+        'course_id': course_id,
+        'source_ids': source_ids,
+        'section_chunks': section_chunks,
+    })
+    return cursor.rowcount
+
+def delete_summaries(cursor, source_ids, course_id=None):
+    cursor.execute(
+        'DELETE FROM material_summaries WHERE source_id = ANY(%s) AND (%s::text IS NULL OR course_id = %s)',
+        (list(source_ids), course_id, course_id)
+    )
+
+def match_hierarchical(cursor, query_embedding, threshold, count, course_id, model_name, materials=None, sections=None):
+    """
+    Chunks closest to the query among the best sections of the best materials,
+    HIERARCHY_MATERIALS and HIERARCHY_SECTIONS unless given.
+    """
+    cursor.execute(MATCH_HIERARCHICAL_SQL.format(dim=int(len(query_embedding))), {
+        'query': vectors.to_text(query_embedding),
+        'model': model_name,
+        'course_id': course_id,
+        'materials': materials or HIERARCHY_MATERIALS,
+        'sections': sections or HIERARCHY_SECTIONS,
+        'threshold': threshold,
+        'count': count,
+    })
+    return cursor.fetchall()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build material summaries for hierarchical search.")
+    parser.add_argument('--course', help='only summarise this course')
+    parser.add_argument('--model', help="embedding model; defaults to the app's current model")
+    parser.add_argument('--section-chunks', type=int, default=SUMMARY_SECTION_CHUNKS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    from app import db_router, embedding_provider
+    model_name = args.model or embedding_provider.model_name
+    nodes = [db_router.vector_node(args.course)] if args.course else db_router.vector_nodes()
+    start = time.perf_counter()
+    for node in nodes:
+        conn = db_router.connect(**node.primary)
+        conn.autocommit = False
+        cursor = conn.cursor()
+        try:
+            cursor.execute(CREATE_TABLE_SQL)
+            written = update_summaries(cursor, model_name, course_id=args.course, section_chunks=args.section_chunks)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+        print(f"Wrote {written} summary rows for {model_name} on {node.primary['host']}")
+    print(f"Took {time.perf_counter() - start:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Lightweight Prometheus-style metrics for the backend.
+
+Counters and histograms live in a process-local registry and are rendered in the
+Prometheus text exposition format on /metrics. Recording a value is a dict lookup,
+a bisect and an increment under a per-metric lock, so instrumentation can stay
+enabled in production.
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+from flask import g, request
+
+# Default latency buckets in seconds, from fast DB lookups to slow LLM completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class Counter:
+    """
+    Monotonically increasing value, optionally split by labels.
+    """
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, such as queue depth or in-flight requests.
+    """
+
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram:
+    """
+    Cumulative bucketed distribution of observed values, optionally split by labels.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (non-cumulative) plus one overflow slot, sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        with self._lock:
+            items = [(key, (list(series[0]), series[1], series[2])) for key, series in self._series.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames, key, ('le', format_value(float(bound))))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {count}"
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+# Metrics shared across the backend
+HTTP_REQUEST_DURATION = histogram(
+    'http_request_duration_seconds', 'Latency of HTTP requests by route.', ('method', 'route', 'status')
+)
+OPENAI_REQUEST_DURATION = histogram(
+    'openai_request_duration_seconds', 'Latency of OpenAI API calls.', ('operation', 'model')
+)
+OPENAI_TOKENS = counter(
+    'openai_tokens_total', 'OpenAI token usage.', ('operation', 'model', 'kind')
+)
+DB_CONNECT_DURATION = histogram(
+    'db_connect_duration_seconds', 'Time spent opening database connections.'
+)
+DB_QUERY_DURATION = histogram(
+    'db_query_duration_seconds', 'Latency of instrumented database queries.', ('query',)
+)
+STORAGE_REQUEST_DURATION = histogram(
+    'storage_request_duration_seconds', 'Latency of Supabase storage and auth calls.', ('operation',)
+)
+INGESTION_CHUNKS = counter(
+    'ingestion_chunks_total', 'Chunks embedded and stored during ingestion.', ('source',)
+)
+INGESTION_DURATION = histogram(
+    'ingestion_duration_seconds', 'Time to ingest one document end to end.', ('source',)
+)
+
+def record_openai_usage(operation, model, usage):
+    """
+    Add the token counts from an OpenAI response `usage` object to OPENAI_TOKENS.
+    """
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+        value = getattr(usage, kind, None)
+        if value:
+            OPENAI_TOKENS.inc(value, operation=operation, model=model, kind=kind[:-len('_tokens')])
+
+def start_request_timer():
+    g.request_start_time = time.perf_counter()
+
+def observe_request(response):
+    start = g.pop('request_start_time', None)
+    if start is not None:
+        # Use the route pattern, not the raw path, to keep label cardinality bounded
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route,
+            status=str(response.status_code)
+        )
+    return response
+
+def metrics_endpoint():
+    return REGISTRY.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def init_app(app):
+    """
+    Record per-route latency for every request and expose the registry on /metrics.
+    """
+    app.before_request(start_request_timer)
+    app.after_request(observe_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint, methods=['GET'])
@@ -0,0 +1,351 @@
+"""
+Rate-limit-aware gateway for OpenAI API calls.
+
+All OpenAI traffic goes through one OpenAIGateway so interactive chat and bulk
+embedding share the organisation's request and token budget without starving
+each other:
+
+- Requests-per-minute and tokens-per-minute token buckets, resynchronised from
+  the x-ratelimit-* response headers.
+- Priority lanes. The interactive lane may drain the buckets; the bulk lane
+  leaves BULK_RESERVE_FRACTION of each bucket for interactive traffic and also
+  yields to any interactive request waiting for the buckets. Interactive
+  requests held back only by their own lane's concurrency limit do not make
+  bulk wait, and a bulk call queued for BULK_MAX_WAIT seconds competes as an
+  equal, so a saturated budget slows bulk work down without stopping it.
+- Adaptive concurrency per lane (AIMD): the in-flight limit grows by one per
+  window of successes and halves on every 429.
+- Retries with full jitter on 429, timeouts, connection errors and 5xx,
+  honouring Retry-After when the server sends it.
+
+Queue wait time, throttle counts and the current concurrency limit of each lane
+are exported through metrics.py.
+"""
+
+import os
+import re
+import time
+import random
+import threading
+
+import metrics
+import tracing
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+BULK_RESERVE_FRACTION = float(os.environ.get("OPENAI_BULK_RESERVE_FRACTION", "0.2"))
+# Seconds a bulk call waits before it stops yielding to interactive traffic
+BULK_MAX_WAIT = float(os.environ.get("OPENAI_BULK_MAX_WAIT", "10"))
+# Starting budgets until the first response headers arrive
+DEFAULT_RPM = int(os.environ.get("OPENAI_RPM_LIMIT", "3000"))
+DEFAULT_TPM = int(os.environ.get("OPENAI_TPM_LIMIT", "1000000"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 20.0
+
+QUEUE_WAIT = metrics.histogram(
+    'openai_queue_wait_seconds', 'Time OpenAI calls wait for rate limit and concurrency slots.', ('lane',)
+)
+THROTTLED = metrics.counter(
+    'openai_throttled_total', 'OpenAI calls answered with 429.', ('lane',)
+)
+RETRIES = metrics.counter(
+    'openai_retries_total', 'OpenAI call retries by reason.', ('lane', 'reason')
+)
+CONCURRENCY_LIMIT = metrics.gauge(
+    'openai_concurrency_limit', 'Current adaptive concurrency limit per lane.', ('lane',)
+)
+IN_FLIGHT = metrics.gauge(
+    'openai_in_flight', 'OpenAI calls currently in flight per lane.', ('lane',)
+)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+def parse_reset_duration(value):
+    """
+    Parse OpenAI reset headers such as "20ms", "1s" or "6m0s" into seconds.
+    """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+class TokenBucket:
+    """
+    Per-minute budget refilled continuously. Not thread-safe on its own; the
+    gateway guards all buckets with one condition variable.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        rate = self.capacity / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def time_until(self, amount, floor=0.0):
+        """Seconds until `amount` can be taken while leaving `floor` in the bucket."""
+        # A single request larger than the whole bucket is allowed once it is full
+        needed = min(amount + floor, self.capacity) - self.level
+        if needed <= 0:
+            return 0.0
+        return needed / (self.capacity / 60.0)
+
+    def take(self, amount):
+        self.level -= amount
+
+    def sync(self, limit, remaining, reset_seconds, now):
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            # Trust the server's view when it has less left than we think
+            self.level = min(self.level, float(remaining))
+            self.updated = now
+        if remaining == 0 and reset_seconds:
+            # Nothing left until the window resets; model that as a debt
+            self.level = -self.capacity / 60.0 * reset_seconds
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit.
+    """
+
+    def __init__(self, initial, minimum, maximum):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.in_flight = 0
+
+    def has_slot(self):
+        return self.in_flight < int(self.limit)
+
+    def on_success(self):
+        # Roughly +1 per window of `limit` successful calls
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        self.limit = max(self.minimum, self.limit / 2.0)
+
+class Lane:
+    def __init__(self, name, priority, initial_concurrency, max_concurrency, max_retries, reserve_fraction, max_wait=None):
+        self.name = name
+        self.priority = priority
+        self.max_wait = max_wait
+        self.limiter = AIMDLimiter(initial_concurrency, 1, max_concurrency)
+        self.max_retries = max_retries
+        self.reserve_fraction = reserve_fraction
+        self.waiting = 0
+        # Waiters that have a concurrency slot but not yet the rate budget
+        self.budget_waiting = 0
+
+def default_lanes():
+    return {
+        INTERACTIVE: Lane(INTERACTIVE, 0, initial_concurrency=16, max_concurrency=64, max_retries=3, reserve_fraction=0.0),
+        BULK: Lane(BULK, 1, initial_concurrency=4, max_concurrency=32, max_retries=8, reserve_fraction=BULK_RESERVE_FRACTION,
+                   max_wait=BULK_MAX_WAIT),
+    }
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; only used for admission control
+    return max(1, len(text) // 4)
+
+class OpenAIGateway:
+    """
+    Shared entry point for OpenAI calls with rate limiting, lanes and retries.
+
+    The wrapped client should be created with max_retries=0 so the gateway owns
+    the retry policy. Pass `client_factory` instead of `client` to create it, and
+    import the openai package, on the first call.
+    """
+
+    def __init__(self, client=None, lanes=None, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM, client_factory=None):
+        self._client = client
+        self._client_factory = client_factory
+        self._client_lock = threading.Lock()
+        self.lanes = lanes or default_lanes()
+        self.requests_bucket = TokenBucket(rpm)
+        self.tokens_bucket = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        for lane in self.lanes.values():
+            CONCURRENCY_LIMIT.set(lane.limiter.limit, lane=lane.name)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    def create_embedding(self, input, model, lane=BULK, **kwargs):
+        texts = input if isinstance(input, list) else [input]
+        tokens = sum(estimate_tokens(text) for text in texts)
+        return self._call(
+            lane, 'embedding', model, tokens,
+            lambda: self.client.embeddings.with_raw_response.create(model=model, input=input, **kwargs)
+        )
+
+    def create_chat_completion(self, messages, model, max_tokens=None, lane=INTERACTIVE, **kwargs):
+        tokens = sum(estimate_tokens(message.get('content') or '') for message in messages) + (max_tokens or 0)
+        if max_tokens is not None:
+            kwargs['max_tokens'] = max_tokens
+        return self._call(
+            lane, 'chat', model, tokens,
+            lambda: self.client.chat.completions.with_raw_response.create(model=model, messages=messages, **kwargs)
+        )
+
+    def stats(self):
+        with self._cond:
+            return {
+                name: {
+                    'concurrency_limit': lane.limiter.limit,
+                    'in_flight': lane.limiter.in_flight,
+                    'waiting': lane.waiting,
+                }
+                for name, lane in self.lanes.items()
+            }
+
+    def _call(self, lane_name, operation, model, tokens, send):
+        # Deferred so processes that never call OpenAI do not pay for importing it
+        import openai
+
+        lane = self.lanes[lane_name]
+        attempt = 0
+        while True:
+            waited = self._acquire(lane, tokens)
+            QUEUE_WAIT.observe(waited, lane=lane.name)
+            span_attributes = {'lane': lane.name, 'model': model, 'attempt': attempt, 'queue_wait_ms': round(waited * 1000, 3)}
+            error = None
+            throttled = False
+            headers = None
+            try:
+                with metrics.OPENAI_REQUEST_DURATION.time(operation=operation, model=model), \
+                        tracing.span(f'openai.{operation}', **span_attributes):
+                    raw = send()
+                headers = raw.headers
+            except openai.APIStatusError as e:
+                error, throttled, headers = e, e.status_code == 429, e.response.headers
+            except (openai.APIConnectionError, openai.APITimeoutError) as e:
+                error = e
+            finally:
+                # Every exit gives the slot back, or the lane would eventually deadlock
+                self._release(lane, throttled=throttled, headers=headers)
+
+            if error is None:
+                response = raw.parse()
+                metrics.record_openai_usage(operation, model, getattr(response, 'usage', None))
+                return response
+
+            if isinstance(error, openai.APIStatusError):
+                if throttled:
+                    THROTTLED.inc(lane=lane.name)
+                retryable = error.status_code in (408, 409, 429) or error.status_code >= 500
+                reason = str(error.status_code)
+            else:
+                retryable = True
+                reason = type(error).__name__
+            if not retryable or attempt >= lane.max_retries:
+                raise error
+            RETRIES.inc(lane=lane.name, reason=reason)
+            self._backoff(attempt, headers)
+            attempt += 1
+
+    def _acquire(self, lane, tokens):
+        start = time.monotonic()
+        on_budget = False
+        with self._cond:
+            lane.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.requests_bucket.refill(now)
+                    self.tokens_bucket.refill(now)
+
+                    # Past its maximum wait a call neither yields nor leaves a reserve
+                    aged = lane.max_wait is not None and now - start >= lane.max_wait
+                    reserve_fraction = 0.0 if aged else lane.reserve_fraction
+
+                    wait = 0.05
+                    if (not aged and self._higher_priority_waiting(lane)) or not lane.limiter.has_slot():
+                        if on_budget:
+                            lane.budget_waiting -= 1
+                            on_budget = False
+                        # Woken by _release when a slot frees up or a higher lane proceeds
+                        self._cond.wait(timeout=wait)
+                        continue
+
+                    wait = max(
+                        self.requests_bucket.time_until(1, reserve_fraction * self.requests_bucket.capacity),
+                        self.tokens_bucket.time_until(tokens, reserve_fraction * self.tokens_bucket.capacity),
+                    )
+                    if wait <= 0:
+                        self.requests_bucket.take(1)
+                        self.tokens_bucket.take(tokens)
+                        lane.limiter.in_flight += 1
+                        IN_FLIGHT.set(lane.limiter.in_flight, lane=lane.name)
+                        return time.monotonic() - start
+                    if not on_budget:
+                        lane.budget_waiting += 1
+                        on_budget = True
+                    self._cond.wait(timeout=min(wait, 1.0))
+            finally:
+                lane.waiting -= 1
+                if on_budget:
+                    lane.budget_waiting -= 1
+                self._cond.notify_all()
+
+    def _higher_priority_waiting(self, lane):
+        # Only callers held up by the shared buckets count: one waiting for its own
+        # lane's concurrency slot takes nothing from lower lanes by their yielding
+        return any(other.budget_waiting and other.priority < lane.priority for other in self.lanes.values())
+
+    def _release(self, lane, throttled, headers):
+        with self._cond:
+            lane.limiter.in_flight -= 1
+            if throttled:
+                lane.limiter.on_throttle()
+            else:
+                lane.limiter.on_success()
+            if headers is not None:
+                self._sync_buckets(headers)
+            CONCURRENCY_LIMIT.set(lane.limiter.limit, lane=lane.name)
+            IN_FLIGHT.set(lane.limiter.in_flight, lane=lane.name)
+            self._cond.notify_all()
+
+    def _sync_buckets(self, headers):
+        now = time.monotonic()
+        for bucket, kind in ((self.requests_bucket, 'requests'), (self.tokens_bucket, 'tokens')):
+            limit = headers.get(f'x-ratelimit-limit-{kind}')
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+            try:
+                bucket.sync(
+                    int(limit) if limit else None,
+                    int(remaining) if remaining is not None else None,
+                    reset,
+                    now
+                )
+            except ValueError:
+                continue
+
+    def _backoff(self, attempt, headers):
+        retry_after = None
+        if headers is not None:
+            if headers.get('retry-after-ms'):
+                retry_after = parse_reset_duration(headers['retry-after-ms'] + 'ms')
+            else:
+                retry_after = parse_reset_duration(headers.get('retry-after'))
+        # Full jitter keeps retrying workers from synchronising
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, retry_after)
+        time.sleep(delay)
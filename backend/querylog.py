@@ -0,0 +1,335 @@
+"""
+Write-behind logging of chat queries.
+
+chat used to open a connection and insert its queries row before responding.
+QueryLogWriter instead buffers records in memory, and a background thread writes
+them with multi-row INSERTs once QUERY_LOG_BATCH_SIZE records are waiting or
+QUERY_LOG_FLUSH_INTERVAL has passed. The buffer is flushed again at interpreter
+exit.
+
+The buffer is bounded. When it is full, log() waits up to
+QUERY_LOG_ENQUEUE_TIMEOUT for the writer to catch up and then appends the record
+to the journal file instead of dropping it. Batches that cannot be written
+because the database is unreachable go to the same journal, which is replayed
+after the next successful write. A batch that fails for any other reason, e.g. a
+sink rejecting a record, is retried record by record so only the failing ones
+are journaled. Each record is tried at most QUERY_LOG_MAX_ATTEMPTS times before
+it is moved to the quarantine file next to the journal (`<journal>.rejected`).
+
+Workers share the journal: appends hold an exclusive flock on it, and a replay
+renames it to a file of its own under the same lock before reading, so a record
+is replayed by one process exactly once and appends made meanwhile start a new
+journal.
+
+Records with a user go to every table in QUERY_LOG_TABLES: `queries` (user_id)
+and/or the `student_queries` table from the migrations (student_id). Every batch,
+anonymous records included, is also passed to each sink in the same transaction;
+the analytics rollups are maintained that way.
+"""
+
+import os
+import glob
+import json
+import time
+import uuid
+import fcntl
+import atexit
+import threading
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import metrics
+
+QUERY_LOG_TABLES = [t.strip() for t in os.environ.get("QUERY_LOG_TABLES", "queries").split(",") if t.strip()]
+QUERY_LOG_BATCH_SIZE = int(os.environ.get("QUERY_LOG_BATCH_SIZE", "100"))
+QUERY_LOG_FLUSH_INTERVAL = float(os.environ.get("QUERY_LOG_FLUSH_INTERVAL", "1.0"))
+QUERY_LOG_MAX_BUFFER = int(os.environ.get("QUERY_LOG_MAX_BUFFER", "10000"))
+QUERY_LOG_ENQUEUE_TIMEOUT = float(os.environ.get("QUERY_LOG_ENQUEUE_TIMEOUT", "0.1"))
+QUERY_LOG_JOURNAL_PATH = os.environ.get("QUERY_LOG_JOURNAL_PATH", "/tmp/backend-query-log.jsonl")
+QUERY_LOG_MAX_ATTEMPTS = int(os.environ.get("QUERY_LOG_MAX_ATTEMPTS", "5"))
+
+# Column receiving the record's user id in each supported table
+USER_COLUMNS = {
+    'queries': 'user_id',
+    'student_queries': 'student_id',
+}
+
+RECORDS = metrics.counter(
+    'query_log_records_total', 'Query log records by outcome.', ('outcome',)
+)
+BUFFERED = metrics.gauge(
+    'query_log_buffered_records', 'Query log records waiting to be written.'
+)
+FLUSH_DURATION = metrics.histogram(
+    'query_log_flush_duration_seconds', 'Time spent writing one batch of query log records.'
+)
+
+class QueryLogWriter:
+    def __init__(self, connect, tables=QUERY_LOG_TABLES, batch_size=QUERY_LOG_BATCH_SIZE,
+                 flush_interval=QUERY_LOG_FLUSH_INTERVAL, max_buffer=QUERY_LOG_MAX_BUFFER,
+                 journal_path=QUERY_LOG_JOURNAL_PATH, sinks=(), max_attempts=QUERY_LOG_MAX_ATTEMPTS):
+        unknown = set(tables) - set(USER_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unsupported query log tables: {', '.join(sorted(unknown))}")
+        self.connect = connect
+        self.tables = list(tables)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.journal_path = journal_path
+        self.quarantine_path = journal_path + '.rejected'
+        self.max_attempts = max_attempts
+        self.sinks = list(sinks)
+        self._buffer = []
+        self._condition = threading.Condition()
+        self._journal_lock = threading.Lock()
+        # Serialises the background flush with explicit flush() calls
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def log(self, user_id, course_id, query, response, query_embedding=None, material_ids=(), created_at=None):
+        record = {
+            'user_id': user_id,
+            'course_id': course_id,
+            'query': query,
+            'response': response,
+            'query_embedding': query_embedding,
+            'material_ids': list(material_ids),
+            'created_at': created_at or time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self._ensure_started()
+        with self._condition:
+            if len(self._buffer) >= self.max_buffer:
+                self._condition.wait_for(lambda: len(self._buffer) < self.max_buffer, timeout=QUERY_LOG_ENQUEUE_TIMEOUT)
+            if len(self._buffer) < self.max_buffer:
+                self._buffer.append(record)
+                BUFFERED.set(len(self._buffer))
+                if len(self._buffer) >= self.batch_size:
+                    self._condition.notify_all()
+                return
+        # Still full: keep the record on disk rather than blocking the request further
+        self._journal([record])
+
+    def _ensure_started(self):
+        # The thread is started lazily, and again in a forked worker that inherited no thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._condition:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='query-log-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        # Pick up records journaled by a previous process
+        with self._write_lock:
+            self._replay_journal()
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._closed or len(self._buffer) >= self.batch_size, timeout=self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Warning: query log flush failed: {e}")
+
+    def flush(self):
+        """Write everything buffered so far. Safe to call from any thread."""
+        with self._write_lock:
+            while True:
+                with self._condition:
+                    batch = self._buffer[:self.batch_size]
+                    del self._buffer[:len(batch)]
+                    BUFFERED.set(len(self._buffer))
+                    self._condition.notify_all()
+                if not batch:
+                    return
+                try:
+                    rejected, unwritten = self._write_isolated(batch, outcome='written')
+                except BaseException:
+                    # Interrupted mid-write: the batch is no longer in the buffer, keep it on disk
+                    self._journal(batch)
+                    raise
+                if unwritten:
+                    # The database is down; leave the rest for the next interval
+                    self._retry_later(rejected)
+                    with self._condition:
+                        rest, self._buffer = self._buffer, []
+                        BUFFERED.set(0)
+                    self._journal(unwritten + rest)
+                    return
+                # Replay before journaling this batch's rejects, so they wait an interval before their next attempt
+                self._replay_journal()
+                self._retry_later(rejected)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.flush()
+
+    def _write_isolated(self, records, outcome):
+        """
+        Write records as one batch, or one by one if the batch fails for a reason
+        other than the database being unreachable. Returns (records that failed,
+        records left unwritten because the database was unreachable).
+        """
+        error = self._write(records, outcome)
+        if error is None:
+            return [], []
+        if _unreachable(error):
+            return [], records
+        if len(records) == 1:
+            return records, []
+        rejected = []
+        for i, record in enumerate(records):
+            error = self._write([record], outcome)
+            if error is None:
+                continue
+            if _unreachable(error):
+                return rejected, records[i:]
+            rejected.append(record)
+        return rejected, []
+
+    def _write(self, records, outcome):
+        """
+        Insert records into every configured table and pass them to every sink.
+        Returns None on success, or the exception that made the transaction fail
+        so the caller can journal the records.
+        """
+        try:
+            with FLUSH_DURATION.time():
+                conn = self.connect()
+                try:
+                    # One transaction per batch, whatever the connection's default
+                    conn.autocommit = False
+                    cursor = conn.cursor()
+                    owned = [record for record in records if record.get('user_id')]
+                    for table in self.tables:
+                        if owned:
+                            self._insert(cursor, table, owned)
+                    for sink in self.sinks:
+                        sink(cursor, records)
+                    conn.commit()
+                    cursor.close()
+                finally:
+                    conn.close()
+        except Exception as e:
+            print(f"Warning: query log write of {len(records)} records failed: {e}")
+            return e
+        RECORDS.inc(len(records), outcome=outcome)
+        return None
+
+    def _insert(self, cursor, table, records):
+        columns = f"{USER_COLUMNS[table]}, course_id, query, response, created_at"
+        sql = f"INSERT INTO {table} ({columns}) VALUES %s"
+        rows = [(r['user_id'], r['course_id'], r['query'], r['response'], r['created_at']) for r in records]
+        cursor.execute('SAVEPOINT query_log_batch')
+        try:
+            execute_values(cursor, sql, rows, page_size=self.batch_size)
+        except (psycopg2.IntegrityError, psycopg2.DataError):
+            # One bad row (e.g. an unknown user id) must not sink the whole batch
+            cursor.execute('ROLLBACK TO SAVEPOINT query_log_batch')
+            for row in rows:
+                cursor.execute('SAVEPOINT query_log_row')
+                try:
+                    execute_values(cursor, sql, [row])
+                except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                    cursor.execute('ROLLBACK TO SAVEPOINT query_log_row')
+                    RECORDS.inc(outcome='rejected')
+                    print(f"Warning: dropping query log record for {table}: {e}")
+
+    def _retry_later(self, records):
+        """Journal rejected records for another attempt, or quarantine those out of attempts."""
+        retry = []
+        rejected = []
+        for record in records:
+            record['attempts'] = record.get('attempts', 0) + 1
+            (rejected if record['attempts'] >= self.max_attempts else retry).append(record)
+        self._journal(retry)
+        if rejected:
+            self._append(self.quarantine_path, rejected)
+            RECORDS.inc(len(rejected), outcome='quarantined')
+            print(f"Warning: quarantined {len(rejected)} query log records in {self.quarantine_path}")
+
+    def _journal(self, records):
+        if not records:
+            return
+        self._append(self.journal_path, records)
+        RECORDS.inc(len(records), outcome='journaled')
+
+    def _append(self, path, records):
+        with self._journal_lock:
+            while True:
+                with open(path, 'a') as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    # A replay may have renamed the file while we waited for the lock
+                    if not os.path.exists(path) or os.stat(path).st_ino != os.fstat(f.fileno()).st_ino:
+                        continue
+                    for record in records:
+                        f.write(json.dumps(record) + '\n')
+                    return
+
+    def _replay_path(self):
+        return f"{self.journal_path}.{os.getpid()}-{uuid.uuid4().hex}.replay"
+
+    def _claim_journals(self):
+        """
+        Move the shared journal, and any left behind by a process that died while
+        replaying one, to files only this process reads. Returns their paths.
+        """
+        claimed = []
+        for path in glob.glob(f"{self.journal_path}.*.replay"):
+            if _replaying_process_alive(path):
+                continue
+            target = self._replay_path()
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                # Another process took it over first
+                continue
+            claimed.append(target)
+        with self._journal_lock:
+            try:
+                f = open(self.journal_path, 'r')
+            except FileNotFoundError:
+                return claimed
+            with f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                if os.path.exists(self.journal_path) and os.stat(self.journal_path).st_ino == os.fstat(f.fileno()).st_ino:
+                    target = self._replay_path()
+                    os.rename(self.journal_path, target)
+                    claimed.append(target)
+        return claimed
+
+    def _replay_journal(self):
+        for path in self._claim_journals():
+            with open(path) as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            for start in range(0, len(records), self.batch_size):
+                rejected, unwritten = self._write_isolated(records[start:start + self.batch_size], outcome='replayed')
+                self._retry_later(rejected)
+                if unwritten:
+                    self._journal(unwritten + records[start + self.batch_size:])
+                    break
+            os.remove(path)
+
+def _unreachable(error):
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+def _replaying_process_alive(path):
+    # <journal>.<pid>-<nonce>.replay
+    try:
+        pid = int(path[:-len('.replay')].rsplit('.', 1)[-1].split('-')[0])
+        os.kill(pid, 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
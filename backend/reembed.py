@@ -0,0 +1,376 @@
+"""
+Resumable re-embedding of stored chunks with a different embedding model.
+
+A job streams the chunks of one course, or of the whole corpus, that have a row
+for the source model but none for the target model. It reads them through a
+server-side cursor in id order, embeds them in batches with a bounded number of
+batches in flight, and writes the vectors to the embeddings_reembed shadow table.
+Each batch commits together with the job's checkpoint (the last id written), so a
+restarted job continues where it stopped.
+
+When the stream is drained, a catch-up pass picks up chunks ingested behind the
+checkpoint. Then the target model's partial HNSW index is created concurrently,
+and the shadow rows are published into embeddings in a single transaction. The
+new rows and their index entries become visible together. Rows for the source
+model stay in place, so the app keeps serving searches until it is switched to
+the target model. After the switch, --retire-source deletes the old rows.
+
+Run from the backend directory:
+    python reembed.py --provider local --model BAAI/bge-small-en-v1.5 [--course COURSE_ID]
+    python reembed.py --resume JOB_ID
+or start a background job with POST /api/embeddings/reembed.
+"""
+
+import sys
+import time
+import uuid
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import execute_values
+
+import course_stats
+import openai_gateway
+import material_summaries
+import embedding_providers
+
+REEMBED_BATCH_SIZE = 64
+REEMBED_CONCURRENCY = 4
+
+CREATE_TABLES_SQL = '''
+    CREATE TABLE IF NOT EXISTS reembed_jobs (
+        id TEXT PRIMARY KEY,
+        course_id TEXT,
+        source_model TEXT NOT NULL,
+        target_provider TEXT NOT NULL,
+        target_model TEXT NOT NULL,
+        target_dim INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        checkpoint_id TEXT,
+        rows_done BIGINT NOT NULL DEFAULT 0,
+        rows_total BIGINT,
+        rows_per_sec FLOAT8,
+        eta_seconds FLOAT8,
+        error TEXT,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS embeddings_reembed (
+        job_id TEXT NOT NULL,
+        id TEXT NOT NULL,
+        embedding VECTOR NOT NULL,
+        PRIMARY KEY (job_id, id)
+    );
+'''
+
+# Chunks of the source model that still lack a target row, optionally limited to one course
+PENDING_SQL = '''
+    FROM embeddings e
+    WHERE e.embedding_model = %(source)s
+      AND (%(course)s::text IS NULL OR e.metadata->>'courseId' = %(course)s)
+      AND NOT EXISTS (SELECT 1 FROM embeddings t WHERE t.id = e.id AND t.embedding_model = %(target)s)
+'''
+
+class ReembedJob:
+    def __init__(self, connect, provider, job_id, course_id=None, source_model=None,
+                 batch_size=REEMBED_BATCH_SIZE, concurrency=REEMBED_CONCURRENCY, log=print):
+        self.connect = connect
+        self.provider = provider
+        self.job_id = job_id
+        self.course_id = course_id
+        self.source_model = source_model
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.log = log
+        self.rows_done = 0
+        self.rows_total = None
+        self.checkpoint_id = None
+
+    @classmethod
+    def create(cls, connect, provider, source_model, course_id=None, provider_kind='openai', **kwargs):
+        if source_model == provider.model_name:
+            raise ValueError("Source and target model are the same")
+        job_id = uuid.uuid4().hex[:12]
+        conn = connect()
+        cursor = conn.cursor()
+        cursor.execute(CREATE_TABLES_SQL)
+        cursor.execute(
+            """
+            INSERT INTO reembed_jobs (id, course_id, source_model, target_provider, target_model, target_dim)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            (job_id, course_id, source_model, provider_kind, provider.model_name, provider.dimension)
+        )
+        conn.commit()
+        cursor.close()
+        conn.close()
+        return cls(connect, provider, job_id, course_id=course_id, source_model=source_model, **kwargs)
+
+    @classmethod
+    def resume(cls, connect, gateway, job_id, **kwargs):
+        """Rebuild a job and its target provider from the jobs table."""
+        conn = connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT course_id, source_model, target_provider, target_model, checkpoint_id, rows_done, status FROM reembed_jobs WHERE id = %s',
+            (job_id,)
+        )
+        row = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        if row is None:
+            raise ValueError(f"Unknown re-embed job: {job_id}")
+        if row[6] == 'done':
+            raise ValueError(f"Re-embed job {job_id} has already finished")
+        provider = embedding_providers.create_embedding_provider(gateway, kind=row[2], model_name=row[3])
+        job = cls(connect, provider, job_id, course_id=row[0], source_model=row[1], **kwargs)
+        job.checkpoint_id = row[4]
+        job.rows_done = row[5]
+        return job
+
+    @property
+    def params(self):
+        return {'source': self.source_model, 'target': self.provider.model_name, 'course': self.course_id}
+
+    def run(self):
+        try:
+            self._set_status('running')
+            self._count_pending()
+            self._stream(after=self.checkpoint_id)
+            # Chunks ingested behind the checkpoint while the main pass ran
+            self._stream(after=None)
+            self._publish()
+        except Exception as e:
+            self._set_status('failed', error=str(e))
+            raise
+
+    def _count_pending(self):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT count(*) {PENDING_SQL}
+              AND NOT EXISTS (SELECT 1 FROM embeddings_reembed s WHERE s.job_id = %(job)s AND s.id = e.id)
+            """,
+            {**self.params, 'job': self.job_id}
+        )
+        self.rows_total = self.rows_done + cursor.fetchone()[0]
+        cursor.execute('UPDATE reembed_jobs SET rows_total = %s WHERE id = %s', (self.rows_total, self.job_id))
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    def _stream(self, after):
+        reader = self.connect()
+        reader.autocommit = False
+        writer = self.connect()
+        writer.autocommit = False
+        # A named cursor keeps the result set on the server and fetches itersize rows at a time
+        stream = reader.cursor(name=f"reembed_{self.job_id}")
+        stream.itersize = self.batch_size * self.concurrency * 2
+        stream.execute(
+            f"""
+            SELECT e.id, e.content {PENDING_SQL}
+              AND (%(after)s::text IS NULL OR e.id > %(after)s)
+              AND NOT EXISTS (SELECT 1 FROM embeddings_reembed s WHERE s.job_id = %(job)s AND s.id = e.id)
+            ORDER BY e.id
+            """,
+            {**self.params, 'job': self.job_id, 'after': after}
+        )
+
+        start = time.perf_counter()
+        done_at_start = self.rows_done
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            batch = []
+            for row in stream:
+                batch.append(row)
+                if len(batch) == self.batch_size:
+                    in_flight.append((batch, executor.submit(self._embed, batch)))
+                    batch = []
+                    # Write completed batches in order so the checkpoint only moves forward
+                    while len(in_flight) >= self.concurrency:
+                        self._write(writer, *in_flight.popleft(), start, done_at_start)
+            if batch:
+                in_flight.append((batch, executor.submit(self._embed, batch)))
+            while in_flight:
+                self._write(writer, *in_flight.popleft(), start, done_at_start)
+        stream.close()
+        reader.rollback()
+        reader.close()
+        writer.close()
+
+    def _embed(self, batch):
+        # float32 rows, sent as compact pgvector literals by the vectors adapter
+        return self.provider.embed_matrix([row[1] for row in batch], lane=openai_gateway.BULK)
+
+    def _write(self, writer, batch, future, start, done_at_start):
+        vectors = future.result()
+        cursor = writer.cursor()
+        execute_values(
+            cursor,
+            """
+            INSERT INTO embeddings_reembed (job_id, id, embedding) VALUES %s
+            ON CONFLICT (job_id, id) DO UPDATE SET embedding = EXCLUDED.embedding
+            """,
+            [(self.job_id, row[0], vector) for row, vector in zip(batch, vectors)],
+            template='(%s, %s, %s::vector)'
+        )
+        self.rows_done += len(batch)
+        self.checkpoint_id = max(self.checkpoint_id or '', batch[-1][0])
+        elapsed = time.perf_counter() - start
+        rate = (self.rows_done - done_at_start) / elapsed if elapsed > 0 else None
+        remaining = max((self.rows_total or self.rows_done) - self.rows_done, 0)
+        eta = remaining / rate if rate else None
+        cursor.execute(
+            """
+            UPDATE reembed_jobs
+            SET checkpoint_id = %s, rows_done = %s, rows_total = GREATEST(rows_total, %s),
+                rows_per_sec = %s, eta_seconds = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+            """,
+            (self.checkpoint_id, self.rows_done, self.rows_done, rate, eta, self.job_id)
+        )
+        writer.commit()
+        cursor.close()
+        self.log(
+            f"[{self.job_id}] {self.rows_done}/{self.rows_total} rows"
+            f" | {rate or 0:.1f} rows/s | ETA {eta or 0:.0f}s"
+        )
+
+    def _publish(self):
+        self._set_status('publishing')
+        conn = self.connect()
+        conn.autocommit = True
+        cursor = conn.cursor()
+        # Built outside the publishing transaction so searches are never blocked on it
+        embedding_providers.create_vector_index(cursor, self.provider.model_name, self.provider.dimension, concurrently=True)
+
+        conn.autocommit = False
+        cursor.execute(
+            """
+            INSERT INTO embeddings (id, content, embedding, metadata, embedding_model, embedding_dim, created_at)
+            SELECT e.id, e.content, s.embedding, e.metadata, %s, %s, e.created_at
+            FROM embeddings_reembed s
+            JOIN embeddings e ON e.id = s.id AND e.embedding_model = %s
+            WHERE s.job_id = %s
+            ON CONFLICT (id, embedding_model) DO UPDATE SET
+                content = EXCLUDED.content,
+                embedding = EXCLUDED.embedding,
+                metadata = EXCLUDED.metadata,
+                embedding_dim = EXCLUDED.embedding_dim
+            """,
+            (self.provider.model_name, self.provider.dimension, self.source_model, self.job_id)
+        )
+        published = cursor.rowcount
+        cursor.execute('DELETE FROM embeddings_reembed WHERE job_id = %s', (self.job_id,))
+        course_stats.backfill_course_stats(cursor, self.provider.model_name)
+        cursor.execute(material_summaries.CREATE_TABLE_SQL)
+        material_summaries.update_summaries(cursor, self.provider.model_name, course_id=self.course_id)
+        cursor.execute(
+            "UPDATE reembed_jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP, eta_seconds = 0 WHERE id = %s",
+            (self.job_id,)
+        )
+        conn.commit()
+        cursor.close()
+        conn.close()
+        self.log(f"[{self.job_id}] published {published} rows for {self.provider.model_name}")
+
+    def _set_status(self, status, error=None):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE reembed_jobs SET status = %s, error = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s',
+            (status, error, self.job_id)
+        )
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+def retire_source(connect, source_model, target_model, course_id=None):
+    """
+    Delete source-model rows that have a target-model twin. Run after the app has
+    been switched to the target model.
+    """
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        DELETE FROM embeddings e
+        WHERE e.embedding_model = %(source)s
+          AND (%(course)s::text IS NULL OR e.metadata->>'courseId' = %(course)s)
+          AND EXISTS (SELECT 1 FROM embeddings t WHERE t.id = e.id AND t.embedding_model = %(target)s)
+        """,
+        {'source': source_model, 'target': target_model, 'course': course_id}
+    )
+    deleted = cursor.rowcount
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return deleted
+
+def job_status(cursor, job_id):
+    cursor.execute(
+        """
+        SELECT id, course_id, source_model, target_model, status, rows_done, rows_total,
+               rows_per_sec, eta_seconds, error, started_at, updated_at, finished_at
+        FROM reembed_jobs WHERE id = %s
+        """,
+        (job_id,)
+    )
+    return cursor.fetchone()
+
+def start_background_job(job):
+    thread = threading.Thread(target=_run_quietly, args=(job,), name=f"reembed-{job.job_id}", daemon=True)
+    thread.start()
+    return thread
+
+def _run_quietly(job):
+    try:
+        job.run()
+    except Exception as e:
+        # Already recorded on the job row; the thread has nobody to raise to
+        print(f"Re-embed job {job.job_id} failed: {e}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-embed stored chunks with another embedding model.")
+    parser.add_argument('--provider', choices=['openai', 'local'], default='openai')
+    parser.add_argument('--model', help='target model name')
+    parser.add_argument('--source-model', help="model to re-embed from; defaults to the app's current model")
+    parser.add_argument('--course', help='only re-embed this course')
+    parser.add_argument('--batch-size', type=int, default=REEMBED_BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=REEMBED_CONCURRENCY)
+    parser.add_argument('--resume', metavar='JOB_ID', help='continue an interrupted job')
+    parser.add_argument('--retire-source', action='store_true', help='delete source rows that have a target twin and exit')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    from app import get_db_connection, gateway, embedding_provider
+    if not args.source_model:
+        args.source_model = embedding_provider.model_name
+
+    if args.retire_source:
+        if not args.model:
+            sys.exit("--retire-source needs --model")
+        deleted = retire_source(get_db_connection, args.source_model, args.model, args.course)
+        print(f"Deleted {deleted} {args.source_model} rows")
+        return
+
+    options = {'batch_size': args.batch_size, 'concurrency': args.concurrency}
+    if args.resume:
+        job = ReembedJob.resume(get_db_connection, gateway, args.resume, **options)
+    else:
+        provider = embedding_providers.create_embedding_provider(gateway, kind=args.provider, model_name=args.model)
+        job = ReembedJob.create(
+            get_db_connection, provider, course_id=args.course, source_model=args.source_model,
+            provider_kind=args.provider, **options
+        )
+    print(f"Re-embed job {job.job_id}: {job.source_model} -> {job.provider.model_name}")
+    job.run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Optional cross-encoder re-ranking of semantic search candidates.
+
+When enabled, semantic_search over-fetches RERANK_CANDIDATES chunks from
+match_documents, scores each (query, chunk) pair with a local cross-encoder and
+keeps the best k. Scores are cached by a hash of the pair, and pairs are scored
+in batches.
+
+Re-ranking is best-effort. It is skipped, and the vector order is used as is,
+when all RERANK_MAX_CONCURRENT slots are busy, when recent re-ranks have been
+slower than RERANK_BUDGET_MS, or when the model cannot be loaded. A batch loop
+that runs past the budget stops early.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+import tracing
+
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.environ.get("RERANK_CANDIDATES", "20"))
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.environ.get("RERANK_BUDGET_MS", "250"))
+RERANK_MAX_CONCURRENT = int(os.environ.get("RERANK_MAX_CONCURRENT", "2"))
+RERANK_CACHE_SIZE = int(os.environ.get("RERANK_CACHE_SIZE", "50000"))
+# Candidates scoring below this are dropped even if fewer than k remain
+RERANK_MIN_SCORE = float(os.environ["RERANK_MIN_SCORE"]) if os.environ.get("RERANK_MIN_SCORE") else None
+
+RERANK_DURATION = metrics.histogram(
+    'rerank_duration_seconds', 'Time spent re-ranking search candidates.'
+)
+RERANK_SKIPPED = metrics.counter(
+    'rerank_skipped_total', 'Re-ranks skipped and served in vector order.', ('reason',)
+)
+RERANK_CACHE = metrics.counter(
+    'rerank_cache_total', 'Re-rank score cache lookups.', ('result',)
+)
+
+def pair_key(query, content):
+    return hashlib.sha1(f"{query}\0{content}".encode('utf-8')).digest()
+
+class Reranker:
+    def __init__(self, model_name=RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS,
+                 max_concurrent=RERANK_MAX_CONCURRENT, min_score=RERANK_MIN_SCORE, cache_size=RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget = budget_ms / 1000
+        self.min_score = min_score
+        self.cache_size = cache_size
+        self._model = None
+        self._model_error = None
+        self._model_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Exponentially weighted recent re-rank duration, used to shed load early
+        self._recent_duration = 0.0
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None and self._model_error is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device='cpu')
+                except Exception as e:
+                    print(f"Warning: re-ranking disabled, could not load {self.model_name}: {e}")
+                    self._model_error = e
+            return self._model
+
+    def available(self):
+        return self._get_model() is not None
+
+    def predict(self, pairs):
+        """Score (query, content) pairs. Separated out so benchmarks can stub the model."""
+        return [float(score) for score in self._get_model().predict(pairs, batch_size=len(pairs))]
+
+    def _cached(self, key):
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store(self, key, score):
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query, candidates, k):
+        """
+        Return the best k candidates by cross-encoder score, each with a
+        `rerank_score`, or None when re-ranking was skipped.
+        """
+        if not candidates:
+            return candidates
+        if self._recent_duration > self.budget:
+            # Decay so a later request probes again once load drops
+            self._recent_duration *= 0.9
+            RERANK_SKIPPED.inc(reason='over_budget')
+            return None
+        if not self._slots.acquire(blocking=False):
+            RERANK_SKIPPED.inc(reason='overloaded')
+            return None
+        try:
+            if not self.available():
+                RERANK_SKIPPED.inc(reason='unavailable')
+                return None
+            with tracing.span('rerank', candidates=len(candidates), k=k) as rerank_span:
+                start = time.perf_counter()
+                scores = self._score(query, candidates, start)
+                elapsed = time.perf_counter() - start
+                RERANK_DURATION.observe(elapsed)
+                self._recent_duration = 0.8 * self._recent_duration + 0.2 * elapsed
+                if scores is None:
+                    RERANK_SKIPPED.inc(reason='budget_exceeded')
+                    rerank_span.set(skipped=True)
+                    return None
+        finally:
+            self._slots.release()
+
+        ranked = sorted(zip(scores, candidates), key=lambda pair: pair[0], reverse=True)
+        results = []
+        for score, candidate in ranked:
+            if self.min_score is not None and score < self.min_score:
+                break
+            results.append({**candidate, 'rerank_score': score})
+            if len(results) == k:
+                break
+        return results
+
+    def _score(self, query, candidates, start):
+        keys = [pair_key(query, candidate['content']) for candidate in candidates]
+        scores = [self._cached(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        RERANK_CACHE.inc(len(candidates) - len(missing), result='hit')
+        RERANK_CACHE.inc(len(missing), result='miss')
+
+        for batch_start in range(0, len(missing), self.batch_size):
+            if time.perf_counter() - start > self.budget:
+                return None
+            batch = missing[batch_start:batch_start + self.batch_size]
+            batch_scores = self.predict([(query, candidates[i]['content']) for i in batch])
+            for i, score in zip(batch, batch_scores):
+                scores[i] = score
+                self._store(keys[i], score)
+        return scores
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+def get_reranker():
+    global _reranker
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = Reranker()
+        return _reranker
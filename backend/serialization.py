@@ -0,0 +1,149 @@
+"""
+Fast JSON serialization and compression for API responses.
+
+Flask's default provider goes through the stdlib json module, which is slow for
+large listings and search results. This module plugs a provider into the app that
+uses orjson when it is installed and falls back to json otherwise. Values coming
+back from psycopg2 rows (UUID, datetime, Decimal, memoryview) are handled natively.
+
+Large JSON responses are compressed with brotli or gzip when the client accepts it.
+"""
+
+import os
+import gzip
+import json
+import uuid
+import decimal
+import datetime
+
+from flask import request
+from flask.json.provider import JSONProvider
+
+import tracing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.environ.get("RESPONSE_COMPRESSION_MIN_SIZE", "2048"))
+COMPRESSION_ENABLED = os.environ.get("RESPONSE_COMPRESSION", "1") != "0"
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def default(value):
+    """
+    Convert values the JSON backends cannot serialize on their own.
+    """
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if hasattr(value, 'tolist'):
+        # numpy arrays and scalars when orjson is not available
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps_bytes(obj):
+    """
+    Serialize `obj` to UTF-8 encoded JSON bytes using the fastest available backend.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by dumps_bytes, so jsonify() picks it up everywhere.
+    """
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        with tracing.span('serialize') as serialize_span:
+            body = dumps_bytes(obj)
+            serialize_span.set(bytes=len(body))
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response):
+    """
+    after_request hook compressing large JSON bodies the client can decode.
+    """
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.mimetype != 'application/json'
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    with tracing.span('compress', encoding=encoding, input_bytes=len(data)) as compress_span:
+        compressed = compress(data, encoding)
+        compress_span.set(output_bytes=len(compressed))
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+
+    # The compressed body is a different representation, so its validator must be weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+def init_app(app):
+    """
+    Install the fast JSON provider and response compression on a Flask app.
+    """
+    app.json = FastJSONProvider(app)
+    if COMPRESSION_ENABLED:
+        app.after_request(compress_response)
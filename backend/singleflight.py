@@ -0,0 +1,183 @@
+"""
+Single-flight coalescing of identical concurrent requests.
+
+When many students ask the same question at once, only the first caller (the
+leader) runs the embedding, retrieval and completion. Callers that arrive with
+the same key while it is in flight wait for the leader and get their own copy of
+its result. If the leader raises, every waiter gets the same exception.
+
+Within a worker this uses a dict of in-flight calls guarded by a lock. Setting
+SINGLEFLIGHT_SQLITE_PATH also coalesces across worker processes on the same
+host: a leader claims the key with a row in a shared SQLite file, and leaders
+in other workers poll for its published result instead of running their own.
+If that wait times out, or the leader fails, they fall back to running the call.
+"""
+
+import os
+import copy
+import time
+import sqlite3
+import hashlib
+import threading
+
+import metrics
+import serialization
+
+SINGLEFLIGHT_SQLITE_PATH = os.environ.get("SINGLEFLIGHT_SQLITE_PATH")
+# How long a worker waits on another worker's leader before running the call itself
+SINGLEFLIGHT_WAIT_TIMEOUT = float(os.environ.get("SINGLEFLIGHT_WAIT_TIMEOUT", "30"))
+SINGLEFLIGHT_POLL_INTERVAL = 0.02
+# Published results older than this are purged
+SINGLEFLIGHT_RESULT_RETENTION = 60
+
+COALESCED = metrics.counter(
+    'singleflight_requests_total', 'Coalescible requests by outcome.', ('group', 'outcome')
+)
+
+def normalize_query(query):
+    """Case- and whitespace-insensitive form of a query, used in coalescing keys."""
+    return " ".join(query.casefold().split())
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SQLiteFlightStore:
+    """
+    Cross-process claims and results in a SQLite file shared by the workers on a host.
+    """
+
+    def __init__(self, path, stale_after=SINGLEFLIGHT_WAIT_TIMEOUT):
+        self.path = path
+        self.stale_after = stale_after
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS inflight (key TEXT PRIMARY KEY, started REAL NOT NULL)')
+        conn.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB NOT NULL, finished REAL NOT NULL)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def claim(self, key):
+        """Return True if this process now owns the key."""
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            # A leader that died mid-call must not block the key forever
+            conn.execute('DELETE FROM inflight WHERE key = ? AND started < ?', (key, now - self.stale_after))
+            claimed = conn.execute('INSERT OR IGNORE INTO inflight (key, started) VALUES (?, ?)', (key, now)).rowcount == 1
+            if claimed:
+                conn.execute('DELETE FROM results WHERE key = ?', (key,))
+        return claimed
+
+    def publish(self, key, value):
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO results (key, value, finished) VALUES (?, ?, ?)', (key, serialization.dumps_bytes(value), now))
+            conn.execute('DELETE FROM inflight WHERE key = ?', (key,))
+            conn.execute('DELETE FROM results WHERE finished < ?', (now - SINGLEFLIGHT_RESULT_RETENTION,))
+
+    def release(self, key):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM inflight WHERE key = ?', (key,))
+
+    def wait(self, key, timeout):
+        """
+        Wait for another process to publish the key. Returns (True, value), or
+        (False, None) if its leader gave up or the wait timed out.
+        """
+        conn = self._connection()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            row = conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                return True, serialization.loads(row[0])
+            if conn.execute('SELECT 1 FROM inflight WHERE key = ?', (key,)).fetchone() is None:
+                # Check once more in case the result landed between the two reads
+                row = conn.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+                return (True, serialization.loads(row[0])) if row is not None else (False, None)
+            time.sleep(SINGLEFLIGHT_POLL_INTERVAL)
+        return False, None
+
+class SingleFlight:
+    """
+    Run at most one call per key at a time and share its result with concurrent callers.
+
+    Results shared across workers go through JSON, so they must be JSON-serializable.
+    """
+
+    def __init__(self, group, store=None):
+        self.group = group
+        self.store = store
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        key = hashlib.sha1(f"{self.group}\0{key}".encode('utf-8')).hexdigest()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            COALESCED.inc(group=self.group, outcome='coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = self._run(key, fn)
+            return copy.deepcopy(call.result)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _run(self, key, fn):
+        if self.store is None:
+            COALESCED.inc(group=self.group, outcome='leader')
+            return fn()
+        try:
+            claimed = self.store.claim(key)
+            if not claimed:
+                found, value = self.store.wait(key, SINGLEFLIGHT_WAIT_TIMEOUT)
+                if found:
+                    COALESCED.inc(group=self.group, outcome='coalesced_worker')
+                    return value
+        except sqlite3.Error as e:
+            print(f"Warning: single-flight store unavailable: {e}")
+            claimed = False
+
+        COALESCED.inc(group=self.group, outcome='leader')
+        if not claimed:
+            return fn()
+        try:
+            result = fn()
+        except BaseException:
+            self._try(self.store.release, key)
+            raise
+        self._try(self.store.publish, key, result)
+        return result
+
+    def _try(self, operation, *args):
+        try:
+            operation(*args)
+        except (sqlite3.Error, TypeError) as e:
+            print(f"Warning: single-flight store update failed: {e}")
+
+def create_store():
+    return SQLiteFlightStore(SINGLEFLIGHT_SQLITE_PATH) if SINGLEFLIGHT_SQLITE_PATH else None
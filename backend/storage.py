@@ -0,0 +1,152 @@
+"""
+URL resolution for objects in the course materials bucket.
+
+get_file_url used to GET the public object URL, downloading the whole file, just
+to confirm it exists. StorageURLResolver checks existence without a body:
+
+- public buckets (STORAGE_PUBLIC): HEAD on the public URL, which also returns the
+  size and content type. Several paths are checked concurrently.
+- private buckets: one POST /object/sign/<bucket> call signs a whole batch of
+  paths; the per-path error in the response doubles as the existence check.
+
+Resolved URLs and metadata are kept per path for STORAGE_URL_CACHE_TTL, and
+missing paths for STORAGE_MISSING_CACHE_TTL. Signed URLs are only cached for
+part of their lifetime, so a cached URL never expires in the client's hands, and
+their expiresIn is the lifetime left when they are handed out, not the one they
+were signed with. Expired entries are swept once per cache TTL. Uploads and
+deletes invalidate their path.
+"""
+
+import os
+import time
+import threading
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+STORAGE_BUCKET = os.environ.get("STORAGE_BUCKET", "course-materials")
+STORAGE_PUBLIC = os.environ.get("STORAGE_PUBLIC", "true").lower() in ("1", "true", "yes")
+STORAGE_SIGNED_URL_EXPIRES = int(os.environ.get("STORAGE_SIGNED_URL_EXPIRES", "3600"))
+STORAGE_URL_CACHE_TTL = float(os.environ.get("STORAGE_URL_CACHE_TTL", "300"))
+STORAGE_MISSING_CACHE_TTL = float(os.environ.get("STORAGE_MISSING_CACHE_TTL", "30"))
+STORAGE_HEAD_CONCURRENCY = int(os.environ.get("STORAGE_HEAD_CONCURRENCY", "8"))
+# Upper bound on paths per request to /api/storage/getUrls and per signing call
+STORAGE_MAX_BATCH = 500
+
+URL_CACHE = metrics.counter(
+    'storage_url_cache_total', 'Storage URL lookups by cache result.', ('result',)
+)
+
+class StorageURLResolver:
+    def __init__(self, session, base_url, headers, bucket=STORAGE_BUCKET, public=STORAGE_PUBLIC,
+                 expires_in=STORAGE_SIGNED_URL_EXPIRES, ttl=STORAGE_URL_CACHE_TTL,
+                 missing_ttl=STORAGE_MISSING_CACHE_TTL):
+        self.session = session
+        self.base_url = base_url
+        # Callable returning auth headers for storage calls
+        self.headers = headers
+        self.bucket = bucket
+        self.public = public
+        self.expires_in = expires_in
+        # Never hand out a signed URL with less than half of its lifetime left
+        self.ttl = ttl if public else min(ttl, expires_in / 2)
+        self.missing_ttl = missing_ttl
+        # path -> (cached until, value, signed URL expires at or None)
+        self._entries = {}
+        self._next_sweep = time.monotonic() + self.ttl
+        self._lock = threading.Lock()
+
+    def public_url(self, path):
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{quote(path)}"
+
+    def resolve(self, path):
+        """Return {'url', 'size', 'contentType'} for one path, or None if it does not exist."""
+        return self.resolve_many([path])[path]
+
+    def resolve_many(self, paths):
+        """Resolve a list of paths in as few storage calls as possible. Missing paths map to None."""
+        results = {}
+        misses = []
+        now = time.monotonic()
+        with self._lock:
+            for path in dict.fromkeys(paths):
+                entry = self._entries.get(path)
+                if entry and entry[0] > now:
+                    results[path] = self._remaining(entry, now)
+                else:
+                    misses.append(path)
+        URL_CACHE.inc(len(results), result='hit')
+        if not misses:
+            return results
+        URL_CACHE.inc(len(misses), result='miss')
+
+        # Signed URLs count their lifetime from before the signing call
+        signed_at = time.monotonic()
+        fetched = self._head_many(misses) if self.public else self._sign_many(misses)
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._entries = {path: entry for path, entry in self._entries.items() if entry[0] > now}
+                self._next_sweep = now + self.ttl
+            for path, value in fetched.items():
+                expires_at = signed_at + self.expires_in if value and not self.public else None
+                entry = (now + (self.ttl if value else self.missing_ttl), value, expires_at)
+                self._entries[path] = entry
+                results[path] = self._remaining(entry, now)
+        return results
+
+    @staticmethod
+    def _remaining(entry, now):
+        _, value, expires_at = entry
+        if expires_at is None:
+            return value
+        return dict(value, expiresIn=max(int(expires_at - now), 0))
+
+    def invalidate(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def _head(self, path):
+        url = self.public_url(path)
+        with metrics.STORAGE_REQUEST_DURATION.time(operation='head'):
+            response = self.session.head(url, headers=self.headers(), allow_redirects=True)
+        if response.status_code == 404 or response.status_code == 400:
+            return None
+        response.raise_for_status()
+        size = response.headers.get('Content-Length')
+        return {
+            'url': url,
+            'size': int(size) if size is not None else None,
+            'contentType': response.headers.get('Content-Type'),
+        }
+
+    def _head_many(self, paths):
+        if len(paths) == 1:
+            return {paths[0]: self._head(paths[0])}
+        with ThreadPoolExecutor(max_workers=min(STORAGE_HEAD_CONCURRENCY, len(paths))) as pool:
+            return dict(zip(paths, pool.map(self._head, paths)))
+
+    def _sign_many(self, paths):
+        results = {}
+        for start in range(0, len(paths), STORAGE_MAX_BATCH):
+            batch = paths[start:start + STORAGE_MAX_BATCH]
+            with metrics.STORAGE_REQUEST_DURATION.time(operation='sign'):
+                response = self.session.post(
+                    f"{self.base_url}/storage/v1/object/sign/{self.bucket}",
+                    headers=self.headers(),
+                    json={'expiresIn': self.expires_in, 'paths': batch}
+                )
+            response.raise_for_status()
+            for path in batch:
+                results[path] = None
+            for item in response.json():
+                if item.get('error') or not item.get('signedURL'):
+                    continue
+                results[item['path']] = {
+                    'url': f"{self.base_url}/storage/v1{item['signedURL']}",
+                    'size': None,
+                    'contentType': None,
+                    'expiresIn': self.expires_in,
+                }
+        return results
@@ -0,0 +1,201 @@
+"""
+Exercise database routing against several local Postgres servers.
+Run this script to verify replica selection, read-your-writes pinning across
+replicas and sharded scatter-gather search.
+
+Set TEST_DATABASE_HOSTS to a comma-separated list of at least three servers
+(host or host:port, each with pgvector and a `postgres` database the current
+user can write to). Without it, temporary servers are started with the
+`pgserver` package if it is installed.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import psycopg2
+
+import db
+
+DIM = 16
+
+def start_servers(count=3):
+    hosts = [h for h in os.environ.get("TEST_DATABASE_HOSTS", "").split(',') if h.strip()]
+    if hosts:
+        return [db.parse_host(h) for h in hosts], []
+    try:
+        import pgserver
+    except ImportError:
+        print("❌ Set TEST_DATABASE_HOSTS or install pgserver to run these tests")
+        sys.exit(1)
+    servers = [pgserver.get_server(tempfile.mkdtemp(prefix=f'routing-{i}-'), cleanup_mode='stop') for i in range(count)]
+    # pgserver listens on a unix socket in its data directory
+    return [{'host': server.pgdata.as_posix()} for server in servers], servers
+
+def connect(host, port=None):
+    conn = psycopg2.connect(host=host, port=port, dbname='postgres', user=os.environ.get("TEST_DATABASE_USER", "postgres"))
+    conn.autocommit = True
+    return conn
+
+def server_id(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT current_setting('data_directory')")
+    value = cursor.fetchone()[0]
+    cursor.close()
+    return value
+
+def prepare(hosts):
+    ids = []
+    for host in hosts:
+        conn = connect(**host)
+        cursor = conn.cursor()
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS vector')
+        cursor.execute('DROP TABLE IF EXISTS routing_test_chunks')
+        cursor.execute('CREATE TABLE routing_test_chunks (id TEXT PRIMARY KEY, course_id TEXT, embedding VECTOR(%s))' % DIM)
+        ids.append(server_id(conn))
+        conn.close()
+    return ids
+
+def test_replica_reads(hosts, ids):
+    """Reads go to replicas round robin and fall back to the primary when none is reachable."""
+    print("\n--- Testing replica reads ---")
+    router = db.DatabaseRouter(connect, db.Node(hosts[0], hosts[1:]))
+    seen = []
+    for _ in range(4):
+        conn = router.read()
+        seen.append(server_id(conn))
+        conn.close()
+    down = db.DatabaseRouter(connect, db.Node(hosts[0], [{'host': '/nonexistent-socket-dir'}]))
+    conn = down.read()
+    fallback = server_id(conn)
+    conn.close()
+    ok = set(seen) == set(ids[1:]) and ids[0] not in seen and fallback == ids[0]
+    print(f"{'✅' if ok else '❌'} Reads hit {len(set(seen))} replicas, unreachable replica fell back to primary: {fallback == ids[0]}")
+    return ok
+
+def test_read_your_writes(hosts, ids):
+    """After mark_written, reads of that key stay on servers that have the write until the pin expires."""
+    print("\n--- Testing read-your-writes ---")
+    router = db.DatabaseRouter(connect, db.Node(hosts[0], hosts[1:]), read_your_writes_ttl=0.5)
+    conn = router.primary()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO routing_test_chunks (id, course_id) VALUES ('written', 'course-a')")
+    cursor.close()
+    router.mark_written('course-a', conn)
+    conn.close()
+
+    # The test servers are not streaming replicas, so none of them has replayed the write
+    pinned = router.read('course-a')
+    pinned_id = server_id(pinned)
+    pinned.close()
+    other = router.read('course-b')
+    other_id = server_id(other)
+    other.close()
+    time.sleep(0.6)
+    expired = router.read('course-a')
+    expired_id = server_id(expired)
+    expired.close()
+    ok = pinned_id == ids[0] and other_id != ids[0] and expired_id != ids[0]
+    print(f"{'✅' if ok else '❌'} Pinned read on primary: {pinned_id == ids[0]}, other keys on replicas: {other_id != ids[0]}, pin expired: {expired_id != ids[0]}")
+    return ok
+
+def test_read_your_writes_next_replica(hosts, ids):
+    """A pinned read skips a replica that has not replayed the write and uses one that has."""
+    print("\n--- Testing read-your-writes across replicas ---")
+
+    class Router(db.DatabaseRouter):
+        # Only the last server counts as having replayed the write
+        @staticmethod
+        def _replayed(conn, lsn):
+            return server_id(conn) == ids[-1]
+
+    router = Router(connect, db.Node(hosts[0], hosts[1:]))
+    conn = router.primary()
+    router.mark_written('course-a', conn)
+    conn.close()
+    seen = []
+    for _ in range(4):
+        conn = router.read('course-a')
+        seen.append(server_id(conn))
+        conn.close()
+    ok = set(seen) == {ids[-1]}
+    print(f"{'✅' if ok else '❌'} {seen.count(ids[-1])} of {len(seen)} pinned reads on the replica that has the write, "
+          f"{seen.count(ids[0])} on the primary")
+    return ok
+
+def test_sharded_scatter_gather(hosts, ids):
+    """Courses land on the node picked by hash and 'all' searches merge every node's top k."""
+    print("\n--- Testing sharded scatter-gather ---")
+    router = db.DatabaseRouter(connect, db.Node(hosts[0]), [db.Node(h) for h in hosts])
+    rng = np.random.default_rng(0)
+    vectors = {}
+    placement = {}
+    for c in range(12):
+        course_id = f"course-{c}"
+        conn = router.vector_primary(course_id)
+        placement[course_id] = server_id(conn)
+        cursor = conn.cursor()
+        for i in range(50):
+            vector = rng.standard_normal(DIM)
+            vector /= np.linalg.norm(vector)
+            chunk_id = f"{course_id}-{i}"
+            vectors[chunk_id] = vector
+            cursor.execute(
+                'INSERT INTO routing_test_chunks (id, course_id, embedding) VALUES (%s, %s, %s)',
+                (chunk_id, course_id, str(vector.tolist()))
+            )
+        cursor.close()
+        conn.close()
+
+    stable = True
+    for course_id in placement:
+        conn = router.vector_read(course_id)
+        stable = stable and server_id(conn) == placement[course_id]
+        conn.close()
+    query = rng.standard_normal(DIM)
+    query /= np.linalg.norm(query)
+    k = 10
+
+    def top_k(conn):
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, 1 - (embedding <=> %s::vector) AS similarity FROM routing_test_chunks
+            WHERE embedding IS NOT NULL ORDER BY embedding <=> %s::vector LIMIT %s
+            """,
+            (str(query.tolist()), str(query.tolist()), k)
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    merged = sorted((row for rows in router.scatter(top_k) for row in rows), key=lambda row: row[1], reverse=True)[:k]
+    expected = sorted(vectors, key=lambda chunk_id: -float(vectors[chunk_id] @ query))[:k]
+    ok = stable and len(set(placement.values())) == len(hosts) and [row[0] for row in merged] == expected
+    print(f"{'✅' if ok else '❌'} 12 courses over {len(set(placement.values()))} shards, placement stable: {stable}, merged top {k} matches exact: {[row[0] for row in merged] == expected}")
+    return ok
+
+if __name__ == "__main__":
+    print("Running database routing tests...")
+    hosts, servers = start_servers()
+    if len(hosts) < 3:
+        print("❌ At least three servers are needed")
+        sys.exit(1)
+    ids = prepare(hosts)
+
+    replica_success = test_replica_reads(hosts, ids)
+    ryw_success = test_read_your_writes(hosts, ids)
+    next_replica_success = test_read_your_writes_next_replica(hosts, ids)
+    shard_success = test_sharded_scatter_gather(hosts, ids)
+
+    for server in servers:
+        server.cleanup()
+
+    print("\n--- Test Summary ---")
+    print(f"Replica reads: {'✅ Passed' if replica_success else '❌ Failed'}")
+    print(f"Read-your-writes: {'✅ Passed' if ryw_success else '❌ Failed'}")
+    print(f"Read-your-writes across replicas: {'✅ Passed' if next_replica_success else '❌ Failed'}")
+    print(f"Sharded scatter-gather: {'✅ Passed' if shard_success else '❌ Failed'}")
+    sys.exit(0 if replica_success and ryw_success and next_replica_success and shard_success else 1)
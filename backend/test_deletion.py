@@ -0,0 +1,148 @@
+"""
+Exercise chunk deletion against a local Postgres.
+Run this script to verify that deleting a file whose chunks span several
+courses and several batches removes every chunk and corrects each course's
+score statistics, and that a failed re-ingestion leaves the previous chunks in
+place.
+
+Set TEST_DATABASE_HOSTS to a server (host or host:port, with pgvector and a
+`postgres` database the current user can write to). Without it, a temporary
+server is started with the `pgserver` package if it is installed.
+"""
+
+import os
+import sys
+import json
+import tempfile
+
+import numpy as np
+import psycopg2
+
+import db
+import deletion
+import ingestion
+import course_stats
+import material_summaries
+
+DIM = 8
+MODEL = 'test-model'
+SCHEMA = 'deletion_test'
+
+def start_server():
+    hosts = [h for h in os.environ.get("TEST_DATABASE_HOSTS", "").split(',') if h.strip()]
+    if hosts:
+        return db.parse_host(hosts[0]), None
+    try:
+        import pgserver
+    except ImportError:
+        print("❌ Set TEST_DATABASE_HOSTS or install pgserver to run these tests")
+        sys.exit(1)
+    server = pgserver.get_server(tempfile.mkdtemp(prefix='deletion-'), cleanup_mode='stop')
+    return {'host': server.pgdata.as_posix()}, server
+
+def connect(host, port=None):
+    return psycopg2.connect(
+        host=host, port=port, dbname='postgres', user=os.environ.get("TEST_DATABASE_USER", "postgres"),
+        options=f"-c search_path={SCHEMA},public"
+    )
+
+def prepare(host):
+    conn = connect(**host)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS vector SCHEMA public')
+    cursor.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+    cursor.execute(f'CREATE SCHEMA {SCHEMA}')
+    cursor.execute('''
+        CREATE TABLE embeddings (
+            id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            embedding VECTOR,
+            metadata JSONB,
+            embedding_model TEXT NOT NULL,
+            embedding_dim INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, embedding_model)
+        )
+    ''')
+    cursor.execute(course_stats.CREATE_TABLE_SQL)
+    cursor.execute(material_summaries.CREATE_TABLE_SQL)
+    cursor.close()
+    conn.close()
+
+def test_delete_file_across_courses_and_batches(host):
+    """A file's chunks in two courses, over several batches, are all deleted and taken out of the statistics."""
+    print("\n--- Testing multi-batch deletion across courses ---")
+    rng = np.random.default_rng(0)
+    conn = connect(**host)
+    cursor = conn.cursor()
+    for course_id, chunks in (('course-a', 7), ('course-b', 5)):
+        vectors = rng.standard_normal((chunks, DIM))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for i, vector in enumerate(vectors):
+            cursor.execute(
+                'INSERT INTO embeddings (id, content, embedding, metadata, embedding_model, embedding_dim) VALUES (%s, %s, %s, %s, %s, %s)',
+                (f"shared.pdf_{course_id}_{i}", 'text', str(vector.tolist()),
+                 json.dumps({'fileId': 'shared.pdf', 'courseId': course_id, 'chunkIndex': i}), MODEL, DIM)
+            )
+        course_stats.update_course_stats(cursor, course_id, MODEL, vectors)
+    conn.commit()
+
+    courses = set()
+    rows, _ = deletion.delete_chunks(conn, file_paths=['shared.pdf'], batch_size=3, courses=courses)
+
+    cursor.execute('SELECT count(*) FROM embeddings')
+    remaining = cursor.fetchone()[0]
+    cursor.execute('SELECT course_id, chunk_count FROM course_score_stats ORDER BY course_id')
+    counts = dict(cursor.fetchall())
+    cursor.close()
+    conn.close()
+
+    ok = rows == 12 and remaining == 0 and courses == {'course-a', 'course-b'} and counts == {'course-a': 0, 'course-b': 0}
+    print(f"{'✅' if ok else '❌'} Deleted {rows} of 12 chunks in batches of 3, {remaining} left, courses {sorted(courses)}, statistics counts {counts}")
+    return ok
+
+def test_failed_replace_keeps_chunks(host):
+    """Re-ingesting a material that fails to store leaves its previous chunks and statistics untouched."""
+    print("\n--- Testing failed replacement ---")
+    rng = np.random.default_rng(1)
+    conn = connect(**host)
+    metadata = {'materialId': 'material-1', 'courseId': 'course-c'}
+    documents = [{'id': f"material-1_chunk_{i}", 'content': 'text', 'metadata': {**metadata, 'chunkIndex': i}} for i in range(4)]
+    vectors = rng.standard_normal((4, DIM)).astype(np.float32)
+    ingestion.store_documents(conn, documents, vectors, MODEL)
+
+    # Two rows with one id make the upsert fail after the old chunks were deleted
+    failed = False
+    try:
+        ingestion.store_documents(conn, documents[:2] + documents[:1], vectors[:3], MODEL)
+    except psycopg2.Error:
+        failed = True
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM embeddings WHERE metadata->>'materialId' = 'material-1'")
+    remaining = cursor.fetchone()[0]
+    cursor.execute("SELECT chunk_count FROM course_score_stats WHERE course_id = 'course-c'")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+
+    ok = failed and remaining == 4 and count == 4
+    print(f"{'✅' if ok else '❌'} Write failed: {failed}, chunks left: {remaining} of 4, statistics count: {count}")
+    return ok
+
+if __name__ == "__main__":
+    print("Running deletion tests...")
+    host, server = start_server()
+    prepare(host)
+
+    batches_success = test_delete_file_across_courses_and_batches(host)
+    replace_success = test_failed_replace_keeps_chunks(host)
+
+    if server is not None:
+        server.cleanup()
+
+    print("\n--- Test Summary ---")
+    print(f"Multi-batch deletion across courses: {'✅ Passed' if batches_success else '❌ Failed'}")
+    print(f"Failed replacement: {'✅ Passed' if replace_success else '❌ Failed'}")
+    sys.exit(0 if batches_success and replace_success else 1)
@@ -0,0 +1,105 @@
+"""
+Exercise FAQ lookups in chat without a database or the OpenAI API.
+Run this script to verify that FaqIndex answers a known phrasing and a close
+paraphrase from the entries its reader returns, and that /api/chat serves FAQ
+answers and falls back to retrieval when the FAQ lookup fails.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("WARM_UP_ON_START", "false")
+
+import faq
+
+MODEL = 'test-model'
+ENTRY = (1, 'When is the midterm?', ['when is the midterm?'], 'The midterm is on October 12.',
+         [{'title': 'Syllabus', 'type': 'syllabus'}], ['material-1'], [1.0, 0.0, 0.0])
+
+class StubCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+class StubConnection:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return StubCursor(self.rows)
+
+    def close(self):
+        pass
+
+def stub_reader(rows):
+    return lambda course_id: StubConnection(rows)
+
+def test_index_lookups():
+    """exact matches a stored phrasing and nearest a close embedding; unrelated questions miss."""
+    print("\n--- Testing FAQ index lookups ---")
+    index = faq.FaqIndex(stub_reader([ENTRY]), similarity=0.9)
+    exact = index.exact('course-a', MODEL, '  When is the MIDTERM? ')
+    exact_miss = index.exact('course-a', MODEL, 'Where is office hours?')
+    near = index.nearest('course-a', MODEL, [0.99, 0.1, 0.0])
+    far = index.nearest('course-a', MODEL, [0.0, 1.0, 0.0])
+    ok = (exact is not None and exact['entry_id'] == 1 and exact_miss is None
+          and near is not None and near['entry_id'] == 1 and far is None)
+    print(f"{'✅' if ok else '❌'} Exact hit: {exact is not None}, exact miss: {exact_miss is None}, "
+          f"nearest hit: {near is not None}, nearest miss: {far is None}")
+    return ok
+
+class StubQueryLog:
+    def log(self, *args, **kwargs):
+        pass
+
+class FailingIndex:
+    def exact(self, course_id, model_name, query):
+        raise RuntimeError("FAQ unavailable")
+
+    def nearest(self, course_id, model_name, query_embedding):
+        raise RuntimeError("FAQ unavailable")
+
+def test_chat_endpoint():
+    """/api/chat answers from the FAQ, and from retrieval when the FAQ lookup raises."""
+    print("\n--- Testing /api/chat with the FAQ ---")
+    import app
+
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='Generated answer.'))])
+
+    app.query_log = StubQueryLog()
+    app.create_embedding = lambda text, *args, **kwargs: [0.0, 1.0, 0.0]
+    app.semantic_search = lambda *args, **kwargs: [{'id': 'chunk', 'content': 'text', 'metadata': {'title': 'Notes', 'type': 'notes'}}]
+    app.generate_answer = lambda messages: completion
+    client = app.app.test_client()
+
+    app.faq_index = faq.FaqIndex(stub_reader([ENTRY]))
+    served = client.post('/api/chat', json={'query': 'When is the midterm?', 'course_id': 'course-a'})
+    app.faq_index = FailingIndex()
+    fallback = client.post('/api/chat', json={'query': 'When is the midterm?', 'course_id': 'course-a'})
+
+    ok = (served.status_code == 200 and served.get_json()['answer'] == ENTRY[3]
+          and fallback.status_code == 200 and fallback.get_json()['answer'] == 'Generated answer.')
+    print(f"{'✅' if ok else '❌'} FAQ answer: {served.status_code} {served.get_json()}, "
+          f"failed lookup: {fallback.status_code} {fallback.get_json()}")
+    return ok
+
+if __name__ == "__main__":
+    print("Running FAQ tests...")
+
+    index_success = test_index_lookups()
+    chat_success = test_chat_endpoint()
+
+    print("\n--- Test Summary ---")
+    print(f"FAQ index lookups: {'✅ Passed' if index_success else '❌ Failed'}")
+    print(f"Chat endpoint: {'✅ Passed' if chat_success else '❌ Failed'}")
+    sys.exit(0 if index_success and chat_success else 1)
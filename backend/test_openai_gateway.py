@@ -0,0 +1,236 @@
+"""
+Exercise the OpenAI gateway against a local mock server that returns 429s.
+Run this script to verify retry, throttling and lane priority behaviour without
+touching the real OpenAI API.
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from openai import OpenAI
+
+import openai_gateway
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers embeddings and chat calls, returning 429 while the server is throttling."""
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.calls += 1
+            throttle = server.fail_next > 0
+            if throttle:
+                server.fail_next -= 1
+        time.sleep(server.latency)
+
+        if throttle:
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {
+                "retry-after-ms": "50",
+                "x-ratelimit-limit-requests": "600",
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": "100ms",
+            })
+            return
+
+        payload = json.loads(body or b'{}')
+        if self.path.endswith('/embeddings'):
+            response = {
+                "object": "list",
+                "model": payload.get("model"),
+                "data": [{"object": "embedding", "index": 0, "embedding": [0.0] * 8}],
+                "usage": {"prompt_tokens": 1, "total_tokens": 1},
+            }
+        else:
+            response = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 1, "total_tokens": 11},
+            }
+        self._send(200, response, {
+            "x-ratelimit-limit-requests": "600",
+            "x-ratelimit-remaining-requests": "599",
+            "x-ratelimit-reset-requests": "100ms",
+        })
+
+    def _send(self, status, payload, headers):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_mock_server(fail_next=0, latency=0.0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockOpenAIHandler)
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.fail_next = fail_next
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def make_gateway(server, rpm=600):
+    client = OpenAI(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        http_client=httpx.Client(),
+        max_retries=0
+    )
+    return openai_gateway.OpenAIGateway(client, rpm=rpm)
+
+def test_retries_after_429():
+    """A burst of 429s is retried with backoff and the call eventually succeeds."""
+    print("\n--- Testing retry after 429 ---")
+    server = start_mock_server(fail_next=3)
+    gateway = make_gateway(server)
+    throttled_before = openai_gateway.THROTTLED.value(lane=openai_gateway.INTERACTIVE)
+
+    try:
+        response = gateway.create_embedding(input="hello", model="text-embedding-3-small", lane=openai_gateway.INTERACTIVE)
+    except Exception as e:
+        print(f"❌ Call failed after retries: {e}")
+        return False
+    finally:
+        server.shutdown()
+
+    throttled = openai_gateway.THROTTLED.value(lane=openai_gateway.INTERACTIVE) - throttled_before
+    limit = gateway.stats()[openai_gateway.INTERACTIVE]['concurrency_limit']
+    if response.data and server.calls == 4 and throttled == 3 and limit < 16:
+        print(f"✅ Succeeded after {throttled} throttled attempts; concurrency limit backed off to {limit:.2f}")
+        return True
+    print(f"❌ Unexpected result: calls={server.calls} throttled={throttled} limit={limit}")
+    return False
+
+def test_gives_up_after_max_retries():
+    """A lane stops retrying once its retry budget is exhausted."""
+    print("\n--- Testing retry budget ---")
+    server = start_mock_server(fail_next=100)
+    gateway = make_gateway(server)
+    gateway.lanes[openai_gateway.INTERACTIVE].max_retries = 2
+
+    try:
+        gateway.create_chat_completion(messages=[{"role": "user", "content": "hi"}], model="gpt-4-turbo")
+        print("❌ Expected a RateLimitError")
+        return False
+    except Exception as e:
+        ok = type(e).__name__ == 'RateLimitError' and server.calls == 3
+    finally:
+        server.shutdown()
+
+    print("✅ Raised RateLimitError after 3 attempts" if ok else f"❌ Unexpected behaviour: calls={server.calls}")
+    return ok
+
+def test_interactive_priority_under_bulk_load():
+    """Interactive calls are served promptly while bulk embedding saturates the budget."""
+    print("\n--- Testing interactive priority under bulk load ---")
+    server = start_mock_server(latency=0.01)
+    # 120 RPM refills two requests per second, so bulk traffic alone exhausts the bucket
+    gateway = make_gateway(server, rpm=120)
+    stop = threading.Event()
+
+    def bulk_worker():
+        while not stop.is_set():
+            gateway.create_embedding(input="chunk " * 50, model="text-embedding-3-small", lane=openai_gateway.BULK)
+
+    workers = [threading.Thread(target=bulk_worker, daemon=True) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    time.sleep(1.0)
+
+    start = time.perf_counter()
+    gateway.create_chat_completion(messages=[{"role": "user", "content": "When is the midterm?"}], model="gpt-4-turbo")
+    elapsed = time.perf_counter() - start
+    stop.set()
+    server.shutdown()
+
+    # The bulk lane keeps 20% of the bucket in reserve, so interactive calls should not queue
+    if elapsed < 0.5:
+        print(f"✅ Interactive call completed in {elapsed * 1000:.0f} ms under bulk load")
+        return True
+    print(f"❌ Interactive call waited {elapsed * 1000:.0f} ms under bulk load")
+    return False
+
+def test_slot_released_on_unexpected_error():
+    """A call failing with an error the gateway does not handle still gives back its concurrency slot."""
+    print("\n--- Testing slot release on unexpected errors ---")
+    gateway = openai_gateway.OpenAIGateway(client=object())
+    lane = gateway.lanes[openai_gateway.INTERACTIVE]
+    lane.limiter.limit = 2.0
+
+    def broken_send():
+        raise ValueError("could not decode response")
+
+    failures = 0
+    for _ in range(5):
+        try:
+            gateway._call(openai_gateway.INTERACTIVE, 'chat', 'gpt-4-turbo', 10, broken_send)
+        except ValueError:
+            failures += 1
+
+    in_flight = gateway.stats()[openai_gateway.INTERACTIVE]['in_flight']
+    ok = failures == 5 and in_flight == 0
+    print(f"{'✅' if ok else '❌'} {failures} failed calls on a lane limited to 2 slots, {in_flight} slots still held")
+    return ok
+
+def test_bulk_progress_under_interactive_load():
+    """Interactive callers queued on their own concurrency limit do not stop bulk calls."""
+    print("\n--- Testing bulk progress under interactive load ---")
+    server = start_mock_server(latency=0.2)
+    gateway = make_gateway(server)
+    interactive = gateway.lanes[openai_gateway.INTERACTIVE].limiter
+    interactive.limit = interactive.maximum = 1.0
+    stop = threading.Event()
+
+    def chat_worker():
+        while not stop.is_set():
+            gateway.create_chat_completion(messages=[{"role": "user", "content": "hi"}], model="gpt-4-turbo")
+
+    workers = [threading.Thread(target=chat_worker, daemon=True) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.5)
+
+    done = threading.Event()
+    start = time.perf_counter()
+    threading.Thread(
+        target=lambda: (gateway.create_embedding(input="chunk", model="text-embedding-3-small", lane=openai_gateway.BULK), done.set()),
+        daemon=True
+    ).start()
+    finished = done.wait(timeout=3.0)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    server.shutdown()
+
+    if finished:
+        print(f"✅ Bulk call completed in {elapsed * 1000:.0f} ms while interactive calls queued")
+        return True
+    print("❌ Bulk call was still waiting after 3 s of interactive load")
+    return False
+
+if __name__ == "__main__":
+    print("Running OpenAI gateway tests...")
+
+    retry_success = test_retries_after_429()
+    budget_success = test_gives_up_after_max_retries()
+    priority_success = test_interactive_priority_under_bulk_load()
+    release_success = test_slot_released_on_unexpected_error()
+    progress_success = test_bulk_progress_under_interactive_load()
+
+    print("\n--- Test Summary ---")
+    print(f"Retry after 429: {'✅ Passed' if retry_success else '❌ Failed'}")
+    print(f"Retry budget: {'✅ Passed' if budget_success else '❌ Failed'}")
+    print(f"Interactive priority: {'✅ Passed' if priority_success else '❌ Failed'}")
+    print(f"Slot release on errors: {'✅ Passed' if release_success else '❌ Failed'}")
+    print(f"Bulk progress: {'✅ Passed' if progress_success else '❌ Failed'}")
@@ -0,0 +1,143 @@
+"""
+Exercise the query log writer's failure handling without a database.
+Run this script to verify that a record a sink rejects is retried a bounded
+number of times and then quarantined, that an unreachable database does not
+use up attempts, and that workers replaying one journal concurrently write each
+record exactly once.
+"""
+
+import os
+import sys
+import json
+import tempfile
+import threading
+
+import psycopg2
+
+import querylog
+
+class FakeConnection:
+    def __init__(self):
+        self.autocommit = True
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+def make_writer(journal_path, sink, reachable=lambda: True):
+    def connect():
+        if not reachable():
+            raise psycopg2.OperationalError("could not connect to server")
+        return FakeConnection()
+    return querylog.QueryLogWriter(connect, tables=[], batch_size=50, journal_path=journal_path, sinks=[sink], max_attempts=3)
+
+def record(query):
+    return {'user_id': None, 'course_id': 'course', 'query': query, 'response': 'answer',
+            'query_embedding': None, 'material_ids': [], 'created_at': '2024-01-01 00:00:00'}
+
+def read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def test_rejected_record_is_quarantined():
+    """A record a sink keeps rejecting is retried alone, then quarantined; the rest of its batch is written."""
+    print("\n--- Testing retry and quarantine of a rejected record ---")
+    journal = os.path.join(tempfile.mkdtemp(prefix='querylog-'), 'journal.jsonl')
+    written = []
+
+    def sink(cursor, records):
+        if any(r['query'] == 'bad' for r in records):
+            raise ValueError("sink rejected the record")
+        written.extend(r['query'] for r in records)
+
+    writer = make_writer(journal, sink)
+    writer._buffer = [record('one'), record('bad'), record('two')]
+    writer.flush()
+    after_flush = [r['attempts'] for r in read_lines(journal)]
+    for _ in range(5):
+        writer._replay_journal()
+
+    quarantined = read_lines(writer.quarantine_path)
+    ok = (sorted(written) == ['one', 'two'] and after_flush == [1] and not read_lines(journal)
+          and [r['query'] for r in quarantined] == ['bad'] and quarantined[0]['attempts'] == 3)
+    print(f"{'✅' if ok else '❌'} Written: {sorted(written)}, attempts after first flush: {after_flush}, "
+          f"quarantined: {[(r['query'], r['attempts']) for r in quarantined]}")
+    return ok
+
+def test_outage_does_not_use_attempts():
+    """Records journaled while the database is unreachable keep their attempts and are written once it returns."""
+    print("\n--- Testing journaling during an outage ---")
+    journal = os.path.join(tempfile.mkdtemp(prefix='querylog-'), 'journal.jsonl')
+    written = []
+    up = {'value': False}
+    writer = make_writer(journal, lambda cursor, records: written.extend(r['query'] for r in records), lambda: up['value'])
+
+    writer._buffer = [record(f"q{i}") for i in range(10)]
+    for _ in range(5):
+        writer.flush()
+        writer._replay_journal()
+    journaled = read_lines(journal)
+    up['value'] = True
+    writer._replay_journal()
+
+    ok = (len(journaled) == 10 and all('attempts' not in r for r in journaled)
+          and sorted(written) == sorted(f"q{i}" for i in range(10)) and not read_lines(journal))
+    print(f"{'✅' if ok else '❌'} Journaled during outage: {len(journaled)}, written after recovery: {len(written)}")
+    return ok
+
+def test_concurrent_replay():
+    """Two writers replaying one journal while records are appended write every record exactly once."""
+    print("\n--- Testing concurrent replay of a shared journal ---")
+    journal = os.path.join(tempfile.mkdtemp(prefix='querylog-'), 'journal.jsonl')
+    written = []
+    lock = threading.Lock()
+
+    def sink(cursor, records):
+        with lock:
+            written.extend(r['query'] for r in records)
+
+    writers = [make_writer(journal, sink) for _ in range(2)]
+    writers[0]._journal([record(f"old{i}") for i in range(1000)])
+    appended = []
+
+    def appender():
+        for i in range(200):
+            writers[1]._journal([record(f"new{i}")])
+            appended.append(f"new{i}")
+
+    def replayer(writer):
+        for _ in range(20):
+            writer._replay_journal()
+
+    threads = [threading.Thread(target=appender)] + [threading.Thread(target=replayer, args=(w,)) for w in writers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writers[0]._replay_journal()
+
+    expected = sorted([f"old{i}" for i in range(1000)] + appended)
+    ok = sorted(written) == expected
+    print(f"{'✅' if ok else '❌'} {len(written)} records written for {len(expected)} journaled, "
+          f"{len(written) - len(set(written))} duplicates")
+    return ok
+
+if __name__ == "__main__":
+    print("Running query log tests...")
+
+    quarantine_success = test_rejected_record_is_quarantined()
+    outage_success = test_outage_does_not_use_attempts()
+    replay_success = test_concurrent_replay()
+
+    print("\n--- Test Summary ---")
+    print(f"Retry and quarantine: {'✅ Passed' if quarantine_success else '❌ Failed'}")
+    print(f"Outage journaling: {'✅ Passed' if outage_success else '❌ Failed'}")
+    print(f"Concurrent replay: {'✅ Passed' if replay_success else '❌ Failed'}")
+    sys.exit(0 if quarantine_success and outage_success and replay_success else 1)
@@ -0,0 +1,271 @@
+"""
+Opt-in per-request trace profiling.
+
+A request is traced when it is picked by TRACE_SAMPLE_RATE or carries an
+`X-Trace` header whose value is TRACE_TOKEN. Tracing and stack sampling cost the
+server real work, so the header is ignored unless TRACE_TOKEN is set and only
+honoured with the secret, which keeps clients from forcing it.
+
+A traced request records a tree of spans (DB queries with row counts, outbound
+HTTP calls with payload sizes, CPU time of chunking and serialization, and the
+phases of /api/chat) and appends it as one JSON line to TRACE_OUTPUT_PATH. Span
+fields follow OpenTelemetry naming (trace_id, span_id, parent_span_id,
+start/end unix nanos, attributes) so the file can be converted or loaded into
+OTel tooling.
+
+When TRACE_PROFILE_THRESHOLD_MS is set, traced requests are also stack-sampled
+and the collapsed stacks are attached to traces slower than the threshold.
+
+Untraced requests only pay for a context variable lookup per span.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from flask import g, request
+
+TRACE_HEADER = 'X-Trace'
+TRACE_ID_HEADER = 'X-Trace-Id'
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+TRACE_TOKEN = os.environ.get("TRACE_TOKEN", "")
+TRACE_OUTPUT_PATH = os.environ.get("TRACE_OUTPUT_PATH", "/tmp/backend-traces.jsonl")
+PROFILE_THRESHOLD_MS = float(os.environ.get("TRACE_PROFILE_THRESHOLD_MS", "0"))
+PROFILE_INTERVAL = float(os.environ.get("TRACE_PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_STACKS = 50
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_write_lock = threading.Lock()
+
+class Span:
+    """
+    One timed operation in a trace, with wall-clock and thread CPU time.
+    """
+
+    def __init__(self, trace_id, name, parent=None, attributes=None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.start_ns = time.time_ns()
+        self.cpu_start = time.thread_time()
+        self.end_ns = None
+        self.cpu_seconds = None
+        if parent is not None:
+            parent.children.append(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self.cpu_seconds = time.thread_time() - self.cpu_start
+
+    @property
+    def duration_ms(self):
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent.span_id if self.parent is not None else None,
+            'name': self.name,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': round(self.duration_ms, 3),
+            'cpu_ms': round(self.cpu_seconds * 1000, 3) if self.cpu_seconds is not None else None,
+            'attributes': self.attributes,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+class NoopSpan:
+    def set(self, **attributes):
+        pass
+
+NOOP_SPAN = NoopSpan()
+
+def current_span():
+    return _current_span.get()
+
+def is_active():
+    return _current_span.get() is not None
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Record a child span of the current span. Yields a no-op span when not tracing.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+
+    child = Span(parent.trace_id, name, parent, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.set(error=repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        child.finish()
+
+def record_requests_response(response, *args, **kwargs):
+    """
+    `requests` response hook adding a finished span for the outbound call.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return response
+
+    body = response.request.body
+    http_span = Span(parent.trace_id, f"http {response.request.method} {response.url.split('?')[0]}", parent, {
+        'http.status_code': response.status_code,
+        'http.request_bytes': len(body) if body is not None and not hasattr(body, 'read') else 0,
+        'http.response_bytes': len(response.content),
+    })
+    # The hook runs after the call returns, so backdate the span by the elapsed time
+    http_span.start_ns -= int(response.elapsed.total_seconds() * 1e9)
+    http_span.finish()
+    http_span.cpu_seconds = None
+    return response
+
+def httpx_request_hook(request):
+    parent = _current_span.get()
+    if parent is None:
+        return
+    request.extensions['trace_span'] = Span(parent.trace_id, f"http {request.method} {request.url.host}{request.url.path}", parent, {
+        'http.request_bytes': int(request.headers.get('content-length', 0)),
+    })
+
+def httpx_response_hook(response):
+    http_span = response.request.extensions.get('trace_span')
+    if http_span is None:
+        return
+    http_span.set(**{
+        'http.status_code': response.status_code,
+        'http.response_bytes': int(response.headers.get('content-length', 0)),
+    })
+    http_span.finish()
+    http_span.cpu_seconds = None
+
+HTTPX_EVENT_HOOKS = {'request': [httpx_request_hook], 'response': [httpx_response_hook]}
+
+class StackSampler(threading.Thread):
+    """
+    Sampling CPU profiler for a single thread, producing collapsed stack counts.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        top = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:PROFILE_MAX_STACKS]
+        return {
+            'interval_ms': self.interval * 1000,
+            'samples': self.samples,
+            'stacks': [{'stack': stack, 'count': count} for stack, count in top],
+        }
+
+def should_trace():
+    if TRACE_TOKEN and secrets.compare_digest(request.headers.get(TRACE_HEADER, '').encode(), TRACE_TOKEN.encode()):
+        return True
+    return TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+
+def start_trace():
+    if not should_trace():
+        return
+    root = Span(secrets.token_hex(16), f"{request.method} {request.path}", attributes={
+        'http.method': request.method,
+        'http.target': request.path,
+        'http.request_bytes': request.content_length or 0,
+    })
+    g.trace_root = root
+    g.trace_token = _current_span.set(root)
+    if PROFILE_THRESHOLD_MS > 0:
+        g.trace_sampler = StackSampler(threading.get_ident())
+        g.trace_sampler.start()
+
+def finish_trace(response):
+    root = g.pop('trace_root', None)
+    if root is None:
+        return response
+
+    root.set(**{
+        'http.route': request.url_rule.rule if request.url_rule is not None else None,
+        'http.status_code': response.status_code,
+        'http.response_bytes': response.calculate_content_length(),
+    })
+    root.finish()
+    _current_span.reset(g.pop('trace_token'))
+
+    record = root.to_dict()
+    sampler = g.pop('trace_sampler', None)
+    if sampler is not None:
+        profile = sampler.stop()
+        if root.duration_ms >= PROFILE_THRESHOLD_MS:
+            record['cpu_profile'] = profile
+
+    write_trace(record)
+    response.headers[TRACE_ID_HEADER] = root.trace_id
+    return response
+
+def discard_trace(exc=None):
+    # finish_trace does not run when a view raises, so make sure the context is reset
+    token = g.pop('trace_token', None)
+    if token is not None:
+        _current_span.reset(token)
+    sampler = g.pop('trace_sampler', None)
+    if sampler is not None:
+        sampler.stop()
+    g.pop('trace_root', None)
+
+def write_trace(record):
+    line = json.dumps(record, default=str)
+    with _write_lock:
+        with open(TRACE_OUTPUT_PATH, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+def init_app(app):
+    """
+    Register the hooks that start and flush request traces.
+
+    Call this before the other after_request hooks are registered so the root span
+    also covers them.
+    """
+    app.before_request(start_trace)
+    app.after_request(finish_trace)
+    app.teardown_request(discard_trace)
@@ -0,0 +1,118 @@
+"""
+Compact transfer of embedding vectors, from OpenAI to Postgres.
+
+Embeddings stay NumPy float32 arrays end to end instead of lists of Python floats:
+- OpenAI is asked for base64 (encoding_format="base64"); decode_base64() turns
+  each item into a float32 array without parsing 1536 decimal numbers.
+- register_adapter() lets psycopg2 take float32 arrays as query parameters. They
+  are written as a pgvector literal with 9 significant digits, enough to round
+  trip float32, instead of the ARRAY[...] of 17-digit doubles a list becomes.
+- copy_rows() bulk-loads rows with COPY ... (FORMAT binary), where a vector is
+  pgvector's binary representation, 4 bytes per dimension, and nothing is
+  formatted or parsed as text. psycopg2 only sends query parameters as text, so
+  COPY is how the binary format is reached.
+
+NumPy is imported on first use, so importing this module stays cheap.
+"""
+
+import io
+import base64
+import struct
+
+import psycopg2.extensions
+
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+def decode_base64(data):
+    """float32 array from an OpenAI base64 embedding, or from a list of floats."""
+    import numpy as np
+    register_adapter()
+    if isinstance(data, str):
+        return np.frombuffer(base64.b64decode(data), dtype='<f4')
+    return np.asarray(data, dtype=np.float32)
+
+def as_matrix(embeddings, dimension=None):
+    """(n, dimension) float32 array from a sequence of embeddings."""
+    import numpy as np
+    register_adapter()
+    if len(embeddings) == 0:
+        return np.empty((0, dimension or 0), dtype=np.float32)
+    return np.asarray(embeddings, dtype=np.float32)
+
+def to_text(vector):
+    """pgvector text literal of a vector, e.g. '[0.5,-1,0.25]'."""
+    import numpy as np
+    values = np.asarray(vector, dtype=np.float32).tolist()
+    return '[' + ','.join(['%.9g'] * len(values)) % tuple(values) + ']'
+
+class VectorAdapter:
+    def __init__(self, vector):
+        self.vector = vector
+
+    def getquoted(self):
+        return ("'" + to_text(self.vector) + "'").encode('ascii')
+
+_registered = False
+
+def register_adapter():
+    """
+    Adapt NumPy arrays passed as query parameters to pgvector literals. Called
+    by the helpers that create embedding arrays, so numpy need not be imported
+    just to register it.
+    """
+    global _registered
+    if _registered:
+        return
+    import numpy as np
+    psycopg2.extensions.register_adapter(np.ndarray, VectorAdapter)
+    _registered = True
+
+def _encode_text(value):
+    return value.encode('utf-8')
+
+def _encode_jsonb(value):
+    # jsonb binary format: a version byte, then the JSON text
+    return b'\x01' + value.encode('utf-8')
+
+def _encode_int4(value):
+    return struct.pack('>i', value)
+
+def _encode_vector(value):
+    import numpy as np
+    value = np.asarray(value, dtype='>f4')
+    return struct.pack('>hh', len(value), 0) + value.tobytes()
+
+ENCODERS = {
+    'text': _encode_text,
+    'jsonb': _encode_jsonb,
+    'int4': _encode_int4,
+    'vector': _encode_vector,
+}
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Load `rows` into `table` with one binary COPY. `columns` is a list of
+    (name, type) pairs, type being one of ENCODERS; None values are sent as NULL.
+    Returns the number of bytes sent.
+    """
+    encoders = [ENCODERS[kind] for _, kind in columns]
+    field_count = struct.pack('>h', len(columns))
+    null = struct.pack('>i', -1)
+    buffer = io.BytesIO()
+    buffer.write(COPY_SIGNATURE)
+    buffer.write(struct.pack('>ii', 0, 0))
+    for row in rows:
+        buffer.write(field_count)
+        for encode, value in zip(encoders, row):
+            if value is None:
+                buffer.write(null)
+                continue
+            data = encode(value)
+            buffer.write(struct.pack('>i', len(data)))
+            buffer.write(data)
+    buffer.write(struct.pack('>h', -1))
+    size = buffer.tell()
+    buffer.seek(0)
+    names = ', '.join(name for name, _ in columns)
+    cursor.copy_expert(f'COPY {table} ({names}) FROM STDIN WITH (FORMAT binary)', buffer)
+    return size
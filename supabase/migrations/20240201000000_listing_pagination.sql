@@ -0,0 +1,59 @@
+-- Indexes backing keyset pagination of the listing endpoints
+CREATE INDEX IF NOT EXISTS materials_course_id_created_at_idx
+  ON materials (course_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS courses_professor_id_created_at_idx
+  ON courses (professor_id, created_at DESC);
+
+CREATE INDEX IF NOT EXISTS student_queries_student_id_created_at_idx
+  ON student_queries (student_id, created_at DESC);
+
+-- The queries table is created by the backend setup endpoint, so it may not exist yet
+DO $$
+BEGIN
+  IF to_regclass('public.queries') IS NOT NULL THEN
+    CREATE INDEX IF NOT EXISTS queries_user_id_created_at_idx
+      ON queries (user_id, created_at DESC);
+  END IF;
+END;
+$$;
+
+-- Per-course change version used to build ETags for materials listings
+CREATE TABLE IF NOT EXISTS course_versions (
+  course_id UUID PRIMARY KEY REFERENCES courses(id) ON DELETE CASCADE,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION bump_course_version()
+RETURNS TRIGGER AS $$
+DECLARE
+  changed_course_id UUID;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    changed_course_id := OLD.course_id;
+  ELSE
+    changed_course_id := NEW.course_id;
+  END IF;
+
+  INSERT INTO course_versions (course_id, version, updated_at)
+  VALUES (changed_course_id, 1, NOW())
+  ON CONFLICT (course_id)
+  DO UPDATE SET version = course_versions.version + 1, updated_at = NOW();
+
+  -- A material moved between courses changes both listings
+  IF TG_OP = 'UPDATE' AND OLD.course_id IS DISTINCT FROM NEW.course_id THEN
+    INSERT INTO course_versions (course_id, version, updated_at)
+    VALUES (OLD.course_id, 1, NOW())
+    ON CONFLICT (course_id)
+    DO UPDATE SET version = course_versions.version + 1, updated_at = NOW();
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS materials_bump_course_version ON materials;
+CREATE TRIGGER materials_bump_course_version
+  AFTER INSERT OR UPDATE OR DELETE ON materials
+  FOR EACH ROW EXECUTE FUNCTION bump_course_version();
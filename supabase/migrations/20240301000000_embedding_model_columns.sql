@@ -0,0 +1,51 @@
+-- Record the embedding model and dimension of every row so vectors from
+-- different models are never compared with each other
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS embedding_model TEXT NOT NULL DEFAULT 'text-embedding-3-small';
+ALTER TABLE embeddings ADD COLUMN IF NOT EXISTS embedding_dim INTEGER NOT NULL DEFAULT 1536;
+
+-- Allow vectors of any dimension in the same column
+DROP INDEX IF EXISTS embeddings_embedding_idx;
+ALTER TABLE embeddings ALTER COLUMN embedding TYPE VECTOR;
+
+-- One partial expression index per model; queries cast to the model's dimension.
+-- HNSW replaces ivfflat because it needs no training and stays accurate under
+-- incremental inserts.
+CREATE INDEX IF NOT EXISTS embeddings_text_embedding_3_small_idx
+  ON embeddings USING hnsw ((embedding::vector(1536)) vector_cosine_ops)
+  WHERE embedding_model = 'text-embedding-3-small';
+
+DROP FUNCTION IF EXISTS match_documents(VECTOR, FLOAT, INT, TEXT);
+
+CREATE OR REPLACE FUNCTION match_documents(
+  query_embedding VECTOR,
+  match_threshold FLOAT,
+  match_count INT,
+  course_id TEXT,
+  model TEXT DEFAULT 'text-embedding-3-small'
+)
+RETURNS TABLE (
+  id TEXT,
+  content TEXT,
+  metadata JSONB,
+  similarity FLOAT
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  dim INT := vector_dims(query_embedding);
+BEGIN
+  RETURN QUERY EXECUTE format(
+    'SELECT e.id, e.content, e.metadata,
+            1 - (e.embedding::vector(%1$s) <=> $1::vector(%1$s)) AS similarity
+     FROM embeddings e
+     WHERE e.embedding_model = $4
+       AND e.embedding_dim = %1$s
+       AND ($3 = ''all'' OR e.metadata->>''courseId'' = $3)
+       AND 1 - (e.embedding::vector(%1$s) <=> $1::vector(%1$s)) > $2
+     ORDER BY e.embedding::vector(%1$s) <=> $1::vector(%1$s)
+     LIMIT $5',
+    dim
+  )
+  USING query_embedding, match_threshold, course_id, model, match_count;
+END;
+$$;
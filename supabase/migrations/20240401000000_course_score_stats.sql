@@ -0,0 +1,41 @@
+-- Per-course similarity statistics, maintained by the backend at ingestion time
+-- and used to pick match_documents' threshold and count for each course
+CREATE TABLE IF NOT EXISTS course_score_stats (
+  course_id TEXT NOT NULL,
+  embedding_model TEXT NOT NULL,
+  chunk_count BIGINT NOT NULL DEFAULT 0,
+  vector_sum FLOAT8[] NOT NULL,
+  background_similarity FLOAT8,
+  match_threshold FLOAT8 NOT NULL,
+  match_count INTEGER NOT NULL,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (course_id, embedding_model)
+);
+
+-- Backfill existing courses with the backend's default policy: below 20 chunks
+-- keep 0.5 / 5, otherwise 0.2 above the mean pairwise similarity (clamped to
+-- 0.25-0.75) and 3 + round(log2(1 + n / 100)) results, at most 8
+WITH sums AS (
+  SELECT metadata->>'courseId' AS course_id,
+         count(*) AS n,
+         sum(embedding::vector(1536)) AS total
+  FROM embeddings
+  WHERE embedding_model = 'text-embedding-3-small'
+    AND metadata->>'courseId' IS NOT NULL
+  GROUP BY 1
+), stats AS (
+  SELECT course_id, n, total::real[]::float8[] AS vector_sum,
+         CASE WHEN n > 1 THEN ((total <#> total) * -1 - n) / (n * (n - 1)) END AS background
+  FROM sums
+)
+INSERT INTO course_score_stats
+  (course_id, embedding_model, chunk_count, vector_sum, background_similarity, match_threshold, match_count)
+SELECT course_id,
+       'text-embedding-3-small',
+       n,
+       vector_sum,
+       background,
+       CASE WHEN n < 20 THEN 0.5 ELSE LEAST(0.75, GREATEST(0.25, background + 0.2)) END,
+       CASE WHEN n < 20 THEN 5 ELSE LEAST(8, 3 + round(log(2, 1 + n / 100.0))::INT) END
+FROM stats
+ON CONFLICT (course_id, embedding_model) DO NOTHING;
@@ -0,0 +1,30 @@
+-- Rollups maintained by the backend as chat queries are logged, read by
+-- GET /api/courses/<id>/analytics
+
+-- Online k-means topics of the questions asked in each course
+CREATE TABLE IF NOT EXISTS course_query_topics (
+  course_id TEXT NOT NULL,
+  topic_id INTEGER NOT NULL,
+  label TEXT NOT NULL,
+  centroid FLOAT8[] NOT NULL,
+  query_count BIGINT NOT NULL DEFAULT 0,
+  last_asked_at TIMESTAMP,
+  PRIMARY KEY (course_id, topic_id)
+);
+
+-- Query volume per course and day
+CREATE TABLE IF NOT EXISTS course_query_daily (
+  course_id TEXT NOT NULL,
+  day DATE NOT NULL,
+  query_count BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (course_id, day)
+);
+
+-- How often each material was cited in an answer's context
+CREATE TABLE IF NOT EXISTS course_material_citations (
+  course_id TEXT NOT NULL,
+  material_id TEXT NOT NULL,
+  citation_count BIGINT NOT NULL DEFAULT 0,
+  last_cited_at TIMESTAMP,
+  PRIMARY KEY (course_id, material_id)
+);
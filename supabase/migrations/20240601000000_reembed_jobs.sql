@@ -0,0 +1,32 @@
+-- Allow one row per chunk and embedding model, so a re-embedding job can publish
+-- new vectors next to the old ones and the app can switch models without a gap
+ALTER TABLE embeddings DROP CONSTRAINT IF EXISTS embeddings_pkey;
+ALTER TABLE embeddings ADD PRIMARY KEY (id, embedding_model);
+
+-- Re-embedding jobs with their checkpoint and progress
+CREATE TABLE IF NOT EXISTS reembed_jobs (
+  id TEXT PRIMARY KEY,
+  course_id TEXT,
+  source_model TEXT NOT NULL,
+  target_provider TEXT NOT NULL,
+  target_model TEXT NOT NULL,
+  target_dim INTEGER NOT NULL,
+  status TEXT NOT NULL DEFAULT 'running',
+  checkpoint_id TEXT,
+  rows_done BIGINT NOT NULL DEFAULT 0,
+  rows_total BIGINT,
+  rows_per_sec FLOAT8,
+  eta_seconds FLOAT8,
+  error TEXT,
+  started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  finished_at TIMESTAMP
+);
+
+-- Shadow vectors written by running jobs, published into embeddings at the end
+CREATE TABLE IF NOT EXISTS embeddings_reembed (
+  job_id TEXT NOT NULL,
+  id TEXT NOT NULL,
+  embedding VECTOR NOT NULL,
+  PRIMARY KEY (job_id, id)
+);
@@ -0,0 +1,27 @@
+-- Server-side conversation store for multi-turn chat (POST /api/chat/sessions)
+
+-- One row per conversation; summary covers the first summarized_turns turns
+CREATE TABLE IF NOT EXISTS chat_sessions (
+  id TEXT PRIMARY KEY,
+  course_id TEXT NOT NULL,
+  user_id TEXT,
+  summary TEXT,
+  summarized_turns INTEGER NOT NULL DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Each question and answer, with the context it was answered from
+CREATE TABLE IF NOT EXISTS chat_turns (
+  session_id TEXT NOT NULL REFERENCES chat_sessions(id) ON DELETE CASCADE,
+  turn_index INTEGER NOT NULL,
+  query TEXT NOT NULL,
+  answer TEXT NOT NULL,
+  query_embedding FLOAT8[],
+  context JSONB,
+  context_reused BOOLEAN NOT NULL DEFAULT FALSE,
+  prompt_tokens INTEGER,
+  prompt_tokens_saved INTEGER,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (session_id, turn_index)
+);
@@ -0,0 +1,3 @@
+-- Lookup indexes used to delete all chunks of a material in batches
+CREATE INDEX IF NOT EXISTS embeddings_material_id_idx ON embeddings ((metadata->>'materialId'));
+CREATE INDEX IF NOT EXISTS embeddings_file_id_idx ON embeddings ((metadata->>'fileId'));
@@ -0,0 +1,36 @@
+-- Material and section centroids for hierarchical search. Section -1 is the
+-- whole material; sections 0.. group 16 consecutive chunks and list their ids.
+CREATE TABLE IF NOT EXISTS material_summaries (
+  source_id TEXT NOT NULL,
+  embedding_model TEXT NOT NULL,
+  section INTEGER NOT NULL,
+  course_id TEXT,
+  embedding_dim INTEGER NOT NULL,
+  centroid VECTOR NOT NULL,
+  chunk_ids TEXT[] NOT NULL DEFAULT '{}',
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (source_id, embedding_model, section)
+);
+
+CREATE INDEX IF NOT EXISTS material_summaries_course_idx
+  ON material_summaries (course_id, embedding_model) WHERE section = -1;
+
+-- Backfill existing materials, keyed by material id or storage path
+WITH chunks AS (
+  SELECT id, embedding, embedding_model, embedding_dim,
+         coalesce(metadata->>'materialId', metadata->>'fileId') AS source_id,
+         metadata->>'courseId' AS course_id,
+         coalesce((metadata->>'chunkIndex')::int, 0) AS chunk_index
+  FROM embeddings
+  WHERE embedding IS NOT NULL
+)
+INSERT INTO material_summaries (source_id, embedding_model, section, course_id, embedding_dim, centroid, chunk_ids)
+SELECT source_id, embedding_model, -1, min(course_id), min(embedding_dim), avg(embedding), '{}'
+FROM chunks WHERE source_id IS NOT NULL
+GROUP BY source_id, embedding_model
+UNION ALL
+SELECT source_id, embedding_model, chunk_index / 16, min(course_id), min(embedding_dim),
+       avg(embedding), array_agg(id ORDER BY chunk_index)
+FROM chunks WHERE source_id IS NOT NULL
+GROUP BY source_id, embedding_model, chunk_index / 16
+ON CONFLICT (source_id, embedding_model, section) DO NOTHING;
@@ -0,0 +1,17 @@
+-- Canonical answers to each course's most frequent chat questions, built by
+-- backend/faq.py and served while course_version matches course_versions
+CREATE TABLE IF NOT EXISTS course_faq (
+  course_id TEXT NOT NULL,
+  entry_id INTEGER NOT NULL,
+  question TEXT NOT NULL,
+  variants TEXT[] NOT NULL DEFAULT '{}',
+  answer TEXT NOT NULL,
+  sources JSONB NOT NULL DEFAULT '[]',
+  material_ids TEXT[] NOT NULL DEFAULT '{}',
+  embedding_model TEXT NOT NULL,
+  centroid FLOAT8[] NOT NULL,
+  query_count BIGINT NOT NULL DEFAULT 0,
+  course_version BIGINT NOT NULL DEFAULT 0,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (course_id, entry_id)
+);
@@ -0,0 +1,17 @@
+-- Content hashes for upload dedup (backend/dedup.py): the storage object first
+-- uploaded with each content to each folder, and the content each material was
+-- built from
+CREATE TABLE IF NOT EXISTS content_objects (
+  folder TEXT NOT NULL,
+  sha256 TEXT NOT NULL,
+  storage_path TEXT NOT NULL,
+  file_size BIGINT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (folder, sha256)
+);
+
+CREATE INDEX IF NOT EXISTS content_objects_storage_path_idx ON content_objects (storage_path);
+
+ALTER TABLE materials ADD COLUMN IF NOT EXISTS content_sha256 TEXT;
+
+CREATE INDEX IF NOT EXISTS materials_content_sha256_idx ON materials (content_sha256) WHERE content_sha256 IS NOT NULL;